@@ -0,0 +1,165 @@
+import functools
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pika
+import yaml
+
+
+class ConcurrentServiceBus:
+    """
+    Rabbit MQ RPC responder which handles up to n_workers requests at once.
+    Broker delivers up to prefetch_count unacknowledged messages, they are handled by the pool of workers.
+    pika connection is not thread-safe, so replies and acks are scheduled to the connection thread
+    with add_callback_threadsafe and are never sent from the workers themselves.
+    Callback may return a Future of the response body instead of the body. Then the worker is free as soon as
+    the callback returns, and the reply is scheduled when the Future is done, so prefetch_count may be much
+    larger than n_workers.
+    """
+    def __init__(self, host: str, port: int, user: str, password: str, exchange_name: str = 'easy_net_q_rpc',
+                 prefetch_count: int = 1, n_workers: int = 1, connection_factory=None):
+        self.__user = user
+        self.__password = password
+        self.__host = host
+        self.__port = port
+        self.__exchange_name = exchange_name
+        self.__prefetch_count = prefetch_count
+        self.__n_workers = n_workers
+        # Creates a connection with pika.BlockingConnection interface. Broker stand-in is passed here by tests
+        self.__connection_factory = connection_factory or self.__connect
+        self.__connection = None
+        self.__channel = None
+        self.__response_callback = None
+        self.__pass_properties = False
+        self.__response_queue_name = None
+        # Count of messages which are not acknowledged yet. Changed in the connection thread only
+        self.__n_in_flight = 0
+        self.__stopped = threading.Event()
+        self.logger = logging.getLogger()
+
+    @classmethod
+    def from_config_file(cls, config_file_path: str, **kwargs) -> 'ConcurrentServiceBus':
+        with open(config_file_path, 'r') as inf:
+            config = yaml.safe_load(inf)
+
+        n_workers = config.get('amqp_workers', 1)
+        return cls(host=config['amqp_host'], port=config['port'], user=config['user_name'],
+                   password=config['password'], exchange_name=config.get('exchange_name', 'easy_net_q_rpc'),
+                   prefetch_count=config.get('amqp_prefetch_count', n_workers), n_workers=n_workers, **kwargs)
+
+    def __connect(self):
+        credentials = pika.PlainCredentials(self.__user, self.__password)
+        parameters = pika.ConnectionParameters(host=self.__host, port=self.__port, credentials=credentials)
+        return pika.BlockingConnection(parameters)
+
+    def __on_request_handler(self, pool, connection, ch, method, props, body):
+        # Runs in the connection thread, so it has to return immediately
+        self.__n_in_flight += 1
+        pool.submit(self.__handle_request, connection, ch, method, props, body)
+
+    def __handle_request(self, connection, ch, method, props, body):
+        try:
+            if self.__pass_properties:
+                response_body = self.__response_callback(body, props)
+            else:
+                response_body = self.__response_callback(body)
+        except Exception as e:
+            self.logger.exception(f'Failed to handle request {props.correlation_id}')
+            self.__schedule(connection, functools.partial(self.__reject, ch, method.delivery_tag, props, e))
+            return
+        if isinstance(response_body, Future):
+            # Request is handled elsewhere, the worker takes the next message meanwhile
+            response_body.add_done_callback(functools.partial(self.__on_response_done, connection, ch, method, props))
+            return
+        self.__schedule(connection, functools.partial(self.__reply, ch, method.delivery_tag, props, response_body))
+
+    def __on_response_done(self, connection, ch, method, props, future):
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f'Failed to handle request {props.correlation_id}', exc_info=error)
+            self.__schedule(connection, functools.partial(self.__reject, ch, method.delivery_tag, props, error))
+            return
+        self.__schedule(connection, functools.partial(self.__reply, ch, method.delivery_tag, props, future.result()))
+
+    def __schedule(self, connection, callback):
+        try:
+            connection.add_callback_threadsafe(callback)
+        except Exception as e:
+            # Connection is already closed. Message is not acknowledged, so broker delivers it again
+            self.logger.warning(f'Reply is dropped, connection is lost: {e}')
+
+    def __reply(self, ch, delivery_tag, props, response_body):
+        self.__n_in_flight -= 1
+        if not ch.is_open:
+            return
+        ch.basic_publish(exchange='', routing_key=props.reply_to,
+                         properties=pika.BasicProperties(correlation_id=props.correlation_id,
+                                                         type=self.__response_queue_name), body=response_body)
+        ch.basic_ack(delivery_tag=delivery_tag)
+
+    def __reject(self, ch, delivery_tag, props, error):
+        self.__n_in_flight -= 1
+        if not ch.is_open:
+            return
+        if props.reply_to:
+            # Caller gets the error at once instead of waiting for its own timeout.
+            # EasyNetQ client raises faulted reply as EasyNetQResponderException with ExceptionMessage
+            headers = {'IsFaulted': True, 'ExceptionMessage': f'{type(error).__name__}: {error}'}
+            ch.basic_publish(exchange='', routing_key=props.reply_to,
+                             properties=pika.BasicProperties(correlation_id=props.correlation_id,
+                                                             type=self.__response_queue_name, headers=headers),
+                             body=b'{}')
+        # Failed request is not requeued, otherwise it would be redelivered to the service forever
+        ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+
+    def respond(self, request_queue_name: str, response_queue_name: str, request_handler_callback,
+                pass_properties: bool = False):
+        """
+        Replies to every request with request_handler_callback(body), or with request_handler_callback(body, props)
+        if pass_properties is set, e.g. to read the timestamp of the message. Callback returns the response body
+        or its Future
+        """
+        self.__response_queue_name = response_queue_name
+        self.__response_callback = request_handler_callback
+        self.__pass_properties = pass_properties
+
+        with ThreadPoolExecutor(max_workers=self.__n_workers, thread_name_prefix='amqp-worker') as pool:
+            while not self.__stopped.is_set():
+                try:
+                    connection = self.__connection_factory()
+                    channel = connection.channel()
+                    channel.basic_qos(prefetch_count=self.__prefetch_count)
+                    channel.queue_declare(queue=request_queue_name, durable=True, exclusive=False, auto_delete=False)
+                    channel.queue_bind(queue=request_queue_name, exchange=self.__exchange_name,
+                                       routing_key=request_queue_name)
+                    channel.basic_consume(queue=request_queue_name,
+                                          on_message_callback=functools.partial(self.__on_request_handler, pool,
+                                                                                connection))
+                    self.__n_in_flight = 0
+                    self.__connection = connection
+                    self.__channel = channel
+                    if self.__stopped.is_set():
+                        connection.close()
+                        break
+
+                    try:
+                        channel.start_consuming()
+                    except KeyboardInterrupt:
+                        self.__stopped.set()
+                        channel.stop_consuming()
+                    if self.__stopped.is_set():
+                        # Let the workers finish and send replies for the messages which are already taken
+                        while self.__n_in_flight > 0:
+                            connection.process_data_events(time_limit=0.1)
+                        connection.close()
+                except Exception as e:
+                    self.logger.error(e)
+                    continue
+
+    def stop(self):
+        """Stops consuming, respond() returns when the requests that are being handled are finished"""
+        self.__stopped.set()
+        if self.__connection is not None:
+            self.__schedule(self.__connection, self.__channel.stop_consuming)
@@ -0,0 +1,219 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+from amqp_consumer import ConcurrentServiceBus
+
+
+class InMemoryChannel:
+    """Stand-in of pika BlockingChannel which delivers messages of a list and records replies"""
+
+    def __init__(self, connection, messages):
+        self.connection = connection
+        self.messages = list(messages)
+        self.is_open = True
+        self.prefetch_count = None
+        self.on_message_callback = None
+        self.consuming = False
+        self.n_unacked = 0
+        self.published = []
+        # Headers of published replies by correlation id
+        self.headers = {}
+        self.acked = []
+        self.nacked = []
+
+    def basic_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    def queue_declare(self, **kwargs):
+        pass
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        self.on_message_callback = on_message_callback
+
+    def basic_publish(self, exchange, routing_key, properties, body):
+        self.connection.assert_connection_thread()
+        self.published.append((routing_key, properties.correlation_id, body))
+        self.headers[properties.correlation_id] = properties.headers
+
+    def basic_ack(self, delivery_tag):
+        self.connection.assert_connection_thread()
+        self.n_unacked -= 1
+        self.acked.append(delivery_tag)
+
+    def basic_nack(self, delivery_tag, requeue):
+        self.connection.assert_connection_thread()
+        self.n_unacked -= 1
+        self.nacked.append((delivery_tag, requeue))
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming:
+            while self.messages and self.n_unacked < self.prefetch_count:
+                delivery_tag, body = self.messages.pop(0)
+                self.n_unacked += 1
+                props = SimpleNamespace(reply_to='replies', correlation_id=f'correlation-{delivery_tag}')
+                self.on_message_callback(self, SimpleNamespace(delivery_tag=delivery_tag), props, body)
+            self.connection.process_data_events(time_limit=0.01)
+
+    def stop_consuming(self):
+        self.consuming = False
+
+
+class InMemoryConnection:
+    """Stand-in of pika BlockingConnection, callbacks are run in the thread which consumes messages"""
+
+    def __init__(self, messages):
+        self.callbacks = queue.Queue()
+        self.thread = None
+        self.is_closed = False
+        self.messages = messages
+        self.channels = []
+
+    def assert_connection_thread(self):
+        assert threading.current_thread() is self.thread
+
+    def channel(self):
+        self.thread = threading.current_thread()
+        self.channels.append(InMemoryChannel(self, self.messages))
+        return self.channels[-1]
+
+    def add_callback_threadsafe(self, callback):
+        if self.is_closed:
+            raise RuntimeError('Connection is closed')
+        self.callbacks.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        try:
+            callback = self.callbacks.get(timeout=time_limit)
+        except queue.Empty:
+            return
+        callback()
+
+    def close(self):
+        self.is_closed = True
+
+
+def run_service_bus(messages, request_handler, n_workers, prefetch_count, pass_properties=False):
+    connection = InMemoryConnection(messages)
+    service_bus = ConcurrentServiceBus('localhost', 5672, 'guest', 'guest', prefetch_count=prefetch_count,
+                                       n_workers=n_workers, connection_factory=lambda: connection)
+    thread = threading.Thread(target=service_bus.respond,
+                              args=('requests', 'responses', request_handler, pass_properties))
+    thread.start()
+    return service_bus, connection, thread
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_concurrent_service_bus_handles_messages_in_parallel():
+    n_messages = 8
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def request_handler(body):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+        return body.upper()
+
+    messages = [(i, f'body-{i}'.encode()) for i in range(n_messages)]
+    start_time = time.time()
+    service_bus, connection, thread = run_service_bus(messages, request_handler, n_workers=4, prefetch_count=4)
+    wait_for(lambda: connection.channels and len(connection.channels[0].acked) == n_messages)
+    elapsed = time.time() - start_time
+    service_bus.stop()
+    thread.join(timeout=10)
+
+    channel = connection.channels[0]
+    assert not thread.is_alive()
+    assert connection.is_closed
+    assert channel.prefetch_count == 4
+    assert max_running[0] == 4
+    # 8 messages of 0.2s each are handled by 4 workers in two waves
+    assert elapsed < 0.8
+    assert sorted(channel.acked) == list(range(n_messages))
+    assert sorted(channel.published) == sorted(('replies', f'correlation-{i}', f'BODY-{i}'.encode())
+                                               for i in range(n_messages))
+
+
+def test_concurrent_service_bus_rejects_failed_message():
+    def request_handler(body):
+        if body == b'bad':
+            raise ValueError('Bad request')
+        return body
+
+    messages = [(0, b'good'), (1, b'bad'), (2, b'good')]
+    service_bus, connection, thread = run_service_bus(messages, request_handler, n_workers=2, prefetch_count=2)
+    wait_for(lambda: connection.channels and
+             len(connection.channels[0].acked) + len(connection.channels[0].nacked) == len(messages))
+    service_bus.stop()
+    thread.join(timeout=10)
+
+    channel = connection.channels[0]
+    assert sorted(channel.acked) == [0, 2]
+    assert channel.nacked == [(1, False)]
+    # Caller of the failed request gets a faulted reply
+    assert sorted(channel.published) == [('replies', 'correlation-0', b'good'), ('replies', 'correlation-1', b'{}'),
+                                         ('replies', 'correlation-2', b'good')]
+    assert channel.headers['correlation-1'] == {'IsFaulted': True, 'ExceptionMessage': 'ValueError: Bad request'}
+    assert channel.headers['correlation-0'] is None
+
+
+def test_concurrent_service_bus_passes_message_properties():
+    def request_handler(body, props):
+        return props.correlation_id.encode()
+
+    service_bus, connection, thread = run_service_bus([(0, b'body')], request_handler, n_workers=1,
+                                                      prefetch_count=1, pass_properties=True)
+    wait_for(lambda: connection.channels and len(connection.channels[0].acked) == 1)
+    service_bus.stop()
+    thread.join(timeout=10)
+
+    assert connection.channels[0].published == [('replies', 'correlation-0', b'correlation-0')]
+
+
+def test_concurrent_service_bus_replies_when_returned_future_is_done():
+    futures = {}
+
+    def request_handler(body):
+        futures[body] = Future()
+        return futures[body]
+
+    messages = [(i, f'body-{i}'.encode()) for i in range(4)]
+    # Single worker takes every prefetched message while none of them is done
+    service_bus, connection, thread = run_service_bus(messages, request_handler, n_workers=1, prefetch_count=4)
+    wait_for(lambda: len(futures) == 4)
+    channel = connection.channels[0]
+    assert channel.acked == []
+
+    futures[b'body-3'].set_result(b'BODY-3')
+    futures[b'body-1'].set_exception(ValueError('Bad request'))
+    wait_for(lambda: len(channel.acked) + len(channel.nacked) == 2)
+    futures[b'body-0'].set_result(b'BODY-0')
+    futures[b'body-2'].set_result(b'BODY-2')
+    wait_for(lambda: len(channel.acked) + len(channel.nacked) == 4)
+    service_bus.stop()
+    thread.join(timeout=10)
+
+    assert channel.acked[0] == 3
+    assert sorted(channel.acked) == [0, 2, 3]
+    assert channel.nacked == [(1, False)]
+    replies = [('replies', f'correlation-{i}', f'BODY-{i}'.encode()) for i in [0, 2, 3]]
+    assert sorted(channel.published) == sorted(replies + [('replies', 'correlation-1', b'{}')])
+    assert channel.headers['correlation-1']['IsFaulted']
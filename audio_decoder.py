@@ -0,0 +1,233 @@
+import re
+import subprocess
+import threading
+
+import numpy as np
+
+
+SAMPLE_FORMATS = {
+    'f32le': np.float32,
+    's16le': np.int16
+}
+# Audio is decoded by blocks of this duration when read_all() checks a deadline
+READ_BLOCK_SECONDS = 10
+
+
+class AudioDecoder:
+    """
+    Decodes MP3/M4A/WAV or any other format known to ffmpeg with a single ffmpeg process.
+    Source is a file path, bytes, a file-like object or an iterable of byte chunks.
+    Raw PCM is read from ffmpeg stdout into NumPy buffers, no intermediate files are written.
+    If sample_rate is None the source sample rate is kept.
+    If start_seconds is set decoding starts from this position, samples before it are not decoded.
+    If duration_seconds is set decoding stops after this duration of audio.
+    """
+    def __init__(self, source, sample_rate=None, channels=1, sample_format='f32le', pipe_chunk_size=1 << 16,
+                 start_seconds=0, duration_seconds=None):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f'Unsupported sample format: {sample_format}')
+
+        self.__dtype = np.dtype(SAMPLE_FORMATS[sample_format])
+        self.__channels = channels
+        self.__requested_sample_rate = sample_rate
+        self.__pipe_chunk_size = pipe_chunk_size
+        self.__start_seconds = start_seconds
+        self.__max_duration_seconds = duration_seconds
+        self.__source_sample_rate = None
+        self.__duration_seconds = None
+        self.__header_parsed = threading.Event()
+        self.__stderr_lines = []
+        self.__feed_error = None
+        self.__finished = False
+
+        read_from_stdin = not isinstance(source, str)
+        cmd = ['ffmpeg', '-hide_banner', '-nostats']
+        if not read_from_stdin:
+            cmd.append('-nostdin')
+        if start_seconds > 0:
+            # Input seeking jumps close to the position and then decodes and drops samples up to it exactly
+            cmd += ['-ss', f'{start_seconds:.6f}']
+        if duration_seconds is not None:
+            cmd += ['-t', f'{duration_seconds:.6f}']
+        cmd += ['-i', 'pipe:0' if read_from_stdin else source,
+                '-vn',
+                '-f', sample_format,
+                '-acodec', f'pcm_{sample_format}',
+                '-ac', str(channels)]
+        if sample_rate is not None:
+            cmd += ['-ar', str(sample_rate)]
+        cmd.append('pipe:1')
+
+        self.__process = subprocess.Popen(cmd, stdin=subprocess.PIPE if read_from_stdin else subprocess.DEVNULL,
+                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # stderr has to be drained all the time, otherwise ffmpeg blocks when the pipe buffer is full
+        self.__stderr_thread = threading.Thread(target=self.__read_stderr, daemon=True)
+        self.__stderr_thread.start()
+
+        self.__feed_thread = None
+        if read_from_stdin:
+            self.__feed_thread = threading.Thread(target=self.__feed, args=(source,), daemon=True)
+            self.__feed_thread.start()
+
+    def __feed(self, source):
+        stdin = self.__process.stdin
+        try:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                stdin.write(source)
+            elif hasattr(source, 'read'):
+                while True:
+                    chunk = source.read(self.__pipe_chunk_size)
+                    if not chunk:
+                        break
+                    stdin.write(chunk)
+            else:
+                for chunk in source:
+                    stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg stopped reading: decoder was closed or input is broken, error is reported by ffmpeg itself
+            pass
+        except Exception as e:
+            self.__feed_error = e
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def __read_stderr(self):
+        in_input_section = False
+        for line in iter(self.__process.stderr.readline, b''):
+            line = line.decode('utf-8', errors='replace').rstrip()
+            self.__stderr_lines.append(line)
+            if len(self.__stderr_lines) > 100:
+                del self.__stderr_lines[0]
+
+            if line.startswith('Input #'):
+                in_input_section = True
+            elif line.startswith('Output #') or line.startswith('Stream mapping'):
+                in_input_section = False
+                self.__header_parsed.set()
+            elif in_input_section:
+                # example of line is:  Duration: 00:29:07.04, start: 0.000000, bitrate: 128 kb/s
+                duration_match = re.search(r'Duration: (\d+):(\d+):(\d+(\.\d+)?)', line)
+                if duration_match and self.__duration_seconds is None:
+                    hours, minutes, seconds = duration_match.group(1, 2, 3)
+                    self.__duration_seconds = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+                # example of line is:  Stream #0:0: Audio: mp3, 44100 Hz, stereo, fltp, 128 kb/s
+                rate_match = re.search(r'Audio: .*?(\d+) Hz', line)
+                if rate_match and self.__source_sample_rate is None:
+                    self.__source_sample_rate = int(rate_match.group(1))
+        self.__header_parsed.set()
+
+    @property
+    def source_sample_rate(self):
+        self.__header_parsed.wait()
+        return self.__source_sample_rate
+
+    @property
+    def sample_rate(self):
+        if self.__requested_sample_rate is not None:
+            return self.__requested_sample_rate
+        return self.source_sample_rate
+
+    @property
+    def duration_seconds(self):
+        """
+        Duration reported in the container header. It is an estimate and is unknown for some streams
+        """
+        self.__header_parsed.wait()
+        return self.__duration_seconds
+
+    @property
+    def channels(self):
+        return self.__channels
+
+    def __get_shape(self, n_samples):
+        return (n_samples,) if self.__channels == 1 else (n_samples, self.__channels)
+
+    def read_into(self, buffer) -> int:
+        """
+        Fills the preallocated buffer with decoded samples.
+        Returns count of samples (per channel) read, which is less than the buffer size only at the end of stream
+        """
+        if self.__finished:
+            return 0
+        frame_size = self.__dtype.itemsize * self.__channels
+        buffer_bytes = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(buffer_bytes):
+            n_read = self.__process.stdout.readinto(buffer_bytes[filled:])
+            if not n_read:
+                break
+            filled += n_read
+        if filled < len(buffer_bytes):
+            self.__finish()
+        return filled // frame_size
+
+    def chunks(self, n_samples):
+        """
+        Yields chunks of n_samples samples (the last one may be shorter).
+        Chunks are views of one preallocated buffer and are valid until the next chunk is requested
+        """
+        buffer = np.empty(self.__get_shape(n_samples), dtype=self.__dtype)
+        while True:
+            n_read = self.read_into(buffer)
+            if n_read > 0:
+                yield buffer[0:n_read]
+            if n_read < n_samples:
+                break
+
+    def read_all(self, deadline=None):
+        """
+        Decodes the whole source. Buffer is preallocated by the duration from the header when it is known.
+        If deadline is set it is checked between blocks of READ_BLOCK_SECONDS, DeadlineExceeded is raised when it
+        has passed
+        """
+        n_allocate = 1 << 20
+        if self.duration_seconds:
+            duration_seconds = max(0, self.duration_seconds - self.__start_seconds)
+            if self.__max_duration_seconds is not None:
+                duration_seconds = min(duration_seconds, self.__max_duration_seconds)
+            n_allocate = int(duration_seconds * self.sample_rate) + self.sample_rate
+        res = np.empty(self.__get_shape(n_allocate), dtype=self.__dtype)
+        n_block = int(READ_BLOCK_SECONDS * self.sample_rate) if deadline is not None else n_allocate
+        n_total = 0
+        while True:
+            if deadline is not None:
+                deadline.check('decoding of the rest of the audio')
+            if n_total == res.shape[0]:
+                # Estimation was too small, continue into a bigger buffer
+                res = np.concatenate([res, np.empty(self.__get_shape(res.shape[0]), dtype=self.__dtype)])
+            n_wanted = min(res.shape[0] - n_total, n_block)
+            n_read = self.read_into(res[n_total:n_total + n_wanted])
+            n_total += n_read
+            if n_read < n_wanted:
+                break
+        return res[0:n_total]
+
+    def __finish(self):
+        self.__finished = True
+        self.__process.stdout.close()
+        return_code = self.__process.wait()
+        self.__stderr_thread.join()
+        if self.__feed_thread is not None:
+            self.__feed_thread.join()
+        if self.__feed_error is not None:
+            raise self.__feed_error
+        if return_code != 0:
+            error = '\n'.join(self.__stderr_lines[-10:])
+            raise RuntimeError(f'ffmpeg failed with code {return_code}: {error}')
+
+    def close(self):
+        if self.__process.poll() is None:
+            self.__process.kill()
+        self.__process.wait()
+        self.__process.stdout.close()
+        self.__header_parsed.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,85 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from audio_decoder import AudioDecoder
+
+
+SAMPLE_RATE = 22050
+
+
+def get_wav_bytes(samples, channels=1):
+    res = io.BytesIO()
+    with wave.open(res, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.astype(np.int16).tobytes())
+    return res.getvalue()
+
+
+@pytest.fixture
+def samples():
+    return (np.random.RandomState(0).uniform(-1, 1, 2 * SAMPLE_RATE + 7) * 32767).astype(np.int16)
+
+
+@pytest.fixture
+def wav_path(tmp_path, samples):
+    path = tmp_path / 'audio.wav'
+    path.write_bytes(get_wav_bytes(samples))
+    return str(path)
+
+
+def test_path_is_decoded_at_source_rate(wav_path, samples):
+    with AudioDecoder(wav_path, sample_format='s16le') as decoder:
+        assert decoder.sample_rate == SAMPLE_RATE
+        assert decoder.duration_seconds == pytest.approx(samples.shape[0] / SAMPLE_RATE, abs=0.01)
+        assert np.array_equal(decoder.read_all(), samples)
+
+
+def test_bytes_file_object_and_chunks_give_the_same_samples(wav_path, samples):
+    data = get_wav_bytes(samples)
+    with AudioDecoder(wav_path) as decoder:
+        expected = decoder.read_all()
+    assert np.allclose(expected, samples / 32768)
+    sources = [data, io.BytesIO(data), (data[i:i + 1000] for i in range(0, len(data), 1000))]
+    for source in sources:
+        with AudioDecoder(source, pipe_chunk_size=1000) as decoder:
+            assert np.array_equal(decoder.read_all(), expected)
+
+
+def test_chunks_give_the_same_samples_as_read_all(wav_path):
+    with AudioDecoder(wav_path) as decoder:
+        expected = decoder.read_all()
+    with AudioDecoder(wav_path) as decoder:
+        chunks = [chunk.copy() for chunk in decoder.chunks(4096)]
+    assert all(chunk.shape[0] == 4096 for chunk in chunks[:-1])
+    assert np.array_equal(np.concatenate(chunks), expected)
+
+
+def test_stereo_is_down_mixed_and_resampled(tmp_path, samples):
+    path = tmp_path / 'stereo.wav'
+    path.write_bytes(get_wav_bytes(np.repeat(samples, 2), channels=2))
+    with AudioDecoder(str(path), sample_rate=8000) as decoder:
+        res = decoder.read_all()
+    assert decoder.sample_rate == 8000
+    assert res.ndim == 1
+    assert abs(res.shape[0] - samples.shape[0] * 8000 // SAMPLE_RATE) <= 1
+    with AudioDecoder(str(path), channels=2, sample_format='s16le') as decoder:
+        assert np.array_equal(decoder.read_all(), np.repeat(samples, 2).reshape(-1, 2))
+
+
+def test_part_of_the_file(wav_path, samples):
+    with AudioDecoder(wav_path, sample_format='s16le', start_seconds=1, duration_seconds=0.5) as decoder:
+        res = decoder.read_all()
+    assert np.array_equal(res, samples[SAMPLE_RATE:SAMPLE_RATE + SAMPLE_RATE // 2])
+
+
+def test_broken_input_raises(tmp_path):
+    path = tmp_path / 'broken.mp3'
+    path.write_bytes(b'not an audio file' * 100)
+    with pytest.raises(RuntimeError):
+        with AudioDecoder(str(path)) as decoder:
+            decoder.read_all()
@@ -0,0 +1,152 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+
+class _BatchItem:
+    """Frames of one request waiting for inference."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.outputs = None
+        self.n_scheduled = 0
+        self.n_done = 0
+        self.enqueue_time = time.time()
+        self.first_batch_time = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class DynamicBatcher:
+    """
+    Gathers frames of several concurrent requests into batches of batch_size frames.
+    Batch is run when it is full or when the oldest waiting frames have been queued for max_delay_seconds.
+    Outputs are routed back to the requests they belong to.
+    """
+    def __init__(self, predict, batch_size, max_delay_seconds):
+        self.__predict = predict
+        self.__batch_size = batch_size
+        self.__max_delay_seconds = max_delay_seconds
+        self.__queue = collections.deque()
+        self.__condition = threading.Condition()
+        self.__closed = False
+
+        self.__metrics_lock = threading.Lock()
+        self.__n_batches = 0
+        self.__n_frames = 0
+        self.__n_items = 0
+        self.__total_queue_delay = 0.0
+        self.__max_queue_delay = 0.0
+
+        self.__thread = threading.Thread(target=self.__run, name='vad-batcher', daemon=True)
+        self.__thread.start()
+
+    def predict(self, frames):
+        """
+        Blocks until all frames are inferred and returns outputs in the order of frames
+        """
+        if frames.shape[0] == 0:
+            return self.__predict(frames)
+
+        item = _BatchItem(frames)
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('Batcher is closed')
+            self.__queue.append(item)
+            self.__condition.notify()
+        item.done.wait()
+
+        if item.error is not None:
+            raise item.error
+        return item.outputs
+
+    def __get_n_waiting(self):
+        return sum(x.frames.shape[0] - x.n_scheduled for x in self.__queue)
+
+    def __take_batch(self):
+        with self.__condition:
+            while not self.__queue and not self.__closed:
+                self.__condition.wait()
+            if not self.__queue:
+                return None
+
+            # Wait for more frames until the batch is full or the oldest frames are waiting too long
+            deadline = self.__queue[0].enqueue_time + self.__max_delay_seconds
+            while not self.__closed and self.__get_n_waiting() < self.__batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                self.__condition.wait(timeout)
+
+            parts = []
+            n_batch = 0
+            for item in self.__queue:
+                if n_batch >= self.__batch_size:
+                    break
+                n_take = min(item.frames.shape[0] - item.n_scheduled, self.__batch_size - n_batch)
+                parts.append((item, item.n_scheduled, n_take))
+                item.n_scheduled += n_take
+                n_batch += n_take
+            while self.__queue and self.__queue[0].n_scheduled == self.__queue[0].frames.shape[0]:
+                self.__queue.popleft()
+            return parts
+
+    def __run(self):
+        while True:
+            parts = self.__take_batch()
+            if parts is None:
+                break
+
+            batch_time = time.time()
+            try:
+                batch = np.concatenate([item.frames[start:start+n] for item, start, n in parts])
+                outputs = self.__predict(batch)
+                error = None
+            except Exception as e:
+                error = e
+
+            offset = 0
+            for item, start, n in parts:
+                if item.first_batch_time is None:
+                    item.first_batch_time = batch_time
+                    self.__add_item_metrics(batch_time - item.enqueue_time)
+                if error is not None:
+                    item.error = error
+                else:
+                    if item.outputs is None:
+                        item.outputs = np.empty((item.frames.shape[0],) + outputs.shape[1:], dtype=outputs.dtype)
+                    item.outputs[start:start+n] = outputs[offset:offset+n]
+                offset += n
+                item.n_done += n
+                if item.n_done == item.frames.shape[0]:
+                    item.done.set()
+
+            with self.__metrics_lock:
+                self.__n_batches += 1
+                self.__n_frames += offset
+
+    def __add_item_metrics(self, queue_delay):
+        with self.__metrics_lock:
+            self.__n_items += 1
+            self.__total_queue_delay += queue_delay
+            self.__max_queue_delay = max(self.__max_queue_delay, queue_delay)
+
+    def get_metrics(self):
+        with self.__metrics_lock:
+            return {
+                'batches': self.__n_batches,
+                'frames': self.__n_frames,
+                'requests': self.__n_items,
+                'batch_fill_ratio': self.__n_frames / (self.__n_batches * self.__batch_size) if self.__n_batches else 0.0,
+                'mean_queue_delay_seconds': self.__total_queue_delay / self.__n_items if self.__n_items else 0.0,
+                'max_queue_delay_seconds': self.__max_queue_delay
+            }
+
+    def close(self):
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batching import DynamicBatcher
+
+
+def run_concurrently(batcher, inputs):
+    results = [None] * len(inputs)
+    errors = [None] * len(inputs)
+
+    def run(i):
+        try:
+            results[i] = batcher.predict(inputs[i])
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_frames_of_concurrent_requests_are_batched_and_routed_back():
+    batch_sizes = []
+
+    def predict(frames):
+        batch_sizes.append(frames.shape[0])
+        return frames * 2
+
+    batcher = DynamicBatcher(predict, batch_size=8, max_delay_seconds=0.05)
+    inputs = [np.arange(n, dtype=np.float32).reshape(-1, 1) + 100 * i for i, n in enumerate([3, 5, 11, 1])]
+    results, _ = run_concurrently(batcher, inputs)
+    batcher.close()
+
+    for x, y in zip(inputs, results):
+        assert np.array_equal(x * 2, y)
+    assert sum(batch_sizes) == 20
+    assert max(batch_sizes) <= 8
+    metrics = batcher.get_metrics()
+    assert metrics['frames'] == 20
+    assert metrics['requests'] == 4
+    assert metrics['batches'] == len(batch_sizes)
+
+
+def test_error_of_a_batch_is_raised_to_its_requests():
+    def predict(frames):
+        raise ValueError('inference failed')
+
+    batcher = DynamicBatcher(predict, batch_size=4, max_delay_seconds=0.01)
+    _, errors = run_concurrently(batcher, [np.zeros((3, 1), dtype=np.float32), np.zeros((6, 1), dtype=np.float32)])
+    batcher.close()
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_closed_batcher_rejects_requests():
+    batcher = DynamicBatcher(lambda frames: frames, batch_size=4, max_delay_seconds=0.01)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.predict(np.zeros((1, 1), dtype=np.float32))
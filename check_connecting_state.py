@@ -1,13 +1,18 @@
+import json
+import logging
+
 import pika
 import yaml
 
-# For DEBUG purpose
-import sys
-import numpy
-numpy.set_printoptions(threshold=sys.maxsize)
+from label_store import LabelStore
+from windows_extractor import get_windows_from_annotated_data
 
 
 class SplitterAMQPService:
+    """
+    Answers with windows of transactions of a recording. Windows are extracted from per second labels which are
+    stored by VAD runs of the recording (see label_store_dir in config), so the audio is not decoded again
+    """
     def __init__(self, config_file_path):
 
         with open(config_file_path, 'r') as stream:
@@ -15,17 +20,40 @@ class SplitterAMQPService:
 
         self.__channel = None
         self.__in_queue_name = 'Loyalty.Audio.VAD.StabReq, Loyalty.Audio.VAD'
+        self.__out_queue_name = 'Loyalty.Audio.VAD.StabResp, Loyalty.Audio.VAD'
         self.__exchange_name = config['exchange_name']  # 'easy_net_q_rpc'
         self.__amqp_host = config['amqp_host']
         self.__amqp_port = config['port']
         self.__user_name = config['user_name']
         self.__password = config['password']
+        self.__label_store = LabelStore(config['label_store_dir'])
+        self.logger = logging.getLogger()
+
+    def get_response_obj(self, req_obj):
+        recording_id = req_obj['RecordingId']
+        seconds_stamps = self.__label_store.get(recording_id)
+        if seconds_stamps is None:
+            raise KeyError(f'VAD labels of recording {recording_id} are not stored')
+        windows = get_windows_from_annotated_data(req_obj['EndTimestamps'], seconds_stamps)
+        return {'Windows': windows}
 
     def __handle_delivery(self, channel, method_frame, header_frame, body):
-        pass
+        try:
+            req_obj = json.loads(body.decode('utf-8'))
+            res_obj = self.get_response_obj(req_obj)
+        except Exception:
+            self.logger.exception(f'Failed to handle request {header_frame.correlation_id}')
+            # Failed request is not requeued, otherwise it would be redelivered to the service forever
+            channel.basic_nack(delivery_tag=method_frame.delivery_tag, requeue=False)
+            return
+        self.__push_message(header_frame.reply_to, header_frame.correlation_id, res_obj)
+        channel.basic_ack(delivery_tag=method_frame.delivery_tag)
 
     def __push_message(self, reply_to_key, correlation_id, res_obj):
-        pass
+        self.__channel.basic_publish(exchange='', routing_key=reply_to_key,
+                                     properties=pika.BasicProperties(correlation_id=correlation_id,
+                                                                     type=self.__out_queue_name),
+                                     body=json.dumps(res_obj))
 
     def run_listener(self):
         while True:
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+import yaml
+
+from check_connecting_state import SplitterAMQPService
+from label_store import LabelStore
+from windows_extractor import get_windows_from_annotated_data
+
+
+@pytest.fixture
+def label_store_dir():
+    with tempfile.TemporaryDirectory() as store_dir:
+        yield store_dir
+
+
+def create_service(store_dir):
+    config_path = os.path.join(store_dir, 'config.yml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump({'exchange_name': 'easy_net_q_rpc', 'amqp_host': 'localhost', 'port': 5672,
+                        'user_name': 'guest', 'password': 'guest',
+                        'label_store_dir': os.path.join(store_dir, 'labels')}, f)
+    return SplitterAMQPService(config_path)
+
+
+def test_windows_are_extracted_from_stored_labels(label_store_dir):
+    seconds_stamps = [0] * 300 + [1] * 380 + [0] * 100
+    service = create_service(label_store_dir)
+    LabelStore(os.path.join(label_store_dir, 'labels')).put('recording', seconds_stamps)
+
+    res = service.get_response_obj({'RecordingId': 'recording', 'EndTimestamps': [600]})
+    assert res == {'Windows': get_windows_from_annotated_data([600], seconds_stamps)}
+
+
+def test_unknown_recording_is_rejected(label_store_dir):
+    service = create_service(label_store_dir)
+    with pytest.raises(KeyError):
+        service.get_response_obj({'RecordingId': 'missing', 'EndTimestamps': [600]})
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Caller of the request has already given up, so the rest of the work is not needed"""
+    pass
+
+
+class Deadline:
+    """
+    Time after which the result of a request is not needed, None if there is no such time.
+    Deadline of a computation shared by several requests is extended to the latest one
+    """
+    def __init__(self, timestamp=None):
+        self.__timestamp = timestamp
+        self.__lock = threading.Lock()
+
+    @property
+    def timestamp(self):
+        """Unix time of the deadline, None if the request has no deadline"""
+        return self.__timestamp
+
+    def extend(self, timestamp):
+        with self.__lock:
+            if self.__timestamp is not None:
+                self.__timestamp = None if timestamp is None else max(self.__timestamp, timestamp)
+
+    def is_expired(self):
+        timestamp = self.__timestamp
+        return timestamp is not None and time.time() > timestamp
+
+    def check(self, stage):
+        """
+        Raises DeadlineExceeded if the deadline has passed, stage is the work which is not started because of it
+        """
+        timestamp = self.__timestamp
+        if timestamp is not None and time.time() > timestamp:
+            raise DeadlineExceeded(f'Deadline passed {time.time() - timestamp:.1f}s before {stage}')
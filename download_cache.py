@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+from downloader import DownloadStats, HttpDownloader
+from lru_files import LruFiles
+from shared_buffer import get_shared_memory_dir
+
+
+# Size of the content of a scratch dir which is assumed when it is not known in advance
+DEFAULT_SCRATCH_BYTES = 256 << 20
+
+
+class ScratchDir:
+    """
+    Private directory of a single request, removed with all its content by close().
+    It is placed on tmpfs when it has room for expected_bytes, so intermediate files never touch the disk,
+    otherwise it is placed on disk.
+    """
+    def __init__(self, parent_dir=None, expected_bytes=None):
+        if parent_dir is None:
+            parent_dir = get_shared_memory_dir(expected_bytes if expected_bytes is not None else DEFAULT_SCRATCH_BYTES)
+        self.path = tempfile.mkdtemp(prefix='vadnet-request-', dir=parent_dir)
+
+    def get_file_path(self, name):
+        return os.path.join(self.path, name)
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DownloadCache:
+    """
+    Local cache of downloaded files with LRU eviction by total size.
+    Files are stored by the SHA-256 of their content, so the same recording under different URLs is stored once.
+    URL is mapped to the content with ETag and Last-Modified of the response. Cached copy of the URL is revalidated
+    with a conditional request and its body is not downloaded again while the server answers 304.
+    Files which are in use by requests are pinned and never evicted.
+    """
+    INDEX_FILE_NAME = 'index.json'
+    PARTIAL_SUFFIX = '.part'
+
+    def __init__(self, cache_dir, max_bytes, downloader: HttpDownloader):
+        self.__cache_dir = cache_dir
+        self.__downloader = downloader
+        self.__lock = threading.Lock()
+        # Files are named by their content keys
+        self.__files = LruFiles(cache_dir, max_bytes)
+        # URL to {'etag', 'last_modified', 'key'}
+        self.__urls = {}
+        self.__stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.logger = logging.getLogger()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.__load()
+
+    def __get_path(self, key):
+        return os.path.join(self.__cache_dir, key)
+
+    def __load(self):
+        keys = []
+        for name in os.listdir(self.__cache_dir):
+            path = os.path.join(self.__cache_dir, name)
+            if name == self.INDEX_FILE_NAME or not os.path.isfile(path):
+                continue
+            if name.endswith(self.PARTIAL_SUFFIX):
+                # Download was interrupted by restart
+                os.remove(path)
+                continue
+            keys.append(name)
+        self.__files.load(keys)
+
+        index_path = self.__get_path(self.INDEX_FILE_NAME)
+        if os.path.isfile(index_path):
+            with open(index_path, 'r') as f:
+                urls = json.load(f)
+            self.__urls = {url: x for url, x in urls.items() if x['key'] in self.__files}
+        self.__evict()
+
+    def __save_index(self):
+        index_path = self.__get_path(self.INDEX_FILE_NAME)
+        temp_path = index_path + self.PARTIAL_SUFFIX
+        with open(temp_path, 'w') as f:
+            json.dump(self.__urls, f)
+        os.replace(temp_path, index_path)
+
+    def __evict(self):
+        evicted = set(self.__files.evict())
+        if evicted:
+            self.__stats['evictions'] += len(evicted)
+            self.__urls = {url: x for url, x in self.__urls.items() if x['key'] not in evicted}
+
+    def acquire(self, url):
+        """
+        Returns (key, path) of the local copy of url, downloading it if it is missing or modified.
+        File is pinned until release(key) is called
+        """
+        with self.__lock:
+            cached = self.__urls.get(url)
+            headers = {}
+            if cached is not None:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+                # Copy can't be evicted while it is revalidated
+                self.__files.pin(cached['key'])
+
+        stats = DownloadStats()
+        temp_path = self.__get_path(uuid.uuid4().hex + self.PARTIAL_SUFFIX)
+        try:
+            content_hash = hashlib.sha256()
+            with open(temp_path, 'wb') as f:
+                for chunk in self.__downloader.iter_content(url, stats, headers=headers if headers else None):
+                    content_hash.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            if cached is not None:
+                self.release(cached['key'])
+            raise
+
+        if stats.not_modified:
+            os.remove(temp_path)
+            with self.__lock:
+                self.__stats['hits'] += 1
+                self.__files.touch(cached['key'])
+            self.logger.info(f'Download cache hit: {url}')
+            return cached['key'], self.__get_path(cached['key'])
+
+        key = content_hash.hexdigest()
+        with self.__lock:
+            if cached is not None:
+                self.__files.unpin(cached['key'])
+            self.__stats['misses'] += 1
+            self.__files.pin(key)
+            if key in self.__files:
+                # Same content is already stored under another URL
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, self.__get_path(key))
+                self.__files.add(key, stats.bytes)
+            self.__files.touch(key)
+            if stats.etag or stats.last_modified:
+                # Response without validators can't be revalidated, so it is downloaded every time
+                self.__urls[url] = {'etag': stats.etag, 'last_modified': stats.last_modified, 'key': key}
+            else:
+                self.__urls.pop(url, None)
+            self.__evict()
+            self.__save_index()
+        self.logger.info(f'Download cache miss: {url}, {stats.bytes} bytes are cached')
+        return key, self.__get_path(key)
+
+    def release(self, key):
+        with self.__lock:
+            self.__files.unpin(key)
+            self.__evict()
+
+    def get_stats(self):
+        with self.__lock:
+            res = dict(self.__stats)
+            res['entries'] = len(self.__files)
+            res['bytes'] = self.__files.total_bytes
+            return res
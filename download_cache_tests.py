@@ -0,0 +1,121 @@
+import os
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from download_cache import DownloadCache, ScratchDir
+from downloader import HttpDownloader
+
+
+FILES = {'/a.mp3': b'a' * 1000, '/b.mp3': b'b' * 1000, '/c.mp3': b'c' * 1000, '/copy_of_a.mp3': b'a' * 1000}
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    bodies_sent = []
+
+    def do_GET(self):
+        body = FILES[self.path]
+        etag = f'"{self.path}-{len(body)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        _Handler.bodies_sent.append(self.path)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    _Handler.bodies_sent.clear()
+    server = _Server(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_repeated_request_is_not_downloaded_again(server_url):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DownloadCache(cache_dir, 10000, HttpDownloader())
+        for _ in range(3):
+            key, path = cache.acquire(f'{server_url}/a.mp3')
+            with open(path, 'rb') as f:
+                assert f.read() == FILES['/a.mp3']
+            cache.release(key)
+
+        assert _Handler.bodies_sent == ['/a.mp3']
+        assert cache.get_stats()['hits'] == 2
+        assert cache.get_stats()['misses'] == 1
+
+        # Index is kept between restarts
+        cache = DownloadCache(cache_dir, 10000, HttpDownloader())
+        key, _ = cache.acquire(f'{server_url}/a.mp3')
+        cache.release(key)
+        assert _Handler.bodies_sent == ['/a.mp3']
+
+
+def test_same_content_is_stored_once(server_url):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DownloadCache(cache_dir, 10000, HttpDownloader())
+        key_a, _ = cache.acquire(f'{server_url}/a.mp3')
+        key_copy, _ = cache.acquire(f'{server_url}/copy_of_a.mp3')
+        cache.release(key_a)
+        cache.release(key_copy)
+
+        assert key_a == key_copy
+        assert cache.get_stats()['entries'] == 1
+        assert cache.get_stats()['bytes'] == 1000
+
+
+def test_least_recently_used_is_evicted_and_pinned_is_kept(server_url):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = DownloadCache(cache_dir, 2000, HttpDownloader())
+        key_a, path_a = cache.acquire(f'{server_url}/a.mp3')
+        key_b, path_b = cache.acquire(f'{server_url}/b.mp3')
+        cache.release(key_b)
+        # a is pinned, so the least recently used b is evicted instead
+        key_c, path_c = cache.acquire(f'{server_url}/c.mp3')
+        cache.release(key_c)
+
+        assert os.path.isfile(path_a)
+        assert not os.path.isfile(path_b)
+        assert os.path.isfile(path_c)
+        assert cache.get_stats()['evictions'] == 1
+
+        cache.release(key_a)
+        key_b, path_b = cache.acquire(f'{server_url}/b.mp3')
+        cache.release(key_b)
+        assert not os.path.isfile(path_a)
+        assert cache.get_stats()['bytes'] == 2000
+
+
+def test_scratch_dir_is_removed():
+    with tempfile.TemporaryDirectory() as parent_dir:
+        with ScratchDir(parent_dir) as scratch_dir:
+            with open(scratch_dir.get_file_path('source'), 'wb') as f:
+                f.write(b'data')
+        assert os.listdir(parent_dir) == []
+
+
+def test_scratch_dir_is_placed_on_disk_if_it_does_not_fit_into_shared_memory():
+    with ScratchDir(expected_bytes=1 << 60) as scratch_dir:
+        assert os.path.dirname(scratch_dir.path) == tempfile.gettempdir()
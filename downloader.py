@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class DownloadStats:
+    """Size and duration of a single download."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = 0.0
+        self.content_length = None
+        # Validators of the response, they are used to check whether a cached copy is still valid
+        self.etag = None
+        self.last_modified = None
+        # Server has confirmed with 304 that the copy requested conditionally is not modified, body is empty
+        self.not_modified = False
+
+    @property
+    def throughput(self):
+        """Bytes per second"""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+class HttpDownloader:
+    """
+    Downloads files by HTTP with a single pooled session, so repeated downloads from the same host reuse connections.
+    Body is streamed by chunks of chunk_size bytes, so it is never held in memory as a whole.
+    Downloader is thread-safe, up to pool_size connections per host are kept open.
+    """
+    def __init__(self, pool_size=8, connect_timeout=10, read_timeout=60, chunk_size=1 << 20, max_retries=2):
+        self.__timeout = (connect_timeout, read_timeout)
+        self.__chunk_size = chunk_size
+        self.__session = requests.Session()
+        # Retries are made for failed connections only, request which has sent data is not repeated
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+
+        self.__lock = threading.Lock()
+        self.__n_downloads = 0
+        self.__total_bytes = 0
+        self.__total_seconds = 0.0
+        self.logger = logging.getLogger()
+
+    def iter_content(self, url, stats: DownloadStats=None, headers=None):
+        """
+        Yields chunks of the body. Can be passed to AudioDecoder directly to decode while downloading.
+        stats is filled when the body is read to the end
+        """
+        if stats is None:
+            stats = DownloadStats()
+        start_time = time.time()
+        with self.__session.get(url, stream=True, timeout=self.__timeout, allow_redirects=True, headers=headers) as r:
+            r.raise_for_status()
+            stats.etag = r.headers.get('ETag')
+            stats.last_modified = r.headers.get('Last-Modified')
+            stats.not_modified = r.status_code == 304
+            if 'Content-Length' in r.headers:
+                stats.content_length = int(r.headers['Content-Length'])
+            for chunk in r.iter_content(chunk_size=self.__chunk_size):
+                stats.bytes += len(chunk)
+                yield chunk
+        stats.seconds = time.time() - start_time
+        self.__add_stats(stats)
+
+    def get_content_length(self, url):
+        """
+        Returns size of the body from the headers of HEAD request, None if the server doesn't report it
+        """
+        with self.__session.head(url, timeout=self.__timeout, allow_redirects=True) as r:
+            r.raise_for_status()
+            if 'Content-Length' not in r.headers:
+                return None
+            return int(r.headers['Content-Length'])
+
+    def download_to_file(self, url, out_file_path) -> DownloadStats:
+        stats = DownloadStats()
+        with open(out_file_path, 'wb') as f:
+            for chunk in self.iter_content(url, stats):
+                f.write(chunk)
+        self.logger.info(f'Downloaded {stats.bytes} bytes in {stats.seconds:.3f}s '
+                         f'({stats.throughput / (1 << 20):.2f} MB/s)')
+        return stats
+
+    def __add_stats(self, stats: DownloadStats):
+        with self.__lock:
+            self.__n_downloads += 1
+            self.__total_bytes += stats.bytes
+            self.__total_seconds += stats.seconds
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                'downloads': self.__n_downloads,
+                'bytes': self.__total_bytes,
+                'seconds': self.__total_seconds,
+                'mean_throughput': self.__total_bytes / self.__total_seconds if self.__total_seconds > 0 else 0.0
+            }
+
+    def close(self):
+        self.__session.close()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+import requests
+
+from downloader import HttpDownloader
+
+
+BODY = os.urandom(3 * (1 << 20) + 17)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive is needed to check that connections are reused
+    protocol_version = 'HTTP/1.1'
+    client_ports = set()
+
+    def do_GET(self):
+        _Handler.client_ports.add(self.client_address[1])
+        if self.path != '/record.mp3':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def do_HEAD(self):
+        if self.path != '/record.mp3':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    _Handler.client_ports.clear()
+    server = _Server(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_to_file_reuses_connection(server_url):
+    downloader = HttpDownloader(chunk_size=1 << 16)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        out_file_path = os.path.join(temp_dir, 'record.mp3')
+        for _ in range(3):
+            stats = downloader.download_to_file(f'{server_url}/record.mp3', out_file_path)
+            with open(out_file_path, 'rb') as f:
+                assert f.read() == BODY
+            assert stats.bytes == len(BODY)
+            assert stats.content_length == len(BODY)
+            assert stats.throughput > 0
+    downloader.close()
+
+    assert len(_Handler.client_ports) == 1
+    assert downloader.get_stats()['downloads'] == 3
+    assert downloader.get_stats()['bytes'] == 3 * len(BODY)
+
+
+def test_iter_content_streams_by_chunks(server_url):
+    downloader = HttpDownloader(chunk_size=1 << 16)
+    chunks = list(downloader.iter_content(f'{server_url}/record.mp3'))
+    downloader.close()
+
+    assert max(len(x) for x in chunks) <= 1 << 16
+    assert b''.join(chunks) == BODY
+
+
+def test_download_of_missing_file_fails(server_url):
+    downloader = HttpDownloader()
+    with pytest.raises(requests.HTTPError):
+        list(downloader.iter_content(f'{server_url}/missing.mp3'))
+    downloader.close()
+
+
+def test_content_length_is_taken_without_body(server_url):
+    downloader = HttpDownloader()
+    assert downloader.get_content_length(f'{server_url}/record.mp3') == len(BODY)
+    assert downloader.get_stats()['bytes'] == 0
+    with pytest.raises(requests.HTTPError):
+        downloader.get_content_length(f'{server_url}/missing.mp3')
+    downloader.close()
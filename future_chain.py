@@ -0,0 +1,31 @@
+from concurrent.futures import Future
+
+
+def copy_future(source: Future, target: Future):
+    """Completes target with the result or the exception of the completed source"""
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+def after(future: Future, function) -> Future:
+    """
+    Returns a future of function(future) which is called when future is done, whatever its outcome.
+    Exception of function is passed to the returned future. function is called in the thread which completes
+    future, so it has to be short
+    """
+    res = Future()
+    future.add_done_callback(lambda done: copy_future(call(lambda: function(done)), res))
+    return res
+
+
+def call(function) -> Future:
+    """Calls function in this thread and returns its completed future"""
+    res = Future()
+    try:
+        res.set_result(function())
+    except BaseException as e:
+        res.set_exception(e)
+    return res
@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from deadline import Deadline
+from vad_extract import CNNNetVadExecutor
+
+
+class IncrementalVad:
+    """
+    Labels recordings which grow over time, e.g. device recordings which are re-submitted during the day.
+    Labels of the processed part are stored for every recording id, and only the new tail of the file
+    is decoded and inferred, so work per update depends on the new audio only.
+    If the head of the file differs from the stored one, recording was replaced and it is processed from scratch.
+    """
+    # Count of bytes at the start of the file which identify the recording
+    HEAD_BYTES = 1 << 16
+
+    def __init__(self, executor: CNNNetVadExecutor, state_dir):
+        self.__executor = executor
+        self.__state_dir = state_dir
+        self.__lock = threading.Lock()
+        self.__recording_locks = {}
+        self.logger = logging.getLogger()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def __get_state_path(self, recording_id):
+        # Recording id comes from a request, so it is not used as a file name directly
+        name = hashlib.sha1(str(recording_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.__state_dir, name + '.npz')
+
+    def __get_recording_lock(self, recording_id):
+        with self.__lock:
+            return self.__recording_locks.setdefault(recording_id, threading.Lock())
+
+    @staticmethod
+    def __get_head_digest(file_path, n_bytes):
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read(n_bytes)).hexdigest()
+
+    def __load_state(self, recording_id, file_path):
+        path = self.__get_state_path(recording_id)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as state:
+            head_size = int(state['head_size'])
+            head_digest = str(state['head_digest'])
+            labels = state['labels'].astype(np.int32)
+            probabilities = state['probabilities']
+        if os.path.getsize(file_path) < head_size or self.__get_head_digest(file_path, head_size) != head_digest:
+            self.logger.info(f'Recording {recording_id} was replaced, it is processed from the start')
+            return None
+        return labels, probabilities
+
+    def __save_state(self, recording_id, file_path, labels, probabilities):
+        head_size = min(os.path.getsize(file_path), self.HEAD_BYTES)
+        path = self.__get_state_path(recording_id)
+        temp_path = os.path.join(self.__state_dir, f'{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'wb') as f:
+            np.savez(f, labels=labels.astype(np.int8), probabilities=probabilities.astype(np.float16),
+                     head_size=head_size, head_digest=self.__get_head_digest(file_path, head_size))
+        os.replace(temp_path, path)
+
+    def extract_voice(self, recording_id, file_path, with_probabilities=False, deadline: Deadline=None):
+        """
+        Returns labels of the whole recording, only audio after the previously labeled part is processed
+        """
+        with self.__get_recording_lock(recording_id):
+            state = self.__load_state(recording_id, file_path)
+            if state is None:
+                labels = np.zeros((0,), dtype=np.int32)
+                probabilities = np.zeros((0,), dtype=np.float16)
+            else:
+                labels, probabilities = state
+
+            # Frames don't overlap, so the tail starts right after the last labeled frame
+            start_seconds = labels.shape[0] * self.__executor.get_frame_seconds()
+            tail_labels, tail_probabilities = self.__executor.extract_voice(file_path, with_probabilities=True,
+                                                                            start_seconds=start_seconds,
+                                                                            deadline=deadline)
+            self.logger.info(f'Recording {recording_id}: {labels.shape[0]} frames are stored, '
+                             f'{tail_labels.shape[0]} new frames are labeled')
+            labels = np.concatenate([labels, tail_labels])
+            probabilities = np.concatenate([probabilities, tail_probabilities.astype(np.float16)])
+            self.__save_state(recording_id, file_path, labels, probabilities)
+
+        return (labels, probabilities) if with_probabilities else labels
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from incremental_vad import IncrementalVad
+
+
+class FakeExecutor:
+    """Every byte of a file is a frame of 1s, it is voiced if it is not less than 128"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_frame_seconds(self):
+        return 1
+
+    def extract_voice(self, file_path, with_probabilities=False, start_seconds=0, deadline=None):
+        self.calls.append(start_seconds)
+        with open(file_path, 'rb') as f:
+            data = np.frombuffer(f.read(), dtype=np.uint8)[int(start_seconds):]
+        labels = (data >= 128).astype(np.int32)
+        probabilities = (data / 255).astype(np.float16)
+        return (labels, probabilities) if with_probabilities else labels
+
+
+@pytest.fixture
+def executor():
+    return FakeExecutor()
+
+
+@pytest.fixture
+def incremental_vad(executor, tmp_path):
+    return IncrementalVad(executor, str(tmp_path / 'state'))
+
+
+def test_growing_recording_gets_labels_of_a_full_recompute(executor, incremental_vad, tmp_path):
+    path = tmp_path / 'recording.mp3'
+    data = np.random.RandomState(0).randint(0, 256, 1000).astype(np.uint8).tobytes()
+    for size in [0, 10, 11, 500, 500, 1000]:
+        path.write_bytes(data[:size])
+        labels, probabilities = incremental_vad.extract_voice('recording', str(path), with_probabilities=True)
+        expected_labels, expected_probabilities = FakeExecutor().extract_voice(str(path), with_probabilities=True)
+        assert np.array_equal(labels, expected_labels)
+        assert np.array_equal(probabilities, expected_probabilities)
+    # Only the tail after the labeled part is processed
+    assert executor.calls == [0, 0, 10, 11, 500, 500]
+
+
+def test_state_survives_restart(executor, tmp_path):
+    path = tmp_path / 'recording.mp3'
+    path.write_bytes(bytes(range(100)))
+    IncrementalVad(executor, str(tmp_path / 'state')).extract_voice('recording', str(path))
+    path.write_bytes(bytes(range(200)))
+    labels = IncrementalVad(executor, str(tmp_path / 'state')).extract_voice('recording', str(path))
+    assert np.array_equal(labels, np.arange(200) >= 128)
+    assert executor.calls == [0, 100]
+
+
+def test_replaced_recording_is_processed_from_the_start(executor, incremental_vad, tmp_path):
+    path = tmp_path / 'recording.mp3'
+    path.write_bytes(bytes([200] * 100))
+    incremental_vad.extract_voice('recording', str(path))
+    path.write_bytes(bytes([0] * 150))
+    labels = incremental_vad.extract_voice('recording', str(path))
+    assert not labels.any() and labels.shape[0] == 150
+    assert executor.calls == [0, 0]
+
+
+def test_recordings_are_kept_apart(executor, incremental_vad, tmp_path):
+    for name, value in [('a', 0), ('b', 255)]:
+        path = tmp_path / f'{name}.mp3'
+        path.write_bytes(bytes([value] * 10))
+        labels = incremental_vad.extract_voice(name, str(path))
+        assert labels.tolist() == [value >= 128] * 10
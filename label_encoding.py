@@ -0,0 +1,75 @@
+import base64
+import json
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from vad_decoder import get_runs
+
+
+# Values of 'LabelsEncoding' of a request. Labels are a plain list by default
+LIST_ENCODING = 'list'
+RLE_ENCODING = 'rle'
+BITS_ENCODING = 'bits'
+
+# Values of 'ResponseFormat' of a request
+JSON_FORMAT = 'json'
+MSGPACK_FORMAT = 'msgpack'
+
+
+def encode_labels(labels, encoding=LIST_ENCODING, hop_seconds=1):
+    """
+    Returns labels in the form of encoding: a list of 0 and 1, or an object with the hop duration and
+    'Runs' of [value, count] pairs for 'rle' or base64 of labels packed 8 per byte for 'bits'
+    """
+    labels = np.asarray(labels, dtype=bool).reshape(-1)
+    if encoding == LIST_ENCODING:
+        return labels.astype(np.int8).tolist()
+    res = {'Encoding': encoding, 'HopSeconds': hop_seconds, 'Length': labels.shape[0]}
+    if encoding == RLE_ENCODING:
+        starts, ends, values = get_runs(labels)
+        res['Runs'] = np.stack([values.astype(np.int64), ends - starts], axis=1).tolist()
+    elif encoding == BITS_ENCODING:
+        res['Bits'] = base64.b64encode(np.packbits(labels).tobytes()).decode('ascii')
+    else:
+        raise ValueError(f'Unknown labels encoding: {encoding}')
+    return res
+
+
+def decode_labels(encoded):
+    """
+    Returns int8 labels from the result of encode_labels
+    """
+    if isinstance(encoded, list):
+        return np.asarray(encoded, dtype=np.int8)
+    if encoded['Encoding'] == RLE_ENCODING:
+        runs = np.asarray(encoded['Runs'], dtype=np.int64).reshape(-1, 2)
+        return np.repeat(runs[:, 0], runs[:, 1]).astype(np.int8)
+    if encoded['Encoding'] == BITS_ENCODING:
+        bits = np.frombuffer(base64.b64decode(encoded['Bits']), dtype=np.uint8)
+        return np.unpackbits(bits)[:encoded['Length']].astype(np.int8)
+    raise ValueError(f'Unknown labels encoding: {encoded["Encoding"]}')
+
+
+def dump_response(res_obj, response_format=JSON_FORMAT):
+    """
+    Serializes the response body to JSON or to msgpack if it is installed
+    """
+    if response_format == JSON_FORMAT:
+        return json.dumps(res_obj)
+    if response_format == MSGPACK_FORMAT:
+        if msgpack is None:
+            raise ValueError('msgpack response format is requested, but msgpack is not installed')
+        return msgpack.packb(res_obj, use_bin_type=True)
+    raise ValueError(f'Unknown response format: {response_format}')
+
+
+if __name__ == '__main__':
+    labels = np.random.RandomState(0).uniform(0, 1, 86400) < 0.1
+    labels = np.repeat(labels[::60], 60)
+    for encoding in [LIST_ENCODING, RLE_ENCODING, BITS_ENCODING]:
+        print(f'{encoding}: day of labels takes {len(dump_response(encode_labels(labels, encoding)))} bytes of JSON')
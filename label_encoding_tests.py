@@ -0,0 +1,31 @@
+import json
+
+import numpy as np
+import pytest
+
+from label_encoding import BITS_ENCODING, JSON_FORMAT, LIST_ENCODING, RLE_ENCODING, decode_labels, dump_response,\
+    encode_labels
+
+
+@pytest.mark.parametrize('encoding', [LIST_ENCODING, RLE_ENCODING, BITS_ENCODING])
+def test_encoded_labels_are_decoded_back(encoding):
+    labels = np.random.RandomState(0).uniform(0, 1, 86400) < 0.1
+    labels = np.repeat(labels[::60], 60)
+    encoded = json.loads(dump_response(encode_labels(labels, encoding), JSON_FORMAT))
+    assert np.array_equal(decode_labels(encoded), labels)
+
+
+def test_short_labels():
+    assert decode_labels(encode_labels([], RLE_ENCODING)).tolist() == []
+    assert decode_labels(encode_labels([1, 0, 1], BITS_ENCODING)).tolist() == [1, 0, 1]
+    assert encode_labels([1, 1, 0], RLE_ENCODING, hop_seconds=0.5) == {
+        'Encoding': RLE_ENCODING, 'HopSeconds': 0.5, 'Length': 3, 'Runs': [[1, 2], [0, 1]]}
+
+
+def test_unknown_encoding_and_format_are_rejected():
+    with pytest.raises(ValueError):
+        encode_labels([1], 'unknown')
+    with pytest.raises(ValueError):
+        decode_labels({'Encoding': 'unknown'})
+    with pytest.raises(ValueError):
+        dump_response({}, 'unknown')
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+
+from label_encoding import decode_labels
+
+
+# Header of a timeline file, it is the index of the recording: count and duration of frames and offsets of data
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('n_frames', '<u8'), ('frame_seconds', '<f8'),
+                         ('has_probabilities', '<u4'), ('reserved', '<u4')])
+MAGIC = b'VADL'
+VERSION = 1
+
+
+def _get_probabilities_offset(n_frames):
+    # float16 values are aligned to 8 bytes after the bit-packed labels
+    return int(math.ceil((HEADER_DTYPE.itemsize + (n_frames + 7) // 8) / 8)) * 8
+
+
+class LabelStore:
+    """
+    VAD label timelines of recordings stored by recording id, so windows of transactions are extracted from
+    the labels of earlier VAD runs without decoding the recording again.
+    Every recording is a single file: header, labels packed 8 per byte and optional float16 voice probabilities,
+    so a day of per second labels takes about 11 KB, or 184 KB with probabilities. Files are memory-mapped,
+    a time range query reads only the pages of the range. Files are replaced atomically, so readers in other
+    processes never see a partial timeline.
+    """
+    SUFFIX = '.vadl'
+
+    def __init__(self, store_dir):
+        self.__store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def __get_path(self, recording_id):
+        # Recording id comes from a request, so it is not used as a file name directly
+        name = hashlib.sha1(str(recording_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.__store_dir, name + self.SUFFIX)
+
+    def put(self, recording_id, labels, probabilities=None, frame_seconds=1):
+        labels = np.asarray(labels, dtype=bool).reshape(-1)
+        if probabilities is not None:
+            probabilities = np.asarray(probabilities, dtype='<f2').reshape(-1)
+            if probabilities.shape[0] != labels.shape[0]:
+                raise ValueError(f'Count of probabilities {probabilities.shape[0]} '
+                                 f'differs from count of labels {labels.shape[0]}')
+        header = np.zeros((1,), dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['n_frames'] = labels.shape[0]
+        header['frame_seconds'] = frame_seconds
+        header['has_probabilities'] = probabilities is not None
+
+        # File is written under a temporary name, so a reader never sees a partial timeline
+        temp_path = os.path.join(self.__store_dir, f'{uuid.uuid4().hex}.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(np.packbits(labels).tobytes())
+            if probabilities is not None:
+                f.write(b'\0' * (_get_probabilities_offset(labels.shape[0]) - f.tell()))
+                f.write(probabilities.tobytes())
+        os.replace(temp_path, self.__get_path(recording_id))
+
+    def put_response(self, recording_id, res_obj):
+        """
+        Stores NN labels of a VAD reply, either 'SecondsVADLabels' or 'EncodedSecondsVADLabels'.
+        Reply without labels, e.g. of WebRTC VAD only, is not stored. Returns whether the labels are stored
+        """
+        if res_obj.get('EncodedSecondsVADLabels') is not None:
+            encoded = res_obj['EncodedSecondsVADLabels']
+            self.put(recording_id, decode_labels(encoded), frame_seconds=encoded['HopSeconds'])
+            return True
+        if res_obj.get('SecondsVADLabels') is not None:
+            self.put(recording_id, res_obj['SecondsVADLabels'])
+            return True
+        return False
+
+    def put_many(self, responses):
+        """
+        Stores labels of (recording_id, VAD reply) pairs, e.g. of batch jobs. Returns count of stored recordings
+        """
+        return sum(self.put_response(recording_id, res_obj) for recording_id, res_obj in responses)
+
+    def __open(self, recording_id):
+        path = self.__get_path(recording_id)
+        if not os.path.isfile(path):
+            return None, None
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        header = data[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise ValueError(f'Timeline of recording {recording_id} has unknown format: {path}')
+        return header, data
+
+    def get_info(self, recording_id):
+        """
+        Returns {'n_frames', 'frame_seconds', 'has_probabilities'} of the recording, None if it is not stored
+        """
+        header, _ = self.__open(recording_id)
+        if header is None:
+            return None
+        return {'n_frames': int(header['n_frames']), 'frame_seconds': float(header['frame_seconds']),
+                'has_probabilities': bool(header['has_probabilities'])}
+
+    def get_range(self, recording_id, start_seconds=0, end_seconds=None, with_probabilities=False):
+        """
+        Returns int8 labels of the frames from start_seconds to end_seconds (the end of the recording by default),
+        together with float16 probabilities if with_probabilities is set. None if the recording is not stored
+        """
+        header, data = self.__open(recording_id)
+        if header is None:
+            return None
+        n_frames = int(header['n_frames'])
+        frame_seconds = float(header['frame_seconds'])
+        start = min(max(int(start_seconds // frame_seconds), 0), n_frames)
+        end = n_frames if end_seconds is None else min(max(int(math.ceil(end_seconds / frame_seconds)), start),
+                                                       n_frames)
+
+        # Only bytes which hold the frames of the range are read and unpacked
+        first_byte = HEADER_DTYPE.itemsize + start // 8
+        last_byte = HEADER_DTYPE.itemsize + (end + 7) // 8
+        bits = np.unpackbits(data[first_byte:last_byte])
+        labels = bits[start % 8:start % 8 + end - start].astype(np.int8)
+        if not with_probabilities:
+            return labels
+
+        if not header['has_probabilities']:
+            raise ValueError(f'Probabilities of recording {recording_id} are not stored')
+        offset = _get_probabilities_offset(n_frames)
+        probabilities = np.array(data[offset + 2 * start:offset + 2 * end].view('<f2'))
+        return labels, probabilities
+
+    def get(self, recording_id):
+        """
+        Returns labels of the whole recording, None if they are not stored
+        """
+        return self.get_range(recording_id)
+
+
+def read_responses(responses_dir):
+    """
+    Reads (recording_id, VAD reply) from a directory of saved JSON replies, reply has no recording id,
+    so it is taken from the file name: <recording_id>.json
+    """
+    for name in sorted(os.listdir(responses_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(responses_dir, name), 'r') as f:
+            yield name[:-len('.json')], json.load(f)
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+
+    if len(sys.argv) == 3:
+        # Bulk load: python label_store.py <store_dir> <responses_dir>
+        n = LabelStore(sys.argv[1]).put_many(read_responses(sys.argv[2]))
+        print(f'{n} recordings are stored')
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = LabelStore(store_dir)
+        random = np.random.RandomState(0)
+        probabilities = random.uniform(0, 1, 86400).astype(np.float16)
+        labels = (probabilities >= 0.5).astype(np.int8)
+        store.put('recording', labels, probabilities)
+        print(f'Day of labels with probabilities takes '
+              f'{os.path.getsize(os.path.join(store_dir, os.listdir(store_dir)[0]))} bytes')
+
+        store = LabelStore(store_dir)
+        start_time = time.time()
+        for _ in range(1000):
+            store.get_range('recording', 36000, 36300, with_probabilities=True)
+        print(f'Query of 5 minutes takes {(time.time() - start_time) * 1000:.0f}us')
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from label_encoding import RLE_ENCODING, encode_labels
+from label_store import LabelStore, read_responses
+
+
+@pytest.fixture
+def store_dir():
+    with tempfile.TemporaryDirectory() as store_dir:
+        yield store_dir
+
+
+def test_ranges_are_read_from_packed_labels(store_dir):
+    store = LabelStore(store_dir)
+    probabilities = np.random.RandomState(0).uniform(0, 1, 1001).astype(np.float16)
+    labels = (probabilities >= 0.5).astype(np.int8)
+    store.put('recording', labels, probabilities)
+
+    for start, end in [(0, 1001), (0, 8), (7, 9), (13, 500), (999, 2000), (2000, 3000)]:
+        range_labels, range_probabilities = store.get_range('recording', start, end, with_probabilities=True)
+        assert np.array_equal(range_labels, labels[start:end])
+        assert np.array_equal(range_probabilities, probabilities[start:end])
+    assert np.array_equal(store.get('recording'), labels)
+    assert store.get('missing') is None
+
+
+def test_day_of_labels_is_read_by_a_new_store(store_dir):
+    probabilities = np.random.RandomState(0).uniform(0, 1, 86400).astype(np.float16)
+    labels = (probabilities >= 0.5).astype(np.int8)
+    LabelStore(store_dir).put('recording', labels, probabilities)
+
+    store = LabelStore(store_dir)
+    assert np.array_equal(store.get('recording'), labels)
+    assert store.get_info('recording') == {'n_frames': 86400, 'frame_seconds': 1.0, 'has_probabilities': True}
+    for start, end in [(0, 1), (3, 13), (36000, 36300), (86390, 90000), (100000, 200000)]:
+        range_labels, range_probabilities = store.get_range('recording', start, end, with_probabilities=True)
+        assert np.array_equal(range_labels, labels[start:end])
+        assert np.array_equal(range_probabilities, probabilities[start:end])
+
+
+def test_range_is_aligned_to_frames(store_dir):
+    store = LabelStore(store_dir)
+    labels = np.arange(100) % 3 == 0
+    store.put('recording', labels, frame_seconds=0.5)
+
+    assert store.get_info('recording') == {'n_frames': 100, 'frame_seconds': 0.5, 'has_probabilities': False}
+    assert np.array_equal(store.get_range('recording', 10.2, 20.1), labels[20:41])
+    with pytest.raises(ValueError):
+        store.get_range('recording', 0, 1, with_probabilities=True)
+
+
+def test_responses_are_loaded_in_bulk(store_dir):
+    responses_dir = os.path.join(store_dir, 'responses')
+    os.makedirs(responses_dir)
+    responses = {
+        'a': {'VoicedSegments': [[1, 3]], 'SecondsVADLabels': [0, 1, 1]},
+        'b': {'VoicedSegments': [[0, 1]], 'EncodedSecondsVADLabels': encode_labels([1, 0], RLE_ENCODING)},
+        'c': {'VoicedSegments': [[0.5, 1.5]]}
+    }
+    for recording_id, res_obj in responses.items():
+        with open(os.path.join(responses_dir, f'{recording_id}.json'), 'w') as f:
+            json.dump(res_obj, f)
+
+    store = LabelStore(os.path.join(store_dir, 'labels'))
+    assert store.put_many(read_responses(responses_dir)) == 2
+    assert store.get('a').tolist() == [0, 1, 1]
+    assert store.get('b').tolist() == [1, 0]
+    assert store.get('c') is None
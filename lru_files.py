@@ -0,0 +1,78 @@
+import collections
+import os
+
+
+class LruFiles:
+    """
+    Files of a directory in the order of their use with LRU eviction by total size.
+    Modification time of a file is updated on every use, so the order is restored from it after restart.
+    Pinned files are never evicted.
+    It isn't thread-safe, its owner calls it under its own lock
+    """
+    def __init__(self, directory, max_bytes):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        # File name to file size, the least recently used is the first one
+        self.__entries = collections.OrderedDict()
+        self.__pins = collections.Counter()
+        self.total_bytes = 0
+
+    def __get_path(self, name):
+        return os.path.join(self.__directory, name)
+
+    def __contains__(self, name):
+        return name in self.__entries
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def load(self, names):
+        """
+        Adds existing files of the directory in the order of their modification time
+        """
+        files = []
+        for name in names:
+            stat = os.stat(self.__get_path(name))
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.__entries[name] = size
+            self.total_bytes += size
+
+    def add(self, name, size):
+        self.total_bytes += size - self.__entries.pop(name, 0)
+        self.__entries[name] = size
+
+    def touch(self, name):
+        """
+        Marks the file as the most recently used one, returns False if it is missing
+        """
+        if name not in self.__entries:
+            return False
+        self.__entries.move_to_end(name)
+        os.utime(self.__get_path(name))
+        return True
+
+    def pin(self, name):
+        self.__pins[name] += 1
+
+    def unpin(self, name):
+        self.__pins[name] -= 1
+        if self.__pins[name] <= 0:
+            del self.__pins[name]
+
+    def evict(self):
+        """
+        Removes the least recently used files which aren't pinned until the total size fits, returns their names
+        """
+        evicted = []
+        for name in list(self.__entries.keys()):
+            if self.total_bytes <= self.__max_bytes:
+                break
+            if self.__pins[name] > 0:
+                continue
+            self.total_bytes -= self.__entries.pop(name)
+            evicted.append(name)
+            path = self.__get_path(name)
+            if os.path.isfile(path):
+                os.remove(path)
+        return evicted
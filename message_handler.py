@@ -1,13 +1,28 @@
-import ntpath
 import os
-import subprocess
-import requests
-import tempfile
 import logging
+import threading
 import yaml
-from pydub import AudioSegment
+import time
 
+import numpy as np
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import label_encoding
 import vad_extract
+import vad_regions
+from audio_decoder import AudioDecoder
+from deadline import Deadline, DeadlineExceeded
+from download_cache import DownloadCache, ScratchDir
+from downloader import HttpDownloader
+from future_chain import after
+from incremental_vad import IncrementalVad
+from label_store import LabelStore
+from pipeline import Pipeline
+from priority_lanes import Lane, get_lane
+from request_audio import RequestAudio
+from request_coalescer import RequestCoalescer, get_request_key
+from vad_decoder import get_labels_summary
 from vad_joint import VadJoint
 from webrtc_vad import WebrtcvadWrapper, VadSegmentsAdjuster
 
@@ -32,98 +47,432 @@ class VADMEssageHandler:
         # Init VAD nn service
         vad_batch_size = config['vad_batch_size']
         vad_model_path = config['vad_model']
-        self.__vad_manager = vad_extract.CNNNetVadExecutor(vad_batch_size, vad_model_path)
+        vad_chunk_seconds = config.get('vad_chunk_seconds', 0)
+        vad_max_batch_delay = config.get('vad_max_batch_delay_ms', 0) / 1000
+        vad_worker_threads = config.get('vad_worker_threads', 1)
+        result_cache_dir = config.get('result_cache_dir')
+        result_cache_max_bytes = config.get('result_cache_max_mb', 0) * (1 << 20)
+        self.__vad_manager = vad_extract.CNNNetVadExecutor(vad_batch_size, vad_model_path, vad_chunk_seconds,
+                                                           vad_max_batch_delay, vad_worker_threads,
+                                                           result_cache_dir, result_cache_max_bytes)
 
         self.__vad_joint = VadJoint()
         self.__webrtc_vad = WebrtcvadWrapper(share_voiced_samples_in_ring_buffer=0.9,  frame_duration_ms=30,
                                              padding_duration_ms=300, aggressiveness=3)
         self.__webrtc_vad_adjuster = VadSegmentsAdjuster()
+        # WebRTC VAD of a request runs here while NN VAD of the same request is inferred by the VAD worker
+        self.__webrtc_vad_pool = ThreadPoolExecutor(max_workers=config.get('webrtc_vad_threads', 4),
+                                                    thread_name_prefix='webrtc-vad')
+
+        # Labels of growing recordings are stored by RecordingId of the request
+        self.__incremental_vad = None
+        if config.get('incremental_state_dir'):
+            self.__incremental_vad = IncrementalVad(self.__vad_manager, config['incremental_state_dir'])
+
+        # NN labels of whole recordings are stored by RecordingId, windows of transactions are extracted from them
+        # by the splitter service
+        self.__label_store = None
+        if config.get('label_store_dir'):
+            self.__label_store = LabelStore(config['label_store_dir'])
+
+        # Connections to the storage are kept open between requests, bodies are streamed to disk by chunks
+        self.__downloader = HttpDownloader(pool_size=config.get('http_pool_size', 8),
+                                           connect_timeout=config.get('http_connect_timeout', 10),
+                                           read_timeout=config.get('http_read_timeout', 60))
+
+        # Downloaded files are cached by content, repeated requests for the same URL are revalidated only.
+        # Without cache every request downloads to its own scratch dir on tmpfs
+        self.__scratch_dir = config.get('scratch_dir')
+        self.__download_cache = None
+        download_cache_max_mb = config.get('download_cache_max_mb', 0)
+        if download_cache_max_mb > 0:
+            self.__download_cache = DownloadCache(config.get('download_cache_dir', '/tmp/vadnet-download-cache'),
+                                                  download_cache_max_mb * (1 << 20), self.__downloader)
+
+        # Response body is decoded while it is downloaded, no file is saved
+        self.__stream_download = config.get('stream_download', False)
+        # Decoded audio is sent to NN VAD by chunks of this duration in streaming mode
+        self.__stream_chunk_seconds = config.get('stream_chunk_seconds', 30)
+        # Audio decoded for both detectors is passed to the VAD worker in one shared block up to this size,
+        # longer audio is sent by chunks of stream_chunk_seconds, so a single request doesn't fill shared memory
+        self.__shared_audio_max_bytes = config.get('shared_audio_max_mb', 256) * (1 << 20)
+
+        # Retries of the same request which come while it is handled wait for its result
+        self.__coalescer = RequestCoalescer()
+
+        # Request without DeadlineTimestamp expires this number of seconds after its message was published.
+        # Expired request is dropped before download, in-flight one is cancelled between chunks
+        self.__request_timeout_seconds = config.get('request_timeout_seconds')
+        self.__deadline_stats_lock = threading.Lock()
+        self.__deadline_stats = {'dropped': 0, 'cancelled': 0, 'late': 0, 'wasted_seconds': 0.0}
+
+        # Request goes through download, decode, detect and join stages. Stages of consecutive requests overlap,
+        # bounded queues between them limit count of requests held in memory.
+        # Every lane has its own pipeline, so short requests don't wait behind day-long files. Lanes are ordered
+        # by max_seconds of estimated work, the last one takes the rest. Without lanes in config there is one lane
+        self.__lanes = [self.__create_lane(x, config) for x in config.get('lanes', [{'name': 'default'}])]
+        # Work of a request is estimated from Content-Length of its file, it is converted to seconds of audio
+        # by this rate. Duration is probed by the decoder if the server doesn't report the size
+        self.__lane_bytes_per_second = config.get('lane_bytes_per_second', 16000)
+        self.__lane_probe_duration = config.get('lane_probe_duration', False)
+
+        # Service logs get_stats() with this period, 0 disables it
+        self.stats_log_seconds = config.get('stats_log_seconds', 60)
+
+    def __create_lane(self, lane_config, config):
+        def get_value(key, default):
+            return lane_config.get(key, config.get(f'pipeline_{key}', default))
+
+        queue_size = get_value('queue_size', 2)
+        pipeline = Pipeline([
+            # Requests wait for their turn in the queue of downloads, they hold no data and no thread there.
+            # When it is full the AMQP worker which submits the next request blocks, so consumption pauses
+            # after all workers are blocked. 0 doesn't bound it, then amqp_prefetch_count is the only limit
+            ('download', self.__download, get_value('download_workers', 4), get_value('download_queue_size', 0)),
+            ('decode', self.__decode, get_value('decode_workers', 2), queue_size),
+            ('detect', self.__detect, get_value('detect_workers', 4), queue_size),
+            ('join', self.__join, get_value('join_workers', 1), queue_size)
+        ])
+        return Lane(lane_config['name'], lane_config.get('max_seconds'), pipeline)
+
+    def __estimate_work_seconds(self, request: '_VadRequest'):
+        if request.regions is not None and not self.__stream_download:
+            # NN VAD of the regions only, WebRTC VAD of the whole file is much cheaper
+            return sum(end - start for start, end in vad_regions.merge_regions(request.regions))
+        file_url = request.req_obj['FileUrl']
+        try:
+            content_length = self.__downloader.get_content_length(file_url)
+            request.content_length = content_length
+            if content_length is not None:
+                return content_length / self.__lane_bytes_per_second
+            if self.__lane_probe_duration:
+                with AudioDecoder(file_url) as decoder:
+                    return decoder.duration_seconds
+        except Exception as e:
+            self.__logger.warning(f'Failed to estimate work of {file_url}: {e}')
+        return None
+
+    def __get_nn_vad_second_labels_from_url(self, file_url, deadline: Deadline):
+        # Response body is piped into the decoder and decoded chunks are labeled by the VAD worker,
+        # so first labels are ready while the tail of the file is still downloading
+        with AudioDecoder(self.__downloader.iter_content(file_url)) as decoder:
+            n_chunk = int(self.__stream_chunk_seconds * decoder.sample_rate)
+
+            def on_labels(labels):
+                self.__logger.debug(f'Got {labels.shape[0]} labels of {file_url}')
+
+            seconds_stamps, probabilities = self.__vad_manager.extract_voice_from_stream(
+                decoder.chunks(n_chunk), decoder.sample_rate, with_probabilities=True, on_labels=on_labels,
+                deadline=deadline)
+        return seconds_stamps.tolist(), probabilities
+
+    def __get_nn_vad_second_labels(self, initial_file_path, deadline: Deadline, audio: RequestAudio=None,
+                                   recording_id=None):
+        """
+        Returns labels of the whole file as a list and float16 voice probabilities of the same frames
+        """
+        if audio is None and recording_id is not None and self.__incremental_vad is not None:
+            # Recording grows between requests, only its new tail is processed
+            seconds_stamps, probabilities = self.__incremental_vad.extract_voice(recording_id, initial_file_path,
+                                                                                 with_probabilities=True,
+                                                                                 deadline=deadline)
+        elif audio is None:
+            # File is decoded and converted to the model sample rate in one step by the VAD worker
+            seconds_stamps, probabilities = self.__vad_manager.extract_voice(initial_file_path, with_probabilities=True,
+                                                                             deadline=deadline)
+        elif self.__is_shared(audio):
+            # Audio is already decoded for another detector, pass it to the worker through shared memory
+            sample_rate = self.__vad_manager.get_model_sample_rate()
+            seconds_stamps, probabilities = self.__vad_manager.extract_voice_from_shared(
+                audio.get_shared_samples(sample_rate), sample_rate, with_probabilities=True, deadline=deadline)
+        else:
+            # Only a chunk at a time is placed in shared memory. Chunks are at the source sample rate,
+            # they are converted by the worker with the same result as the whole audio, see ResampleStream
+            sample_rate = audio.sample_rate
+            samples = audio.get_samples()
+            n_chunk = int(self.__stream_chunk_seconds * sample_rate)
+            chunks = (samples[i:i + n_chunk] for i in range(0, samples.shape[0], n_chunk))
+            seconds_stamps, probabilities = self.__vad_manager.extract_voice_from_stream(
+                chunks, sample_rate, with_probabilities=True, deadline=deadline)
+        return seconds_stamps.tolist(), probabilities
 
-        self.__temp_files = []
+    def __is_shared(self, audio: RequestAudio):
+        # Float32 samples at the model sample rate
+        n_bytes = audio.duration_seconds * self.__vad_manager.get_model_sample_rate() * 4
+        return n_bytes <= self.__shared_audio_max_bytes
 
-    @staticmethod
-    def __get_file_name_from_path(path):
-        head, tail = ntpath.split(path)
-        return tail or ntpath.basename(head)
+    def __get_nn_vad_region_labels(self, initial_file_path, regions, deadline: Deadline, audio: RequestAudio=None):
+        # Only the regions are decoded and inferred, labels and probabilities of the rest of the file are zeros
+        frame_seconds = self.__vad_manager.get_frame_seconds()
+        regions = vad_regions.merge_regions(regions, frame_seconds)
+        if audio is None:
+            def label_region(start_seconds, end_seconds):
+                return self.__vad_manager.extract_voice(initial_file_path, with_probabilities=True,
+                                                        start_seconds=start_seconds, end_seconds=end_seconds,
+                                                        deadline=deadline)
+        else:
+            sample_rate = self.__vad_manager.get_model_sample_rate()
+            samples = audio.get_samples(sample_rate)
 
-    @staticmethod
-    def __upload_and_save_file(file_url, out_file_path):
-        r = requests.get(file_url, allow_redirects=True)
-        open(out_file_path, 'wb').write(r.content)
+            def label_region(start_seconds, end_seconds):
+                deadline.check('VAD of the next region')
+                region_samples = samples[int(round(start_seconds * sample_rate)):int(round(end_seconds * sample_rate))]
+                return self.__vad_manager.extract_voice_from_array(region_samples, sample_rate,
+                                                                   with_probabilities=True, deadline=deadline)
 
-    @staticmethod
-    def __get_file_name_from_url(url):
-        res = url.rsplit('/', 1)[1]
+        seconds_stamps, probabilities = vad_regions.label_regions(regions, label_region, frame_seconds)
+        self.__logger.info(f'{sum(end - start for start, end in regions)} of {seconds_stamps.shape[0]} '
+                           f'frames are labeled in {len(regions)} regions')
+        return seconds_stamps.tolist(), probabilities
+
+    def __get_adjusted_webrtc_segments(self, audio: RequestAudio, req_obj, timings):
+        start_time = time.time()
+        vad_segments = self.__webrtc_vad.get_vad_segments_from_audio(audio)
+        admissions = req_obj['WebRtcAdmissions']
+        min_unvoiced_dur = req_obj['WebRtcMinimalUnvoicedWindowSeconds']
+        res = self.__webrtc_vad_adjuster.get_adjusted_segments(
+            vad_segments, audio.duration_seconds, admissions, min_unvoiced_dur)
+        timings['webrtc'] = time.time() - start_time
         return res
 
-    def __get_nn_vad_second_labels(self, initial_file_path):
-        # Convert file to wav extension
-        target_sample_rate = 44100
-        wav_file_name = self.__get_file_name_from_path(initial_file_path).replace('.mp3', '.wav')
-        wav_file_path = os.path.join(tempfile.gettempdir(), wav_file_name)
-        if not os.path.isfile(wav_file_path):
-            self.__logger.info(
-                f'TRY: Convert initial mp3 file to wav extension for NN VAD ("{initial_file_path}" -> "{wav_file_path}")')
-            process = subprocess.Popen(["sox",
-                                        initial_file_path,
-                                        '-r',
-                                        str(target_sample_rate),
-                                        wav_file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
-            logging.debug(stdout.decode('utf-8'))
-            logging.debug(stderr.decode('utf-8'))
-            assert os.path.isfile(wav_file_path)
-            self.__logger.info(f'SUCCESS: Convert initial mp3 file to wav extension for NN VAD')
-            self.__temp_files.append(wav_file_path)
-
-        seconds_stamps = self.__vad_manager.extract_voice(wav_file_path)
-        return seconds_stamps.tolist()
-
-    def get_vad_response_obj(self, req_obj):
-        def cleanup_temp_files():
-            for file_path in self.__temp_files:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+    def __download(self, request: '_VadRequest'):
+        queue_end_time = time.time()
+        request.lane.queue_seconds.observe(queue_end_time - request.arrival_time)
+        # Request may wait in the queue of the lane, so its deadline is checked right before any work
+        request.deadline.check('download')
+        request.work_start_time = queue_end_time
+        if self.__stream_download:
+            # File is downloaded by the decoder itself
+            return
+        start_time = time.time()
+        file_url = request.req_obj['FileUrl']
+        if self.__download_cache is not None:
+            request.cache_key, request.file_path = self.__download_cache.acquire(file_url)
+            request.download_cache = self.__download_cache
+        else:
+            # ffmpeg detects format by content, so the file name doesn't matter
+            request.scratch_dir = ScratchDir(self.__scratch_dir, request.content_length)
+            request.file_path = request.scratch_dir.get_file_path('source')
+            self.__logger.info(f'TRY: Save initial file to {request.file_path}')
+            self.__downloader.download_to_file(file_url, request.file_path)
+            self.__logger.info(f'SUCCESS: Initial file saved to {request.file_path}')
+        request.timings['download'] = time.time() - start_time
 
-        t = req_obj['VADType'].upper()
-        use_nn_vad = t == 'NEURAL' or t == 'NN_AND_WEBRTC'
-        use_webrtc_vad = t == 'WEBRTC' or t == 'NN_AND_WEBRTC'
-
-        # Load file from url
-        file_url = req_obj['FileUrl']
-        long_file_name = self.__get_file_name_from_url(file_url)
-        question_mark_index = long_file_name.find('?')
-        if question_mark_index > -1:
-            long_file_name = long_file_name[0:question_mark_index]
-        long_file_path = os.path.join(tempfile.gettempdir(), long_file_name)
-        if not os.path.exists(long_file_path):
-            self.__logger.info(f'TRY: Save initial file to {long_file_path}')
-            self.__upload_and_save_file(file_url, long_file_path)
-            self.__logger.info(f'SUCCESS: Initial file saved to {long_file_path}')
-            self.__temp_files.append(long_file_path)
-
-        nn_segments = []
-        nn_seconds_labels = []
-        if use_nn_vad:
-            nn_seconds_labels = self.__get_nn_vad_second_labels(long_file_path)
-            nn_segments = self.__vad_joint.convert_vad_nn_bool_result(nn_seconds_labels)
-            self.__logger.info(f'NN segments are: {nn_segments}')
-
-        adjusted_vad_segments = []
-        if use_webrtc_vad:
-            vad_segments = self.__webrtc_vad.get_vad_segments(long_file_path)
-            file_obj = AudioSegment.from_file(long_file_path)
-            admissions = req_obj['WebRtcAdmissions']
-            min_unvoiced_dur = req_obj['WebRtcMinimalUnvoicedWindowSeconds']
-            adjusted_vad_segments = self.__webrtc_vad_adjuster.get_adjusted_segments(
-                vad_segments, file_obj.duration_seconds, admissions, min_unvoiced_dur)
-            self.__logger.info(f'Adjusted VAD segments are: {adjusted_vad_segments}')
-
-        res_segments = self.__vad_joint.join_stamp_windows_list(nn_segments, adjusted_vad_segments)
+    def __decode(self, request: '_VadRequest'):
+        # WebRTC VAD needs the whole decoded file, so it is decoded once here and shared with NN VAD.
+        # File for NN VAD only is streamed by the VAD worker in bounded memory instead
+        if not request.use_webrtc_vad:
+            return
+        request.deadline.check('decode')
+        start_time = time.time()
+        if self.__stream_download:
+            request.audio = RequestAudio(self.__downloader.iter_content(request.req_obj['FileUrl']), request.deadline)
+        else:
+            request.audio = RequestAudio(request.file_path, request.deadline)
+        # Only the samples which NN VAD reads later are kept after the PCM data for WebRTC VAD is derived
+        keep_sample_rates = []
+        if request.use_nn_vad and request.regions is None and self.__is_shared(request.audio):
+            keep_sample_rates.append(self.__vad_manager.get_model_sample_rate())
+            request.audio.get_shared_samples(self.__vad_manager.get_model_sample_rate())
+        elif request.use_nn_vad and request.regions is not None:
+            keep_sample_rates.append(self.__vad_manager.get_model_sample_rate())
+            request.audio.get_samples(self.__vad_manager.get_model_sample_rate())
+        elif request.use_nn_vad:
+            # Long audio is streamed to the VAD worker at the source sample rate
+            keep_sample_rates.append(request.audio.sample_rate)
+        request.audio.get_pcm_data(self.__webrtc_vad.get_vad_sample_rate(request.audio.sample_rate))
+        request.audio.drop_samples(keep_sample_rates)
+        request.timings['decode'] = time.time() - start_time
+
+    def __detect(self, request: '_VadRequest'):
+        # Detectors are independent until the join, so WebRTC VAD runs concurrently with NN VAD.
+        # Wall time of the stage is the time of the slower detector
+        request.deadline.check('detection')
+        webrtc_future = None
+        if request.use_webrtc_vad:
+            webrtc_future = self.__webrtc_vad_pool.submit(self.__get_adjusted_webrtc_segments, request.audio,
+                                                          request.req_obj, request.timings)
+        try:
+            if request.use_nn_vad:
+                start_time = time.time()
+                if request.regions is not None and not (self.__stream_download and request.audio is None):
+                    request.nn_seconds_labels, request.nn_probabilities = self.__get_nn_vad_region_labels(
+                        request.file_path, request.regions, request.deadline, request.audio)
+                elif self.__stream_download and request.audio is None:
+                    # Body can't be sought, so the whole streamed file is labeled
+                    request.nn_seconds_labels, request.nn_probabilities = self.__get_nn_vad_second_labels_from_url(
+                        request.req_obj['FileUrl'], request.deadline)
+                else:
+                    request.nn_seconds_labels, request.nn_probabilities = self.__get_nn_vad_second_labels(
+                        request.file_path, request.deadline, request.audio, request.req_obj.get('RecordingId'))
+                request.nn_segments = self.__vad_joint.convert_vad_nn_bool_result(request.nn_seconds_labels)
+                recording_id = request.req_obj.get('RecordingId')
+                # Labels outside of regions are not inferred, so only timelines of whole recordings are stored
+                if self.__label_store is not None and recording_id is not None and request.regions is None:
+                    self.__label_store.put(recording_id, request.nn_seconds_labels, request.nn_probabilities,
+                                           frame_seconds=self.__vad_manager.get_frame_seconds())
+                request.timings['nn'] = time.time() - start_time
+                self.__logger.info(f'NN labels: {get_labels_summary(request.nn_seconds_labels)}')
+        finally:
+            if webrtc_future is not None:
+                # Audio is in use by WebRTC VAD until it is finished, even if NN VAD has failed
+                webrtc_future.exception()
+        if webrtc_future is not None:
+            request.adjusted_vad_segments = webrtc_future.result()
+            self.__logger.info(f'Adjusted VAD segments are: {request.adjusted_vad_segments}')
 
+    def __join(self, request: '_VadRequest'):
+        start_time = time.time()
+        res_segments = self.__vad_joint.join_stamp_windows_list(request.nn_segments, request.adjusted_vad_segments)
         res = {}
         res['VoicedSegments'] = res_segments
-        if len(nn_seconds_labels) > 0:
-            res['SecondsVADLabels'] = nn_seconds_labels
-        cleanup_temp_files()
-        return res
+        if len(request.nn_seconds_labels) > 0 and request.labels_encoding == label_encoding.LIST_ENCODING:
+            res['SecondsVADLabels'] = request.nn_seconds_labels
+        elif len(request.nn_seconds_labels) > 0:
+            # Day of labels is about 260 KB of JSON as a list, runs or packed bits are much smaller
+            res['EncodedSecondsVADLabels'] = label_encoding.encode_labels(
+                request.nn_seconds_labels, request.labels_encoding, self.__vad_manager.get_frame_seconds())
+        if request.with_probabilities and request.nn_probabilities is not None:
+            # Caller can re-threshold the labels with vad_decoder without running the network again
+            res['SecondsVADProbabilities'] = np.round(request.nn_probabilities.astype(np.float32), 3).tolist()
+        request.response = res
+        request.timings['join'] = time.time() - start_time
+
+    def get_stats(self):
+        """
+        Queue depth and utilisation of every pipeline stage together with VAD executor counters
+        """
+        return {
+            'lanes': {lane.name: lane.get_stats() for lane in self.__lanes},
+            'download': self.__downloader.get_stats(),
+            'download_cache': self.__download_cache.get_stats() if self.__download_cache is not None else None,
+            'vad': self.__vad_manager.get_stats(),
+            'coalescing': self.__coalescer.get_stats(),
+            'deadlines': self.__get_deadline_stats()
+        }
+
+    def __get_deadline_stats(self):
+        # Dropped requests are the saved work, time spent on cancelled and late requests is wasted
+        with self.__deadline_stats_lock:
+            return dict(self.__deadline_stats)
+
+    def __count_expired(self, name, wasted_seconds=0):
+        with self.__deadline_stats_lock:
+            self.__deadline_stats[name] += 1
+            self.__deadline_stats['wasted_seconds'] += wasted_seconds
+
+    def __get_deadline_timestamp(self, req_obj, message_timestamp):
+        if req_obj.get('DeadlineTimestamp') is not None:
+            return float(req_obj['DeadlineTimestamp'])
+        if message_timestamp and self.__request_timeout_seconds:
+            return message_timestamp + self.__request_timeout_seconds
+        return None
+
+    def get_vad_response_obj(self, req_obj, message_timestamp=None):
+        """
+        Response of identical request in flight is shared, every caller still sends its own reply.
+        Response must not be modified.
+        Raises DeadlineExceeded if the caller has given up before the response is ready. Deadline is
+        DeadlineTimestamp of the request, or is derived from message_timestamp if request_timeout_seconds is set
+        """
+        return self.submit_vad_request(req_obj, message_timestamp).result()
+
+    def submit_vad_request(self, req_obj, message_timestamp=None) -> Future:
+        """
+        Same as get_vad_response_obj(), but doesn't wait for the response: returns its Future.
+        Request waits for its turn in the queue of its lane, no thread of the caller is held meanwhile
+        """
+        deadline = Deadline(self.__get_deadline_timestamp(req_obj, message_timestamp))
+        if deadline.is_expired():
+            self.__count_expired('dropped')
+            raise DeadlineExceeded(f'Request of {req_obj["FileUrl"]} has expired in the queue')
+        # Deadline doesn't change the result, so retries with later deadlines join the request in flight
+        key = get_request_key(req_obj, ignored_fields=['DeadlineTimestamp'])
+        return self.__coalescer.submit(key, lambda: self.__submit_vad_request(req_obj, deadline), deadline)
+
+    def __submit_vad_request(self, req_obj, deadline: Deadline) -> Future:
+        request_start_time = time.time()
+        request = _VadRequest(req_obj, deadline)
+        if len(self.__lanes) > 1:
+            work_seconds = self.__estimate_work_seconds(request)
+            request.lane = get_lane(self.__lanes, work_seconds)
+            request.timings['estimate'] = time.time() - request_start_time
+            self.__logger.info(f'Request of {req_obj["FileUrl"]} goes to {request.lane.name} lane, '
+                               f'estimated work is {work_seconds}s')
+        else:
+            request.lane = self.__lanes[0]
+        request.arrival_time = time.time()
+        try:
+            # Queue of the first stage is not bounded, so the request is queued without waiting
+            future = request.lane.pipeline.submit(request)
+        except BaseException:
+            request.close()
+            raise
+        return after(future, lambda done: self.__finish_request(request, request_start_time, done))
+
+    def __finish_request(self, request: '_VadRequest', request_start_time, done: Future):
+        # Called in the thread of the last pipeline stage, or of the failed one
+        request.close()
+        error = done.exception()
+        if isinstance(error, DeadlineExceeded):
+            if request.work_start_time is None:
+                self.__count_expired('dropped')
+            else:
+                self.__count_expired('cancelled', time.time() - request.work_start_time)
+        if error is not None:
+            raise error
+        if request.deadline.is_expired():
+            # Nobody waits for the response any more
+            self.__count_expired('late', time.time() - request.work_start_time)
+
+        request.timings['total'] = time.time() - request_start_time
+        self.__logger.info('Request stages timings: ' +
+                           ', '.join(f'{k}={v:.3f}s' for k, v in request.timings.items()))
+        self.__logger.debug(f'Pipeline metrics of {request.lane.name} lane: {request.lane.pipeline.get_metrics()}')
+        return request.response
+
+
+class _VadRequest:
+    """State of a single request passed between the pipeline stages."""
+
+    def __init__(self, req_obj, deadline: Deadline):
+        self.req_obj = req_obj
+        self.deadline = deadline
+        # Time when download of the request has started, None while it waits in the queue
+        self.work_start_time = None
+        self.lane = None
+        self.arrival_time = None
+        t = req_obj['VADType'].upper()
+        self.use_nn_vad = t == 'NEURAL' or t == 'NN_AND_WEBRTC'
+        self.use_webrtc_vad = t == 'WEBRTC' or t == 'NN_AND_WEBRTC'
+        self.labels_encoding = req_obj.get('LabelsEncoding', label_encoding.LIST_ENCODING)
+        if self.labels_encoding not in [label_encoding.LIST_ENCODING, label_encoding.RLE_ENCODING,
+                                        label_encoding.BITS_ENCODING]:
+            raise ValueError(f'Unknown labels encoding: {self.labels_encoding}')
+        # Voice probability of every NN label is added to the response
+        self.with_probabilities = bool(req_obj.get('WithProbabilities', False))
+        # Time ranges of interest for NN VAD, None if the whole file is labeled
+        self.regions = vad_regions.get_regions(req_obj)
+        # Requests are handled concurrently, so every request has its own scratch dir or pinned cached file
+        self.scratch_dir = None
+        self.download_cache = None
+        self.cache_key = None
+        self.file_path = None
+        # Size of the file reported by the server, None if it is unknown
+        self.content_length = None
+        self.audio = None
+        self.nn_segments = []
+        self.nn_seconds_labels = []
+        # Float16 voice probabilities of nn_seconds_labels
+        self.nn_probabilities = None
+        self.adjusted_vad_segments = []
+        self.response = None
+        self.timings = {}
+
+    def close(self):
+        if self.audio is not None:
+            self.audio.close()
+        if self.download_cache is not None:
+            self.download_cache.release(self.cache_key)
+        if self.scratch_dir is not None:
+            self.scratch_dir.close()
@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+
+class _Stage:
+    """Workers of one pipeline stage and its input queue."""
+
+    def __init__(self, name, handler, n_workers, queue_size):
+        self.name = name
+        self.handler = handler
+        self.n_workers = n_workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next = None
+        self.lock = threading.Lock()
+        self.n_busy = 0
+        self.n_processed = 0
+        self.n_failed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.threads = []
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages. Every stage has its own workers and a bounded input queue,
+    so stages of consecutive items overlap: item N+1 is downloaded while item N is decoded.
+    When a queue is full the previous stage blocks on it and submit() blocks on the first one,
+    so the pipeline never holds more items than its queues and workers can take.
+    Stage handler gets the item and returns nothing, result of the item is the item itself.
+    """
+    def __init__(self, stages):
+        """
+        stages is a list of (name, handler, n_workers, queue_size)
+        """
+        self.__stages = [_Stage(*x) for x in stages]
+        for stage, next_stage in zip(self.__stages, self.__stages[1:]):
+            stage.next = next_stage
+        self.__start_time = time.time()
+        self.__closed = False
+
+        for stage in self.__stages:
+            for i in range(stage.n_workers):
+                thread = threading.Thread(target=self.__run_worker, args=(stage,), name=f'{stage.name}-{i}',
+                                          daemon=True)
+                thread.start()
+                stage.threads.append(thread)
+
+    def submit(self, item) -> Future:
+        """
+        Puts item into the first stage. Blocks while the first queue is full
+        """
+        if self.__closed:
+            raise RuntimeError('Pipeline is closed')
+        future = Future()
+        self.__stages[0].queue.put((item, future, time.time()))
+        return future
+
+    def __run_worker(self, stage: _Stage):
+        while True:
+            task = stage.queue.get()
+            if task is None:
+                break
+            item, future, enqueue_time = task
+
+            start_time = time.time()
+            with stage.lock:
+                stage.n_busy += 1
+                stage.wait_seconds += start_time - enqueue_time
+            error = None
+            try:
+                stage.handler(item)
+            except Exception as e:
+                error = e
+            end_time = time.time()
+            with stage.lock:
+                stage.n_busy -= 1
+                stage.busy_seconds += end_time - start_time
+                stage.n_processed += 1
+                if error is not None:
+                    stage.n_failed += 1
+
+            if error is not None:
+                future.set_exception(error)
+            elif stage.next is None:
+                future.set_result(item)
+            else:
+                # Blocks while the next stage is overloaded, this is the backpressure
+                stage.next.queue.put((item, future, time.time()))
+
+    def get_metrics(self):
+        """
+        Per stage counters. Utilisation is the share of time workers of the stage were busy since start,
+        a stage with high utilisation and a deep queue needs more workers
+        """
+        elapsed = time.time() - self.__start_time
+        res = {}
+        for stage in self.__stages:
+            with stage.lock:
+                busy_seconds = stage.busy_seconds
+                res[stage.name] = {
+                    'workers': stage.n_workers,
+                    'busy_workers': stage.n_busy,
+                    'queue_depth': stage.queue.qsize(),
+                    'queue_size': stage.queue.maxsize,
+                    'processed': stage.n_processed,
+                    'failed': stage.n_failed,
+                    'utilisation': busy_seconds / (elapsed * stage.n_workers) if elapsed > 0 else 0.0,
+                    'mean_seconds': busy_seconds / stage.n_processed if stage.n_processed else 0.0,
+                    'mean_queue_seconds': stage.wait_seconds / stage.n_processed if stage.n_processed else 0.0
+                }
+        return res
+
+    def close(self):
+        """Stops workers after the items which are already submitted are processed"""
+        self.__closed = True
+        for stage in self.__stages:
+            for _ in stage.threads:
+                stage.queue.put(None)
+            for thread in stage.threads:
+                thread.join()
+
+
+if __name__ == '__main__':
+    def make_stage(seconds):
+        def handler(item):
+            time.sleep(seconds)
+        return handler
+
+    # Stages overlap: 5 items through 3 stages of 0.1s take about (5 + 2) * 0.1s instead of 15 * 0.1s
+    pipeline = Pipeline([('download', make_stage(0.1), 1, 1),
+                         ('decode', make_stage(0.1), 1, 1),
+                         ('detect', make_stage(0.1), 1, 1)])
+    start_time = time.time()
+    for future in [pipeline.submit({'id': i}) for i in range(5)]:
+        future.result()
+    print(f'Pipeline of 5 items takes {time.time() - start_time:.2f}s')
+    pipeline.close()
+    print(pipeline.get_metrics())
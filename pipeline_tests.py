@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def make_stage(name, seconds=0.0, order=None):
+    def handler(item):
+        time.sleep(seconds)
+        if order is not None:
+            order.append((name, item['id']))
+        item[name] = True
+    return handler
+
+
+def test_items_pass_all_stages_in_order():
+    order = []
+    pipeline = Pipeline([('download', make_stage('download', order=order), 1, 1),
+                         ('decode', make_stage('decode', order=order), 1, 1)])
+    results = [f.result() for f in [pipeline.submit({'id': i}) for i in range(3)]]
+    pipeline.close()
+    assert all(x['download'] and x['decode'] for x in results)
+    for i in range(3):
+        assert order.index(('download', i)) < order.index(('decode', i))
+    metrics = pipeline.get_metrics()
+    assert metrics['download']['processed'] == 3
+    assert metrics['decode']['processed'] == 3
+
+
+def test_stages_of_consecutive_items_overlap():
+    pipeline = Pipeline([('download', make_stage('download', 0.1), 1, 1),
+                         ('decode', make_stage('decode', 0.1), 1, 1),
+                         ('detect', make_stage('detect', 0.1), 1, 1)])
+    start_time = time.time()
+    for future in [pipeline.submit({'id': i}) for i in range(5)]:
+        future.result()
+    elapsed = time.time() - start_time
+    pipeline.close()
+    # (5 + 2) * 0.1s when stages overlap, 15 * 0.1s otherwise
+    assert elapsed < 1.2, elapsed
+
+
+def test_error_of_a_stage_fails_the_item_and_skips_next_stages():
+    def fail(item):
+        if item['id'] == 1:
+            raise ValueError('broken')
+
+    order = []
+    pipeline = Pipeline([('download', fail, 1, 1), ('decode', make_stage('decode', order=order), 1, 1)])
+    futures = [pipeline.submit({'id': i}) for i in range(3)]
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert futures[0].result()['decode'] and futures[2].result()['decode']
+    pipeline.close()
+    assert ('decode', 1) not in order
+    assert pipeline.get_metrics()['download']['failed'] == 1
+
+
+def test_full_queue_blocks_submit():
+    release = threading.Event()
+    pipeline = Pipeline([('download', lambda item: release.wait(), 1, 1)])
+    # One item is taken by the worker and one waits in the queue
+    futures = [pipeline.submit({'id': i}) for i in range(2)]
+    time.sleep(0.05)
+    submitted = threading.Event()
+    thread = threading.Thread(target=lambda: (pipeline.submit({'id': 2}), submitted.set()))
+    thread.start()
+    assert not submitted.wait(0.1)
+    release.set()
+    thread.join()
+    for future in futures:
+        future.result()
+    pipeline.close()
+    with pytest.raises(RuntimeError):
+        pipeline.submit({'id': 3})
@@ -0,0 +1,72 @@
+import bisect
+import threading
+
+
+# Upper bounds of queue time buckets in seconds, the last bucket is unbounded
+DEFAULT_QUEUE_SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600)
+
+
+class Histogram:
+    """
+    Counts of observed values by buckets with fixed upper bounds, together with their count and sum.
+    Histogram is thread-safe
+    """
+    def __init__(self, buckets=DEFAULT_QUEUE_SECONDS_BUCKETS):
+        self.__buckets = list(buckets)
+        self.__lock = threading.Lock()
+        # Last count is of the values above the last bound
+        self.__counts = [0] * (len(self.__buckets) + 1)
+        self.__count = 0
+        self.__sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.__buckets, value)
+        with self.__lock:
+            self.__counts[i] += 1
+            self.__count += 1
+            self.__sum += value
+
+    def get(self):
+        """
+        Returns {'buckets': [[upper_bound, cumulative_count], ...], 'count', 'sum'}, the last bound is None
+        """
+        with self.__lock:
+            counts = list(self.__counts)
+            res = {'count': self.__count, 'sum': self.__sum}
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.__buckets + [None], counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        res['buckets'] = buckets
+        return res
+
+
+class Lane:
+    """
+    Share of workers for requests of estimated work up to max_seconds of audio, None for the lane without limit.
+    Requests of different lanes don't wait for each other
+    """
+    def __init__(self, name, max_seconds, pipeline):
+        self.name = name
+        self.max_seconds = max_seconds
+        self.pipeline = pipeline
+        # Time from the arrival of a request to the start of its download
+        self.queue_seconds = Histogram()
+
+    def get_stats(self):
+        return {'max_seconds': self.max_seconds, 'queue_seconds': self.queue_seconds.get(),
+                'pipeline': self.pipeline.get_metrics()}
+
+
+def get_lane(lanes, work_seconds):
+    """
+    Returns the first of lanes ordered by max_seconds which fits work_seconds.
+    Request of unknown work goes to the last lane, it is the lane of the longest requests
+    """
+    if work_seconds is None:
+        return lanes[-1]
+    for lane in lanes:
+        if lane.max_seconds is None or work_seconds <= lane.max_seconds:
+            return lane
+    return lanes[-1]
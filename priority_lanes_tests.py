@@ -0,0 +1,20 @@
+from priority_lanes import Histogram, Lane, get_lane
+
+
+def test_histogram_counts_values_by_buckets():
+    histogram = Histogram(buckets=[1, 10])
+    for value in [0.5, 1, 2, 10, 11, 100]:
+        histogram.observe(value)
+
+    assert histogram.get() == {'buckets': [[1, 2], [10, 4], [None, 6]], 'count': 6, 'sum': 124.5}
+
+
+def test_request_goes_to_the_first_lane_which_fits():
+    lanes = [Lane('short', 60, None), Lane('medium', 3600, None), Lane('long', None, None)]
+
+    assert get_lane(lanes, 10).name == 'short'
+    assert get_lane(lanes, 60).name == 'short'
+    assert get_lane(lanes, 61).name == 'medium'
+    assert get_lane(lanes, 36000).name == 'long'
+    assert get_lane(lanes, None).name == 'long'
+    assert get_lane(lanes[:2], 36000).name == 'medium'
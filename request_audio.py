@@ -0,0 +1,125 @@
+import threading
+import time
+
+import numpy as np
+
+from audio_decoder import AudioDecoder
+from deadline import Deadline
+from resampler import resample
+from shared_buffer import SharedArray
+
+
+class RequestAudio:
+    """
+    Audio of a single request. Source is decoded once on first use, all views are derived from the decoded samples
+    lazily and cached: float samples at any sample rate (resampled once per rate), the same samples placed in
+    shared memory for the VAD worker and 16 bit PCM for webrtcvad.
+    Once the views a request needs are derived, float samples it doesn't need any more are freed by drop_samples(),
+    so the request doesn't hold every view of the file at once.
+    Shared memory is released by close().
+    If deadline is set decoding and resampling raise DeadlineExceeded once it has passed.
+    """
+    def __init__(self, source, deadline: Deadline=None):
+        self.__source = source
+        self.__deadline = deadline if deadline is not None else Deadline()
+        self.__lock = threading.RLock()
+        self.__sample_rate = None
+        self.__n_samples = None
+        self.__samples = {}
+        self.__shared_samples = {}
+        self.__pcm_data = {}
+        self.__decode_seconds = None
+
+    def __decode(self):
+        if self.__sample_rate is not None:
+            return
+        start_time = time.time()
+        with AudioDecoder(self.__source) as decoder:
+            samples = decoder.read_all(self.__deadline)
+            self.__sample_rate = decoder.sample_rate
+        self.__samples[self.__sample_rate] = samples
+        self.__n_samples = samples.shape[0]
+        self.__decode_seconds = time.time() - start_time
+
+    @property
+    def sample_rate(self):
+        """Sample rate of the source"""
+        with self.__lock:
+            self.__decode()
+            return self.__sample_rate
+
+    @property
+    def duration_seconds(self):
+        with self.__lock:
+            self.__decode()
+            return self.__n_samples / self.__sample_rate
+
+    @property
+    def decode_seconds(self):
+        """Time spent on decoding, None if the source is not decoded yet"""
+        return self.__decode_seconds
+
+    def get_samples(self, sample_rate=None):
+        """Mono float32 samples in [-1, 1) at sample_rate, the source sample rate is used by default"""
+        with self.__lock:
+            self.__decode()
+            if sample_rate is None:
+                sample_rate = self.__sample_rate
+            if sample_rate not in self.__samples:
+                if self.__sample_rate not in self.__samples:
+                    raise RuntimeError(f'Samples are dropped, they can not be resampled to {sample_rate}')
+                self.__deadline.check('resampling')
+                self.__samples[sample_rate] = resample(self.__samples[self.__sample_rate], self.__sample_rate,
+                                                       sample_rate)
+            return self.__samples[sample_rate]
+
+    def get_shared_samples(self, sample_rate=None) -> SharedArray:
+        """Same as get_samples(), but placed in shared memory, so they are passed to the VAD worker without a copy"""
+        with self.__lock:
+            samples = self.get_samples(sample_rate)
+            if sample_rate is None:
+                sample_rate = self.__sample_rate
+            if sample_rate not in self.__shared_samples:
+                shared = SharedArray.from_array(samples)
+                self.__shared_samples[sample_rate] = shared
+                # Keep a single copy of the samples
+                self.__samples[sample_rate] = shared.array
+            return self.__shared_samples[sample_rate]
+
+    def get_pcm_data(self, sample_rate=None) -> bytes:
+        """16 bit mono PCM audio data at sample_rate"""
+        with self.__lock:
+            if sample_rate is None:
+                sample_rate = self.sample_rate
+            if sample_rate not in self.__pcm_data:
+                samples = self.get_samples(sample_rate)
+                self.__pcm_data[sample_rate] = np.clip(np.round(samples * 32768), -32768, 32767)\
+                    .astype(np.int16).tobytes()
+            return self.__pcm_data[sample_rate]
+
+    def drop_samples(self, keep_sample_rates=()):
+        """
+        Frees float samples at sample rates other than keep_sample_rates, including the source ones.
+        Derived PCM data, shared samples and duration are kept, dropped samples can't be derived again
+        """
+        with self.__lock:
+            self.__decode()
+            for sample_rate in list(self.__samples.keys()):
+                if sample_rate not in keep_sample_rates and sample_rate not in self.__shared_samples:
+                    del self.__samples[sample_rate]
+
+    def close(self):
+        with self.__lock:
+            for shared in self.__shared_samples.values():
+                shared.unlink()
+            self.__shared_samples = {}
+            self.__samples = {}
+            self.__pcm_data = {}
+            self.__sample_rate = None
+            self.__n_samples = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
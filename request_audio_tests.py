@@ -0,0 +1,60 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from request_audio import RequestAudio
+from resampler import resample
+
+
+SAMPLE_RATE = 22050
+
+
+def get_wav_bytes(samples):
+    res = io.BytesIO()
+    with wave.open(res, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.astype(np.int16).tobytes())
+    return res.getvalue()
+
+
+@pytest.fixture
+def wav_path(tmp_path):
+    samples = np.random.RandomState(0).uniform(-1, 1, 2 * SAMPLE_RATE) * 32767
+    path = tmp_path / 'audio.wav'
+    path.write_bytes(get_wav_bytes(samples))
+    return str(path)
+
+
+def test_views_are_derived_from_one_decode(wav_path):
+    with RequestAudio(wav_path) as audio:
+        assert audio.sample_rate == SAMPLE_RATE
+        assert audio.duration_seconds == 2
+        samples = audio.get_samples()
+        assert audio.get_samples(48000) is audio.get_samples(48000)
+        assert np.array_equal(audio.get_samples(48000), resample(samples, SAMPLE_RATE, 48000))
+        pcm = np.frombuffer(audio.get_pcm_data(), dtype=np.int16)
+        assert np.array_equal(pcm, np.round(samples * 32768).astype(np.int16))
+
+
+def test_dropped_samples_are_freed_and_derived_views_are_kept(wav_path):
+    with RequestAudio(wav_path) as audio:
+        pcm = audio.get_pcm_data(16000)
+        shared = audio.get_shared_samples(48000)
+        audio.drop_samples()
+        assert audio.duration_seconds == 2
+        assert audio.get_pcm_data(16000) is pcm
+        assert audio.get_samples(48000) is shared.array
+        with pytest.raises(RuntimeError):
+            audio.get_samples()
+
+
+def test_kept_samples_stay(wav_path):
+    with RequestAudio(wav_path) as audio:
+        samples = audio.get_samples()
+        audio.get_pcm_data(16000)
+        audio.drop_samples([SAMPLE_RATE])
+        assert audio.get_samples() is samples
@@ -0,0 +1,108 @@
+import json
+import threading
+
+from concurrent.futures import Future
+
+from deadline import Deadline, DeadlineExceeded
+from future_chain import call, copy_future
+
+
+def get_request_key(req_obj, ignored_fields=()):
+    """
+    Requests with the same FileUrl and parameters have the same key, order of fields doesn't matter.
+    Fields which don't change the result are passed in ignored_fields
+    """
+    return json.dumps({k: v for k, v in req_obj.items() if k not in ignored_fields}, sort_keys=True)
+
+
+class RequestCoalescer:
+    """
+    Runs a single computation for identical requests which are handled at the same time.
+    Requests which come while the computation of their key is in flight wait for it and get the same result
+    or exception, instead of downloading and inferring the same file again. Nothing is kept after the computation
+    is finished, so it is not a cache: a request that comes later is computed again.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # Key to (Future, Deadline) of the computation in flight
+        self.__in_flight = {}
+        self.__stats = {'computed': 0, 'coalesced': 0}
+
+    def __join(self, key, start, deadline: Deadline):
+        """
+        Starts the computation of the key with start() if none is in flight, otherwise joins the one in flight.
+        Returns (Future of the computation, is_leader)
+        """
+        with self.__lock:
+            future, leader_deadline = self.__in_flight.get(key, (None, None))
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self.__in_flight[key] = (future, deadline)
+                self.__stats['computed'] += 1
+            else:
+                if leader_deadline is not None:
+                    leader_deadline.extend(deadline.timestamp if deadline is not None else None)
+                self.__stats['coalesced'] += 1
+        if not is_leader:
+            return future, False
+
+        def on_done(computation):
+            # Requests which come after this start a new computation
+            with self.__lock:
+                del self.__in_flight[key]
+            copy_future(computation, future)
+
+        try:
+            computation = start()
+        except BaseException as e:
+            computation = Future()
+            computation.set_exception(e)
+        computation.add_done_callback(on_done)
+        return future, True
+
+    @staticmethod
+    def __should_compute_again(future, deadline: Deadline):
+        # Parts of the computation which have already started (e.g. a job of the VAD worker) don't see extensions
+        # of the deadline, so the computation may be cancelled while the waiting request still needs the result
+        return isinstance(future.exception(), DeadlineExceeded) and not (deadline is not None and deadline.is_expired())
+
+    def run(self, key, compute, deadline: Deadline=None):
+        """
+        Returns compute() of the first request with the key, later requests with the same key wait for it.
+        Deadline of the first request is extended by deadlines of the later ones, so a retry keeps the computation
+        alive after the original caller has given up. If the computation is cancelled by its original deadline
+        anyway, a waiting request whose own deadline has not passed runs it again instead of failing with
+        DeadlineExceeded.
+        Result is shared by the requests, so it must not be modified
+        """
+        while True:
+            future, is_leader = self.__join(key, lambda: call(compute), deadline)
+            if is_leader or not self.__should_compute_again(future, deadline):
+                return future.result()
+
+    def submit(self, key, start, deadline: Deadline=None) -> Future:
+        """
+        Same as run(), but doesn't block: start() starts the computation and returns its Future.
+        Returns Future of the result, a repeated computation is started in the thread which has finished the
+        cancelled one
+        """
+        future, is_leader = self.__join(key, start, deadline)
+        if is_leader:
+            return future
+        res = Future()
+
+        def on_done(done):
+            if self.__should_compute_again(done, deadline):
+                self.submit(key, start, deadline).add_done_callback(lambda x: copy_future(x, res))
+            else:
+                copy_future(done, res)
+
+        future.add_done_callback(on_done)
+        return res
+
+    def get_stats(self):
+        with self.__lock:
+            res = dict(self.__stats)
+            res['in_flight'] = len(self.__in_flight)
+            return res
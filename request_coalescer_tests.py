@@ -0,0 +1,174 @@
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded
+from request_coalescer import RequestCoalescer, get_request_key
+
+
+def test_identical_requests_in_flight_are_computed_once():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {'VoicedSegments': [[0, 1]]}
+
+    key = get_request_key({'FileUrl': 'http://storage/a.mp3', 'VADType': 'NEURAL'})
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(coalescer.run, key, compute)
+        started.wait()
+        followers = [pool.submit(coalescer.run, key, compute) for _ in range(3)]
+        while coalescer.get_stats()['coalesced'] < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [leader.result()] + [x.result() for x in followers]
+
+    assert len(calls) == 1
+    assert all(x == {'VoicedSegments': [[0, 1]]} for x in results)
+    assert coalescer.get_stats() == {'computed': 1, 'coalesced': 3, 'in_flight': 0}
+
+    # Finished computation is not reused
+    coalescer.run(key, compute)
+    assert len(calls) == 2
+
+
+def test_failure_is_passed_to_waiting_requests():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait()
+        raise FileNotFoundError
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(coalescer.run, 'key', compute)
+        started.wait()
+        follower = pool.submit(coalescer.run, 'key', compute)
+        while coalescer.get_stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        for future in [leader, follower]:
+            with pytest.raises(FileNotFoundError):
+                future.result()
+
+
+def test_key_depends_on_parameters_only():
+    a = get_request_key({'FileUrl': 'http://storage/a.mp3', 'VADType': 'NEURAL'})
+    assert a == get_request_key({'VADType': 'NEURAL', 'FileUrl': 'http://storage/a.mp3'})
+    assert a != get_request_key({'FileUrl': 'http://storage/a.mp3', 'VADType': 'WEBRTC'})
+    assert a == get_request_key({'FileUrl': 'http://storage/a.mp3', 'VADType': 'NEURAL', 'DeadlineTimestamp': 1},
+                                ignored_fields=['DeadlineTimestamp'])
+
+
+def test_deadline_is_extended_by_waiting_requests():
+    coalescer = RequestCoalescer()
+    release = threading.Event()
+    leader_deadline = Deadline(1000)
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        leader = pool.submit(coalescer.run, 'key', release.wait, leader_deadline)
+        while coalescer.get_stats()['in_flight'] < 1:
+            time.sleep(0.001)
+        followers = [pool.submit(coalescer.run, 'key', release.wait, Deadline(2000))]
+        while coalescer.get_stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        assert leader_deadline.timestamp == 2000
+
+        # Request without deadline keeps the computation alive for good
+        followers.append(pool.submit(coalescer.run, 'key', release.wait))
+        while coalescer.get_stats()['coalesced'] < 2:
+            time.sleep(0.001)
+        assert leader_deadline.timestamp is None
+        release.set()
+        for future in [leader] + followers:
+            future.result()
+
+
+def test_waiting_request_computes_again_if_computation_expires_before_its_deadline():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def get_compute(name):
+        def compute():
+            calls.append(name)
+            started.set()
+            release.wait()
+            if len(calls) == 1:
+                # Job which has started with the original deadline doesn't see its extension
+                raise DeadlineExceeded('Deadline passed before inference')
+            return {'VoicedSegments': [[0, 1]]}
+        return compute
+
+    leader_deadline = Deadline(time.time() + 1000)
+    follower_deadline = Deadline(time.time() + 2000)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(coalescer.run, 'key', get_compute('leader'), leader_deadline)
+        started.wait()
+        follower = pool.submit(coalescer.run, 'key', get_compute('follower'), follower_deadline)
+        while coalescer.get_stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        with pytest.raises(DeadlineExceeded):
+            leader.result()
+        assert follower.result() == {'VoicedSegments': [[0, 1]]}
+
+    assert calls == ['leader', 'follower']
+    assert coalescer.get_stats() == {'computed': 2, 'coalesced': 1, 'in_flight': 0}
+
+
+def test_expired_waiting_request_gets_deadline_exceeded():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait()
+        raise DeadlineExceeded('Deadline passed before inference')
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(coalescer.run, 'key', compute, Deadline(time.time() + 1000))
+        started.wait()
+        follower = pool.submit(coalescer.run, 'key', compute, Deadline(time.time() - 1))
+        while coalescer.get_stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        for future in [leader, follower]:
+            with pytest.raises(DeadlineExceeded):
+                future.result()
+    assert coalescer.get_stats()['computed'] == 1
+
+
+def test_submitted_requests_wait_for_computation_without_blocking():
+    coalescer = RequestCoalescer()
+    computations = []
+
+    def start():
+        computations.append(Future())
+        return computations[-1]
+
+    leader = coalescer.submit('key', start, Deadline(time.time() + 1000))
+    follower = coalescer.submit('key', start, Deadline(time.time() + 2000))
+    assert len(computations) == 1 and not follower.done()
+
+    # Computation cancelled by the original deadline is started again for the follower
+    computations[0].set_exception(DeadlineExceeded('Deadline passed before inference'))
+    with pytest.raises(DeadlineExceeded):
+        leader.result(timeout=0)
+    assert len(computations) == 2 and not follower.done()
+
+    computations[1].set_result({'VoicedSegments': [[0, 1]]})
+    assert follower.result(timeout=0) == {'VoicedSegments': [[0, 1]]}
+    assert coalescer.get_stats() == {'computed': 2, 'coalesced': 1, 'in_flight': 0}
@@ -0,0 +1,152 @@
+import functools
+import math
+import time
+
+import numpy as np
+
+
+# Parameters of the windowed sinc low pass filter
+ZERO_CROSSINGS = 16
+ROLLOFF = 0.945
+KAISER_BETA = 8.6
+
+# Count of output samples computed at once. Bounds temporary memory of the filtering
+BLOCK_SAMPLES = 1 << 16
+
+
+@functools.lru_cache(maxsize=None)
+def get_filter_bank(src_rate: int, dst_rate: int):
+    """
+    Designs polyphase filter bank for conversion from src_rate to dst_rate.
+    Bank is computed once per rate pair and cached.
+    Returns (up, down, bank, delay): bank[p] are the taps of phase p in reversed order
+    and delay is the filter delay in samples of the upsampled signal.
+    """
+    gcd = math.gcd(src_rate, dst_rate)
+    up = dst_rate // gcd
+    down = src_rate // gcd
+
+    ratio = max(up, down)
+    half = ZERO_CROSSINGS * ratio
+    n_taps = 2 * half + 1
+    cutoff = ROLLOFF / ratio
+    t = np.arange(n_taps) - half
+    # Gain of up compensates zeros inserted between input samples
+    h = up * cutoff * np.sinc(cutoff * t) * np.kaiser(n_taps, KAISER_BETA)
+
+    n_phase_taps = -(-n_taps // up)
+    h = np.concatenate([h, np.zeros(n_phase_taps * up - n_taps)])
+    # bank[p, i] = h[p + i * up], reversed so that phase taps can be applied to a forward window of the input
+    bank = h.reshape(n_phase_taps, up).T[:, ::-1]
+    return up, down, np.ascontiguousarray(bank, dtype=np.float32), half
+
+
+class ResampleStream:
+    """
+    Converts a signal from src_rate to dst_rate chunk by chunk.
+    Output of a stream is equal to the output of resample() for the whole signal, however the input is split
+    into chunks: the filter is applied to blocks of BLOCK_SAMPLES outputs at fixed positions of the output,
+    so a block which isn't complete yet is computed by a later call.
+    """
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.__bypass = src_rate == dst_rate
+        if self.__bypass:
+            return
+
+        self.__up, self.__down, self.__bank, self.__delay = get_filter_bank(src_rate, dst_rate)
+        n_phase_taps = self.__bank.shape[1]
+        # Signal is zero before the first sample. Buffer starts at global input index self.__offset
+        self.__buffer = np.zeros((n_phase_taps - 1,), dtype=np.float32)
+        self.__offset = -(n_phase_taps - 1)
+        self.__n_in = 0
+        self.__n_out = 0
+
+    def __get_base_index(self, n):
+        # Index of the newest input sample used for output sample n
+        return (n * self.__down + self.__delay) // self.__up
+
+    def __filter(self, n_end):
+        up = self.__up
+        down = self.__down
+        bank = self.__bank
+        n_phase_taps = bank.shape[1]
+        buffer = self.__buffer
+        item_size = buffer.itemsize
+
+        res = np.empty((max(0, n_end - self.__n_out),), dtype=np.float32)
+        for block_start in range(self.__n_out, n_end, BLOCK_SAMPLES):
+            block_end = min(block_start + BLOCK_SAMPLES, n_end)
+            out = res[block_start - self.__n_out:block_end - self.__n_out]
+            # Outputs with equal index modulo up use the same phase and their inputs are down samples apart
+            for r in range(min(up, block_end - block_start)):
+                n = block_start + r
+                n_rows = -(-(block_end - n) // up)
+                base = self.__get_base_index(n)
+                phase = (n * down + self.__delay) % up
+                start = base - (n_phase_taps - 1) - self.__offset
+                windows = np.lib.stride_tricks.as_strided(buffer[start:], shape=(n_rows, n_phase_taps),
+                                                          strides=(down * item_size, item_size))
+                out[r::up] = windows @ bank[phase]
+
+        self.__n_out = max(self.__n_out, n_end)
+        # Drop inputs which are not needed for next outputs any more
+        keep_from = self.__get_base_index(self.__n_out) - (n_phase_taps - 1) - self.__offset
+        if keep_from > 0:
+            self.__buffer = buffer[keep_from:].copy()
+            self.__offset += keep_from
+        return res
+
+    def process(self, chunk):
+        if self.__bypass:
+            return chunk
+
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        self.__buffer = np.concatenate([self.__buffer, chunk])
+        self.__n_in += chunk.shape[0]
+        # Only outputs which have all their inputs available can be computed, a partial block waits for flush()
+        n_end = (self.__n_in * self.__up - 1 - self.__delay) // self.__down + 1
+        n_end = n_end // BLOCK_SAMPLES * BLOCK_SAMPLES
+        return self.__filter(n_end)
+
+    def flush(self):
+        if self.__bypass:
+            return np.zeros((0,), dtype=np.float32)
+
+        # Signal is zero after the last sample
+        n_total = -(-self.__n_in * self.__up // self.__down)
+        n_pad = self.__get_base_index(n_total) + 1 - (self.__offset + self.__buffer.shape[0])
+        if n_pad > 0:
+            self.__buffer = np.concatenate([self.__buffer, np.zeros((n_pad,), dtype=np.float32)])
+        return self.__filter(n_total)
+
+
+def resample(x, src_rate: int, dst_rate: int):
+    """
+    Converts a signal from src_rate to dst_rate in a single step. Signal is returned as is if the rates match
+    """
+    if src_rate == dst_rate:
+        return x
+    stream = ResampleStream(src_rate, dst_rate)
+    return np.concatenate([stream.process(x), stream.flush()])
+
+
+if __name__ == '__main__':
+    src_rate = 44100
+    dst_rate = 48000
+
+    # Benchmark on one hour of audio
+    x = np.random.RandomState(0).uniform(-1, 1, src_rate * 3600).astype(np.float32)
+    start_time = time.time()
+    resample(x, src_rate, dst_rate)
+    print(f'Polyphase: 1h {src_rate}->{dst_rate} takes {time.time() - start_time:.2f}s')
+    start_time = time.time()
+    get_filter_bank.cache_clear()
+    get_filter_bank(src_rate, dst_rate)
+    print(f'Polyphase: filter bank design takes {time.time() - start_time:.4f}s (cached afterwards)')
+    try:
+        import librosa as lr
+        start_time = time.time()
+        lr.resample(x, src_rate, dst_rate, res_type='kaiser_best')
+        print(f'librosa kaiser_best: 1h {src_rate}->{dst_rate} takes {time.time() - start_time:.2f}s')
+    except ImportError:
+        print('librosa is not installed, skip kaiser_best benchmark')
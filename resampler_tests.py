@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from resampler import ResampleStream, get_filter_bank, resample
+
+
+def test_tone_in_pass_band_is_kept():
+    src_rate = 44100
+    dst_rate = 48000
+    t = np.arange(src_rate) / src_rate
+    y = resample(np.sin(2 * np.pi * 1000 * t).astype(np.float32), src_rate, dst_rate)
+    assert y.shape[0] == dst_rate
+    ref = np.sin(2 * np.pi * 1000 * np.arange(dst_rate) / dst_rate)
+    assert np.max(np.abs(y[1000:-1000] - ref[1000:-1000])) < 1e-3
+
+
+@pytest.mark.parametrize('rates', [(44100, 48000), (48000, 16000), (16000, 48000), (22050, 48000), (8000, 48000)])
+def test_stream_output_does_not_depend_on_chunking(rates):
+    random = np.random.RandomState(0)
+    x = random.uniform(-1, 1, 300007).astype(np.float32)
+    whole = resample(x, *rates)
+    assert whole.shape[0] == -(-x.shape[0] * rates[1] // rates[0])
+    for _ in range(3):
+        stream = ResampleStream(*rates)
+        cuts = np.sort(random.randint(0, x.shape[0], random.randint(1, 40)))
+        parts = [stream.process(part) for part in np.split(x, cuts)] + [stream.flush()]
+        assert np.array_equal(np.concatenate(parts), whole)
+
+
+def test_equal_rates_are_bypassed():
+    x = np.zeros((100,), dtype=np.float32)
+    assert resample(x, 48000, 48000) is x
+    stream = ResampleStream(48000, 48000)
+    assert stream.process(x) is x
+    assert stream.flush().shape[0] == 0
+
+
+def test_filter_bank_is_cached_per_rate_pair():
+    assert get_filter_bank(44100, 48000) is get_filter_bank(44100, 48000)
+    assert get_filter_bank(44100, 48000) is not get_filter_bank(48000, 44100)
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from lru_files import LruFiles
+
+
+def get_array_digest(x) -> str:
+    return hashlib.sha256(np.ascontiguousarray(x).data).hexdigest()
+
+
+def get_file_digest(path, chunk_size=1 << 20) -> str:
+    res = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            res.update(chunk)
+    return res.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of VAD results with LRU eviction by total size.
+    Result is stored compactly: int8 labels and float16 voice probabilities per frame, so a result of one hour
+    of audio takes about 11 KB. Alias is a small entry which refers to a result stored under another key,
+    e.g. hash of a file refers to the result of its decoded audio.
+    Cache is thread-safe.
+    """
+    # Is a part of the keys, so results of another layout are never read
+    FORMAT_VERSION = 2
+    RESULT_SUFFIX = '.npz'
+    ALIAS_SUFFIX = '.alias'
+    TEMP_SUFFIX = '.tmp'
+
+    def __init__(self, cache_dir, max_bytes):
+        self.__cache_dir = cache_dir
+        self.__lock = threading.Lock()
+        self.__files = LruFiles(cache_dir, max_bytes)
+        self.__stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.logger = logging.getLogger()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        names = []
+        for name in os.listdir(cache_dir):
+            if not os.path.isfile(os.path.join(cache_dir, name)):
+                continue
+            if name.endswith(self.TEMP_SUFFIX):
+                # Partially written entry
+                os.remove(os.path.join(cache_dir, name))
+            elif name.endswith(self.RESULT_SUFFIX) or name.endswith(self.ALIAS_SUFFIX):
+                names.append(name)
+        self.__files.load(names)
+        with self.__lock:
+            self.__evict()
+
+    def __get_path(self, name):
+        return os.path.join(self.__cache_dir, name)
+
+    def __evict(self):
+        self.__stats['evictions'] += len(self.__files.evict())
+
+    def __write(self, name, write):
+        # File is written under a temporary name, so a reader never sees a partial entry
+        temp_path = self.__get_path(uuid.uuid4().hex + self.TEMP_SUFFIX)
+        with open(temp_path, 'wb') as f:
+            write(f)
+        size = os.path.getsize(temp_path)
+        with self.__lock:
+            os.replace(temp_path, self.__get_path(name))
+            self.__files.add(name, size)
+            self.__evict()
+
+    def __read_result(self, key):
+        name = key + self.RESULT_SUFFIX
+        with self.__lock:
+            if not self.__files.touch(name):
+                return None
+            # Eviction can't remove the file while it is read, it is under the same lock
+            with np.load(self.__get_path(name)) as data:
+                return data['labels'].astype(np.int32), data['probabilities']
+
+    def get(self, key):
+        """
+        Returns (labels, probabilities) stored under the key or alias, None if it is missing
+        """
+        res = self.__read_result(key)
+        if res is None:
+            name = key + self.ALIAS_SUFFIX
+            with self.__lock:
+                target = None
+                if self.__files.touch(name):
+                    with open(self.__get_path(name), 'r') as f:
+                        target = f.read()
+            if target is not None:
+                res = self.__read_result(target)
+
+        with self.__lock:
+            self.__stats['hits' if res is not None else 'misses'] += 1
+        return res
+
+    def put(self, key, labels, probabilities):
+        def write(f):
+            np.savez(f, labels=labels.astype(np.int8), probabilities=probabilities.astype(np.float16))
+        self.__write(key + self.RESULT_SUFFIX, write)
+
+    def put_alias(self, alias, key):
+        self.__write(alias + self.ALIAS_SUFFIX, lambda f: f.write(key.encode('utf-8')))
+
+    def get_stats(self):
+        with self.__lock:
+            res = dict(self.__stats)
+            res['entries'] = len(self.__files)
+            res['bytes'] = self.__files.total_bytes
+            return res
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache(cache_dir, max_bytes=1 << 20)
+        labels = np.random.RandomState(0).randint(0, 2, 3600).astype(np.int32)
+        cache.put('audio', labels, labels.astype(np.float16))
+        print(f'Result of one hour takes {os.path.getsize(os.path.join(cache_dir, "audio.npz"))} bytes')
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+from lru_files import LruFiles
+from result_cache import ResultCache, get_array_digest, get_file_digest
+
+
+def get_result(seed=0, n=3600):
+    labels = np.random.RandomState(seed).randint(0, 2, n).astype(np.int32)
+    return labels, labels.astype(np.float16)
+
+
+def test_result_is_read_by_key_and_alias(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20)
+    labels, probabilities = get_result()
+    cache.put('audio', labels, probabilities)
+    cache.put_alias('file', 'audio')
+    assert cache.get('missing') is None
+    for key in ['audio', 'file']:
+        cached_labels, cached_probabilities = cache.get(key)
+        assert np.array_equal(cached_labels, labels)
+        assert np.array_equal(cached_probabilities, probabilities)
+    stats = cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['entries'] == 2
+
+
+def test_restarted_cache_keeps_entries_and_removes_only_its_partial_files(tmp_path):
+    cache_dir = str(tmp_path)
+    cache = ResultCache(cache_dir, max_bytes=1 << 20)
+    cache.put('audio', *get_result())
+    cache.put_alias('file', 'audio')
+    os.makedirs(os.path.join(cache_dir, 'other_dir'))
+    for name in ['partial.tmp', 'README']:
+        with open(os.path.join(cache_dir, name), 'w') as f:
+            f.write('x')
+
+    cache = ResultCache(cache_dir, max_bytes=cache.get_stats()['bytes'])
+    assert sorted(os.listdir(cache_dir)) == ['README', 'audio.npz', 'file.alias', 'other_dir']
+    assert cache.get('file') is not None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20)
+    cache.put('first', *get_result(0))
+    cache.put('second', *get_result(1))
+    # Read makes the first entry the most recently used one
+    assert cache.get('first') is not None
+    cache = ResultCache(str(tmp_path), max_bytes=cache.get_stats()['bytes'])
+    cache.put('third', *get_result(2))
+    assert cache.get('second') is None
+    assert cache.get('first') is not None
+    assert cache.get('third') is not None
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_digests():
+    x = np.arange(10, dtype=np.float32)
+    assert get_array_digest(x) == get_array_digest(x.copy())
+    assert get_array_digest(x) != get_array_digest(x[::-1])
+    assert get_array_digest(x[::2]) == get_array_digest(np.ascontiguousarray(x[::2]))
+
+
+def test_file_digest_does_not_depend_on_chunk_size(tmp_path):
+    path = tmp_path / 'file'
+    path.write_bytes(os.urandom(10000))
+    assert get_file_digest(str(path), chunk_size=7) == get_file_digest(str(path))
+
+
+def test_lru_files_skip_pinned_files(tmp_path):
+    for name in ['a', 'b', 'c']:
+        (tmp_path / name).write_bytes(b'x' * 10)
+    files = LruFiles(str(tmp_path), max_bytes=20)
+    files.load(['a', 'b', 'c'])
+    files.pin('a')
+    files.touch('c')
+    # 'a' is the least recently used one, but it is pinned
+    assert files.evict() == ['b']
+    assert files.total_bytes == 20
+    files.unpin('a')
+    (tmp_path / 'd').write_bytes(b'x' * 10)
+    files.add('d', 10)
+    assert files.evict() == ['a']
+    assert 'c' in files and 'd' in files and len(files) == 2
+    assert sorted(os.listdir(str(tmp_path))) == ['c', 'd']
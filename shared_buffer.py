@@ -0,0 +1,90 @@
+import os
+import tempfile
+import uuid
+
+import numpy as np
+
+
+SHARED_MEMORY_DIR = '/dev/shm'
+# Share of tmpfs which is kept free, files which would take it are placed on disk instead
+SHARED_MEMORY_RESERVE = 0.1
+
+
+def has_room(dir_path, n_bytes):
+    stat = os.statvfs(dir_path)
+    free_bytes = stat.f_bavail * stat.f_frsize
+    reserve_bytes = SHARED_MEMORY_RESERVE * stat.f_blocks * stat.f_frsize
+    return n_bytes <= free_bytes - reserve_bytes
+
+
+def get_shared_memory_dir(n_bytes=0):
+    """
+    Directory for a file of n_bytes which is shared between processes or is short-lived.
+    /dev/shm is a tmpfs on Linux, so files there never touch the disk. It is small (64 MB by default in docker),
+    and a process which writes through mmap to full tmpfs is killed by SIGBUS, so a file which doesn't fit
+    is placed in the temp dir on disk
+    """
+    if os.path.isdir(SHARED_MEMORY_DIR) and has_room(SHARED_MEMORY_DIR, n_bytes):
+        return SHARED_MEMORY_DIR
+    return tempfile.gettempdir()
+
+
+class SharedArray:
+    """
+    NumPy array placed in shared memory.
+    Other process attaches to the same memory by descriptor, so the data is never copied between processes.
+    Every block has unique name, so concurrent jobs don't interfere with each other.
+    Block is placed on disk if it doesn't fit into tmpfs, see get_shared_memory_dir(), so its descriptor
+    has the full path of the block.
+    """
+    def __init__(self, path, shape, dtype, create=False):
+        self.__path = path
+        self.__shape = tuple(shape)
+        self.__dtype = np.dtype(dtype)
+
+        if path is None:
+            # mmap can't map an empty file, so empty arrays are kept in process memory
+            self.__array = np.empty(self.__shape, dtype=self.__dtype)
+        else:
+            mode = 'w+' if create else 'r+'
+            self.__array = np.memmap(self.__path, dtype=self.__dtype, mode=mode, shape=self.__shape)
+
+    @classmethod
+    def create(cls, shape, dtype) -> 'SharedArray':
+        shape = tuple(shape) if isinstance(shape, (tuple, list)) else (shape,)
+        path = None
+        n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if n_bytes > 0:
+            path = os.path.join(get_shared_memory_dir(n_bytes), f'vadnet-{uuid.uuid4().hex}')
+        return cls(path, shape, dtype, create=True)
+
+    @classmethod
+    def from_array(cls, array) -> 'SharedArray':
+        array = np.asarray(array)
+        res = cls.create(array.shape, array.dtype)
+        res.array[...] = array
+        return res
+
+    @classmethod
+    def attach(cls, descriptor) -> 'SharedArray':
+        path, shape, dtype = descriptor
+        return cls(path, shape, dtype)
+
+    @property
+    def descriptor(self):
+        return self.__path, self.__shape, self.__dtype.str
+
+    @property
+    def array(self) -> np.ndarray:
+        return self.__array
+
+    def close(self):
+        # Mapping itself is released when the last view on it is garbage collected
+        self.__array = None
+
+    def unlink(self):
+        # On Linux memory stays valid for views that are still alive, file name is freed immediately
+        self.close()
+        if self.__path is not None and os.path.isfile(self.__path):
+            os.remove(self.__path)
+
@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+import shared_buffer
+from shared_buffer import SharedArray, get_shared_memory_dir
+
+
+def fill(descriptor, value):
+    shared = SharedArray.attach(descriptor)
+    shared.array[:] = value
+    shared.close()
+
+
+def test_array_is_shared_between_processes():
+    source = SharedArray.from_array(np.arange(10, dtype=np.int16))
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=fill, args=(source.descriptor, 42))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert source.array.tolist() == [42] * 10
+    assert source.array.dtype == np.int16
+    source.unlink()
+    assert not os.path.exists(source.descriptor[0])
+
+
+def test_every_block_has_its_own_file():
+    blocks = [SharedArray.create((4, 2), np.float32) for _ in range(2)]
+    assert blocks[0].descriptor[0] != blocks[1].descriptor[0]
+    assert blocks[0].descriptor[1:] == ((4, 2), '<f4')
+    for block in blocks:
+        block.unlink()
+
+
+def test_block_which_does_not_fit_into_tmpfs_is_placed_on_disk(monkeypatch, tmp_path):
+    monkeypatch.setattr(shared_buffer, 'SHARED_MEMORY_DIR', str(tmp_path))
+    assert get_shared_memory_dir(1) == str(tmp_path)
+    assert get_shared_memory_dir(1 << 60) == tempfile.gettempdir()
+
+
+def test_empty_array_has_no_file():
+    empty = SharedArray.from_array(np.zeros((0,), dtype=np.float32))
+    assert empty.descriptor[0] is None
+    assert SharedArray.attach(empty.descriptor).array.shape == (0,)
+    empty.unlink()
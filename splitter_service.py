@@ -1,27 +1,44 @@
 import json
+import logging
+import threading
+import time
 
+from future_chain import after
+from label_encoding import dump_response
 from message_handler import VADMEssageHandler
-from PyEasyNetQAdapter.rpc_server import ServiceBus
+from amqp_consumer import ConcurrentServiceBus
 
-# For DEBUG purpose
-import sys
-import numpy
-numpy.set_printoptions(threshold=sys.maxsize)
 
-
-def on_request(body):
+def on_request(body, props):
     body_str = body.decode('utf-8')
     request_body = json.loads(body_str)
 
-    response_obj = response_object_provider.get_vad_response_obj(request_body)
-    response_body = json.dumps(response_obj)
+    # Deadline of a request without DeadlineTimestamp is derived from the time its message was published.
+    # Request waits in the queue of its lane without holding the AMQP worker, reply is sent when it is done
+    response_future = response_object_provider.submit_vad_request(request_body, props.timestamp)
+    # Body is JSON unless msgpack is requested
+    response_format = request_body.get('ResponseFormat', 'json')
+    return after(response_future, lambda done: dump_response(done.result(), response_format))
+
 
-    return response_body
+def log_stats(interval_seconds):
+    # Stages of lane pipelines, batching of the VAD worker, deadlines and coalescing are seen only in this log
+    logger = logging.getLogger()
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            logger.info(f'Service stats: {json.dumps(response_object_provider.get_stats())}')
+        except Exception as e:
+            logger.warning(f'Failed to collect service stats: {e}')
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     response_object_provider = VADMEssageHandler('config.yml')
-    service_bus = ServiceBus.from_config_file('config.yml')
+    if response_object_provider.stats_log_seconds:
+        threading.Thread(target=log_stats, args=(response_object_provider.stats_log_seconds,), daemon=True).start()
+    # Requests are handled by a pool of workers, see amqp_workers and amqp_prefetch_count in config
+    service_bus = ConcurrentServiceBus.from_config_file('config.yml')
     print(f'Activating AMQP listener service')
     service_bus.respond('Loyalty.Audio.VAD.VADRequest, Loyalty.Audio.VAD',
-                        'Loyalty.Audio.VAD.VADResponse, Loyalty.Audio.VAD', on_request)
+                        'Loyalty.Audio.VAD.VADResponse, Loyalty.Audio.VAD', on_request, pass_properties=True)
@@ -0,0 +1,28 @@
+import argparse
+
+from utils.checkpoint import freeze_checkpoint
+from utils.printy import print_info
+
+
+parser = argparse.ArgumentParser(allow_abbrev=False)
+
+parser.add_argument('--checkpoint_dir',
+        required=True,
+        type=str,
+        help='folder with checkpoint and vocab.json (or path to checkpoint)')
+
+parser.add_argument('--output_dir',
+        default=None,
+        type=str,
+        help='folder to store the frozen inference graph (default is the checkpoint folder)')
+
+
+def main():
+
+    args = parser.parse_args()
+    path = freeze_checkpoint(args.checkpoint_dir, args.output_dir)
+    print_info('frozen inference graph saved to {}'.format(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -177,6 +177,7 @@ class Model(ModelBase):
                     'x' : ph_frames.name,
                     'y' : ph_labels.name,
                     'init' : ds_init.name,
+                    'next' : ds_next[0].name,
                     'logits' : logits.name,
                     'n_shuffle' : ph_n_shuffle.name,
                     'n_repeat' : ph_n_repeat.name,
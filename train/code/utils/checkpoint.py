@@ -67,59 +67,116 @@ def update_var_from_checkpoint(sess:tf.Session, name_to:str, name_from:str, path
     update_var_in_graph(sess, name_to, var_from)
     
       
-def predict_from_checkpoint(audio:np.ndarray, checkpoint_dir:str, additional_layer_names=None, n_batch=1) -> List:        
+FROZEN_GRAPH_NAME = 'frozen_model.pb'
 
-    result = None    
 
-    checkpoint_path = tf.train.latest_checkpoint(checkpoint_dir)
-    if ckeckpoint_path:
-           
-        graph = tf.Graph()
+def get_inference_graph(checkpoint_path:str, vocab:dict):
 
-        with graph.as_default():
+    # Network is built on top of the dataset iterator, so the frames are routed to the
+    # output of 'ds/next' by an input map. Dataset, shuffle and repeat ops are not executed any more
 
-            saver = tf.train.import_meta_graph(checkpoint_path + '.meta')
-            with open(os.path.join(checkpoint_dir, 'vocab.json'), 'r') as fp:
-                vocab = json.load(fp)
+    with tf.Graph().as_default() as train_graph:
+        tf.train.import_meta_graph(checkpoint_path + '.meta')
+        n_frame = train_graph.get_tensor_by_name(vocab['x']).shape[1]
+
+    graph = tf.Graph()
+    with graph.as_default():
+        with tf.name_scope('infer'):
+            ph_frames = tf.placeholder(dtype=tf.float32, shape=(None, n_frame), name='frames')
+        saver = tf.train.import_meta_graph(checkpoint_path + '.meta', input_map={ vocab.get('next', 'ds/next:0') : ph_frames })
     
-            x = graph.get_tensor_by_name(vocab['x'])
-            y = graph.get_tensor_by_name(vocab['y'])            
-            init = graph.get_operation_by_name(vocab['init'])
-            logits = graph.get_tensor_by_name(vocab['logits'])            
-            ph_n_shuffle = graph.get_tensor_by_name(vocab['n_shuffle'])
-            ph_n_repeat = graph.get_tensor_by_name(vocab['n_repeat'])
-            ph_n_batch = graph.get_tensor_by_name(vocab['n_batch'])
-
-            layers = [logits]     
-            if additional_layer_names:       
-                for layer_name in additional_layer_names:
-                    layers.append(graph.get_tensor_by_name(layer_name))                
-            result = [np.empty([0] + x.shape[1:].as_list(), dtype=np.float32) for x in layers]           
-
-            frames = audio_to_frames(audio, x.shape[1], None) 
-            labels = np.zeros((frames.shape[0],), dtype=np.int32)  
-           
-            with tf.Session() as sess:
+    return graph, saver, ph_frames
+
+
+def freeze_checkpoint(checkpoint_dir:str, output_dir:str=None) -> str:
+
+    checkpoint_path = get_model_name(checkpoint_dir)
+    if not output_dir:
+        output_dir = os.path.dirname(checkpoint_path)
+
+    with open(os.path.join(os.path.dirname(checkpoint_path), 'vocab.json'), 'r') as fp:
+        vocab = json.load(fp)
+
+    graph, saver, ph_frames = get_inference_graph(checkpoint_path, vocab)
+    logits = graph.get_tensor_by_name(vocab['logits'])
+
+    with tf.Session(graph=graph) as sess:
+        saver.restore(sess, checkpoint_path)
+        # keeps only the ops needed to compute the logits from the frames, training ops are stripped
+        graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), [logits.op.name])
+        graph_def = tf.graph_util.remove_training_nodes(graph_def, protected_nodes=[ph_frames.op.name, logits.op.name])
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    frozen_path = os.path.join(output_dir, FROZEN_GRAPH_NAME)
+    with tf.gfile.GFile(frozen_path, 'wb') as fp:
+        fp.write(graph_def.SerializeToString())
+
+    vocab['frozen_graph'] = FROZEN_GRAPH_NAME
+    vocab['frozen_x'] = ph_frames.name
+    vocab['frozen_logits'] = logits.name
+    with open(os.path.join(output_dir, 'vocab.json'), 'w') as fp:
+        json.dump(vocab, fp)
+
+    return frozen_path
 
+
+def load_frozen_graph(path:str) -> tf.Graph:
+
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, 'rb') as fp:
+        graph_def.ParseFromString(fp.read())
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+
+    return graph
+
+      
+def predict_from_checkpoint(audio:np.ndarray, checkpoint_dir:str, additional_layer_names=None, n_batch=1) -> List:        
+
+    result = None    
+
+    with open(os.path.join(checkpoint_dir, 'vocab.json'), 'r') as fp:
+        vocab = json.load(fp)
+
+    frozen_path = os.path.join(checkpoint_dir, vocab.get('frozen_graph', FROZEN_GRAPH_NAME))
+    if os.path.exists(frozen_path):
+        graph = load_frozen_graph(frozen_path)
+        saver = None
+        x = graph.get_tensor_by_name(vocab['frozen_x'])
+        logits = graph.get_tensor_by_name(vocab['frozen_logits'])
+    else:
+        checkpoint_path = tf.train.latest_checkpoint(checkpoint_dir)
+        if not checkpoint_path:
+            return result
+        graph, saver, x = get_inference_graph(checkpoint_path, vocab)
+        logits = graph.get_tensor_by_name(vocab['logits'])
+
+    with graph.as_default():
+
+        layers = [logits]     
+        if additional_layer_names:       
+            for layer_name in additional_layer_names:
+                layers.append(graph.get_tensor_by_name(layer_name))                
+        result = [np.empty([0] + layer.shape[1:].as_list(), dtype=np.float32) for layer in layers]           
+
+        frames = audio_to_frames(audio, x.shape[1], None) 
+        if n_batch <= 0:
+            n_batch = frames.shape[0]
+       
+        with tf.Session() as sess:
+
+            if saver:
                 saver.restore(sess, checkpoint_path)
-                sess.run(init, feed_dict = { 
-                    x : frames, 
-                    y : labels, 
-                    ph_n_shuffle : 1,
-                    ph_n_repeat : 1,
-                    ph_n_batch : n_batch if n_batch > 0 else frames.shape[0]
-                })
-        
-                count = 0
-                while True:
-                    try:                    
-                        outputs = sess.run(layers)
-                        for i, output in enumerate(outputs):
-                            result[i] = np.concatenate([result[i], output])
-                        #labels[count:count+output.shape[0]] = np.argmax(output, axis=1)                                
-                        #count += output.shape[0]
-                    except tf.errors.OutOfRangeError:                                                                                
-                        break                
+
+            # frames are fed batch by batch directly into the network
+            for start in range(0, frames.shape[0], n_batch):
+                outputs = sess.run(layers, feed_dict = { x : frames[start:start+n_batch] })
+                for i, output in enumerate(outputs):
+                    result[i] = np.concatenate([result[i], output])
 
     return result
 
@@ -0,0 +1,6 @@
+@echo off
+
+SET CHECKPOINT=nets\ckpt
+SET OUTPUT=..\models\vad
+
+python code\freeze.py --checkpoint_dir %CHECKPOINT% --output_dir %OUTPUT%
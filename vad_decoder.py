@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+
+def threshold(probabilities, value=0.5):
+    """
+    Frame is voiced if its voice probability is not less than value
+    """
+    return np.asarray(probabilities) >= value
+
+
+def hysteresis(probabilities, on_threshold, off_threshold, initial=False):
+    """
+    Frame turns voiced when probability rises to on_threshold and stays voiced until it falls below off_threshold.
+    Frames in between keep the state of the previous frame
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    # 1 - turn on, 0 - turn off, -1 - keep the previous state
+    events = np.full(probabilities.shape, -1, dtype=np.int8)
+    events[probabilities < off_threshold] = 0
+    events[probabilities >= on_threshold] = 1
+    # Index of the last frame with an event, it is propagated forward to the frames without events
+    last_event = np.where(events >= 0, np.arange(events.shape[0]), -1)
+    np.maximum.accumulate(last_event, out=last_event)
+    res = np.full(probabilities.shape, initial, dtype=bool)
+    has_event = last_event >= 0
+    res[has_event] = events[last_event[has_event]] == 1
+    return res
+
+
+def median_filter(labels, width):
+    """
+    Median of binary labels in a centered window of odd width, edges are padded by the edge values
+    """
+    labels = np.asarray(labels, dtype=bool)
+    if width <= 1 or labels.shape[0] == 0:
+        return labels.copy()
+    if width % 2 == 0:
+        raise ValueError(f'Median filter width must be odd: {width}')
+    half = width // 2
+    padded = np.concatenate([np.repeat(labels[:1], half), labels, np.repeat(labels[-1:], half)])
+    # Median of binary values is the majority, count of voiced frames in every window is taken from cumulative sum
+    cumsum = np.concatenate([[0], np.cumsum(padded, dtype=np.int32)])
+    return cumsum[width:] - cumsum[:-width] > half
+
+
+def get_runs(labels):
+    """
+    Returns (starts, ends, values) of the runs of equal labels, ends are exclusive
+    """
+    labels = np.asarray(labels, dtype=bool)
+    if labels.shape[0] == 0:
+        return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=bool)
+    starts = np.concatenate([[0], np.flatnonzero(labels[1:] != labels[:-1]) + 1])
+    ends = np.concatenate([starts[1:], [labels.shape[0]]])
+    return starts, ends, labels[starts]
+
+
+def min_duration(labels, min_voiced_frames=0, min_unvoiced_frames=0):
+    """
+    Fills unvoiced gaps between voiced runs shorter than min_unvoiced_frames,
+    then drops voiced runs shorter than min_voiced_frames
+    """
+    res = np.array(labels, dtype=bool)
+    if min_unvoiced_frames > 0:
+        starts, ends, values = get_runs(res)
+        # Gaps at the edges are not between voiced runs, so they are kept
+        is_inner = (starts > 0) & (ends < res.shape[0])
+        short = ~values & is_inner & (ends - starts < min_unvoiced_frames)
+        res = np.repeat(values | short, ends - starts)
+    if min_voiced_frames > 0:
+        starts, ends, values = get_runs(res)
+        short = values & (ends - starts < min_voiced_frames)
+        res = np.repeat(values & ~short, ends - starts)
+    return res
+
+
+def to_segments(labels, frame_seconds=1):
+    """
+    Returns [[start, end], ...] of voiced runs in the units of frame_seconds
+    """
+    starts, ends, values = get_runs(labels)
+    segments = np.stack([starts[values], ends[values]], axis=1) * frame_seconds
+    return segments.tolist()
+
+
+def get_labels_summary(labels, hop_seconds=1):
+    """
+    Short description of labels for logs instead of the labels themselves
+    """
+    labels = np.asarray(labels, dtype=bool).reshape(-1)
+    if labels.shape[0] == 0:
+        return '0 frames'
+    starts, ends, values = get_runs(labels)
+    voiced_lengths = (ends - starts)[values]
+    res = f'{labels.shape[0]} frames of {hop_seconds}s, {labels.mean() * 100:.1f}% voiced in ' \
+          f'{voiced_lengths.shape[0]} segments'
+    if voiced_lengths.shape[0] > 0:
+        res += f', longest is {voiced_lengths.max() * hop_seconds}s'
+    return res
+
+
+def decode(probabilities, on_threshold=0.5, off_threshold=None, median_width=1, min_voiced_frames=0,
+           min_unvoiced_frames=0):
+    """
+    Turns per frame voice probabilities into labels: hysteresis thresholding (simple threshold if off_threshold
+    is not set), median filter and minimal durations of voiced and unvoiced runs
+    """
+    if off_threshold is None:
+        labels = threshold(probabilities, on_threshold)
+    else:
+        labels = hysteresis(probabilities, on_threshold, off_threshold)
+    labels = median_filter(labels, median_width)
+    return min_duration(labels, min_voiced_frames, min_unvoiced_frames)
+
+
+if __name__ == '__main__':
+    # Decoding one hour of per second probabilities under many settings
+    p = np.random.RandomState(0).uniform(0, 1, 3600).astype(np.float16)
+    settings = [(on, on - 0.1, width, 3, 2) for on in np.linspace(0.3, 0.9, 25) for width in [1, 3, 5, 7]]
+    start_time = time.time()
+    for on, off, width, min_voiced, min_unvoiced in settings:
+        decode(p, on, off, width, min_voiced, min_unvoiced)
+    print(f'Decoding of 1h takes {(time.time() - start_time) / len(settings) * 1e6:.0f}us per setting')
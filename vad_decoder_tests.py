@@ -0,0 +1,45 @@
+import numpy as np
+
+from vad_decoder import decode, get_labels_summary, get_runs, hysteresis, median_filter, min_duration, threshold,\
+    to_segments
+
+
+PROBABILITIES = np.array([0.1, 0.6, 0.45, 0.3, 0.7, 0.2, 0.9, 0.9, 0.1, 0.1, 0.1, 0.8], dtype=np.float16)
+
+
+def test_threshold():
+    assert threshold(PROBABILITIES).tolist() == [0, 1, 0, 0, 1, 0, 1, 1, 0, 0, 0, 1]
+
+
+def test_hysteresis_keeps_state_between_thresholds():
+    assert hysteresis(PROBABILITIES, 0.5, 0.4).tolist() == [0, 1, 1, 0, 1, 0, 1, 1, 0, 0, 0, 1]
+    assert hysteresis([0.45, 0.45], 0.5, 0.4).tolist() == [0, 0]
+    assert hysteresis([0.45, 0.45], 0.5, 0.4, initial=True).tolist() == [1, 1]
+
+
+def test_median_filter():
+    assert median_filter([0, 1, 0, 0, 1, 1, 0, 1, 1], 3).tolist() == [0, 0, 0, 0, 1, 1, 1, 1, 1]
+
+
+def test_min_duration():
+    assert min_duration([1, 0, 1, 1, 0, 0, 0, 1, 0], min_unvoiced_frames=2).tolist() == [1, 1, 1, 1, 0, 0, 0, 1, 0]
+    assert min_duration([1, 0, 1, 1, 0, 0, 0, 1, 0], min_voiced_frames=2).tolist() == [0, 0, 1, 1, 0, 0, 0, 0, 0]
+
+
+def test_runs_and_segments():
+    starts, ends, values = get_runs([0, 1, 1, 0, 1])
+    assert starts.tolist() == [0, 1, 3, 4]
+    assert ends.tolist() == [1, 3, 4, 5]
+    assert values.tolist() == [0, 1, 0, 1]
+    assert to_segments([0, 1, 1, 0, 1]) == [[1, 3], [4, 5]]
+    assert to_segments([0, 1, 1], frame_seconds=0.5) == [[0.5, 1.5]]
+    assert to_segments([]) == []
+
+
+def test_labels_summary():
+    assert get_labels_summary([0, 1, 1, 0, 1]) == '5 frames of 1s, 60.0% voiced in 2 segments, longest is 2s'
+
+
+def test_decode_without_settings_is_threshold():
+    assert np.array_equal(decode(PROBABILITIES), threshold(PROBABILITIES))
+    assert np.array_equal(decode(PROBABILITIES, 0.5, 0.4), hysteresis(PROBABILITIES, 0.5, 0.4))
@@ -14,68 +14,436 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 import os, json, glob
 import logging
 
-import tensorflow as tf
-tf.logging.set_verbosity(tf.logging.INFO)
-
+# TensorFlow is imported by CNNNetVAD.load(), so the handler process which only runs CNNNetVadExecutor
+# doesn't load it
 import numpy as np
-import librosa as lr
-import subprocess
-import pickle
+import threading
+import itertools
+import hashlib
 import time
 
-from multiprocessing import Pool
+from concurrent.futures import Future, ThreadPoolExecutor
+import multiprocessing
+from audio_decoder import AudioDecoder
+from batching import DynamicBatcher
+from deadline import Deadline, DeadlineExceeded
 from gpu_state_check import is_gpu_busy
-
-
-def exec(file_path, cnn_batch_size, vad_model_path):
-    vadnet = CNNNetVAD(cnn_batch_size, vad_model_path)
-    vadnet.process(file_path)
+import resampler
+from resampler import resample, ResampleStream
+from result_cache import ResultCache, get_array_digest, get_file_digest
+from shared_buffer import SharedArray
+from vad_decoder import get_labels_summary
+from vad_stream import VadStream
+
+
+# Decoding of a file tail starts this number of seconds before the requested position
+SEEK_MARGIN_SECONDS = 1
+# Frames of a whole audio are inferred by blocks of this number of batches, deadline is checked between them
+DEADLINE_CHECK_BATCHES = 16
+
+
+def serve(connection, cnn_batch_size, vad_model_path, chunk_seconds=0, max_batch_delay=0, n_threads=1,
+          result_cache_dir=None, result_cache_max_bytes=0):
+    """
+    Body of the long-lived inference worker.
+    Loads the model once and then answers jobs received over the connection until it is closed.
+    Job is a tuple of (job_id, kind, payload), kind is one of:
+    'file' with (file_path, start_seconds, end_seconds, deadline_timestamp),
+    'array' with (sound_descriptor, sample_rate, deadline_timestamp) or 'metrics' with None.
+    Audio which comes chunk by chunk is labeled by a stream: 'stream_open' with sample_rate returns stream id,
+    'stream_chunk' with (stream_id, sound_descriptor) returns labels of the complete frames,
+    'stream_close' with stream_id returns labels of the rest and releases the stream.
+    Up to n_threads jobs are handled concurrently, their frames are batched together if max_batch_delay is set.
+    Audio of array jobs and resulting labels and probabilities are passed through shared memory,
+    only descriptors of shared blocks go through the connection.
+    File or array job which passes its deadline is stopped between chunks or blocks of frames
+    and answered with 'expired' status.
+    Results are cached in result_cache_dir if result_cache_max_bytes is set.
+    """
+    start_time = time.time()
+    result_cache = None
+    if result_cache_dir and result_cache_max_bytes > 0:
+        result_cache = ResultCache(result_cache_dir, result_cache_max_bytes)
+    vadnet = CNNNetVAD(cnn_batch_size, vad_model_path, max_batch_delay, result_cache)
+    vadnet.load()
+    run_jobs(connection, vadnet, chunk_seconds, n_threads, time.time() - start_time)
+
+
+def run_jobs(connection, vadnet, chunk_seconds=0, n_threads=1, cold_start_seconds=0):
+    """
+    Reports that the loaded vadnet is ready and answers jobs until the connection is closed, see serve()
+    """
+    connection.send((None, 'ready', (vadnet.sample_rate, vadnet.frame_seconds), cold_start_seconds))
+
+    send_lock = threading.Lock()
+    streams = {}
+    stream_ids = itertools.count()
+    streams_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    def handle(job_id, kind, payload):
+        job_start_time = time.time()
+        try:
+            if kind == 'metrics':
+                send((job_id, 'ok', vadnet.get_metrics(), time.time() - job_start_time))
+                return
+            if kind == 'stream_open':
+                with streams_lock:
+                    stream_id = next(stream_ids)
+                    streams[stream_id] = vadnet.open_stream(payload)
+                send((job_id, 'ok', stream_id, time.time() - job_start_time))
+                return
+            if kind == 'file':
+                file_path, start_seconds, end_seconds, deadline_timestamp = payload
+                labels, probabilities = vadnet.process(file_path, chunk_seconds, start_seconds, end_seconds,
+                                                       Deadline(deadline_timestamp))
+            elif kind == 'array':
+                sound_descriptor, sample_rate, deadline_timestamp = payload
+                sound = SharedArray.attach(sound_descriptor)
+                try:
+                    labels, probabilities = vadnet.process_array(sound.array, sample_rate, Deadline(deadline_timestamp))
+                finally:
+                    sound.close()
+            elif kind == 'stream_chunk':
+                stream_id, sound_descriptor = payload
+                with streams_lock:
+                    stream = streams[stream_id]
+                sound = SharedArray.attach(sound_descriptor)
+                labels, probabilities = stream.process(sound.array)
+                sound.close()
+            elif kind == 'stream_close':
+                with streams_lock:
+                    stream = streams.pop(payload)
+                labels, probabilities = stream.flush()
+            else:
+                raise ValueError(f'Unknown job kind: {kind}')
+            # Blocks are unlinked by the executor after it takes the result
+            shared_labels = SharedArray.from_array(labels)
+            shared_probabilities = SharedArray.from_array(probabilities)
+            result = (shared_labels.descriptor, shared_probabilities.descriptor)
+            shared_labels.close()
+            shared_probabilities.close()
+            send((job_id, 'ok', result, time.time() - job_start_time))
+        except DeadlineExceeded as e:
+            send((job_id, 'expired', str(e), time.time() - job_start_time))
+        except Exception as e:
+            send((job_id, 'error', repr(e), time.time() - job_start_time))
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        while True:
+            try:
+                job = connection.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            pool.submit(handle, *job)
+
+    vadnet.close()
 
 
 class CNNNetVadExecutor:
-    def __init__(self, cnn_batch_size, vad_model_path: str=''):
+    """
+    Client of the inference worker process.
+    Worker is started on first use, keeps the model loaded between jobs and is restarted if it dies.
+    Executor is thread-safe: jobs of concurrent callers are sent to the worker at once and
+    responses are routed back by job id.
+    """
+    def __init__(self, cnn_batch_size, vad_model_path: str='', chunk_seconds=0, max_batch_delay=0,
+                 n_worker_threads=1, result_cache_dir=None, result_cache_max_bytes=0, worker_target=serve):
         self.__cnn_batch_size = cnn_batch_size
         self.__vad_model_path = vad_model_path
-        self.__run_state = False
+        # Files are decoded and inferred by chunks of this duration. Zero means whole file at once
+        self.__chunk_seconds = chunk_seconds
+        # Maximal time (seconds) frames of a job wait for frames of other jobs to fill the batch
+        self.__max_batch_delay = max_batch_delay
+        self.__n_worker_threads = n_worker_threads
+        # Results of the same audio, model and parameters are not inferred again
+        self.__result_cache_dir = result_cache_dir
+        self.__result_cache_max_bytes = result_cache_max_bytes
+        # Function which runs in the worker process with the arguments of serve()
+        self.__worker_target = worker_target
+        self.__process = None
+        self.__connection = None
+        self.__connection_lost = False
+        self.__model_sample_rate = None
+        self.__frame_seconds = None
+        self.__lock = threading.Lock()
+        self.__pending_jobs = {}
+        self.__job_ids = itertools.count()
+        self.__stats = {
+            'cold_start_seconds': None,
+            'restarts': 0,
+            'jobs': 0,
+            'last_job_seconds': None,
+            'total_job_seconds': 0.0
+        }
         self.logger = logging.getLogger()
 
-    def extract_voice(self, file_path):
-        # First - check that GPU is not busy
+    def __start_worker(self):
+        # GPU memory has to be available before model is loaded.
+        # Check it only here: warm worker holds GPU memory itself, so it would be always reported as busy later
         self.logger.debug('Check that GPU memory is available for computing')
-        while is_gpu_busy() or self.__run_state:
+        while is_gpu_busy():
             wait_seconds = 1
             time.sleep(wait_seconds)
         self.logger.debug('GPU is ready for work with VAD')
 
+        # Model is loaded in a separate process to be sure that GPU memory is released when worker is stopped
         # https://github.com/tensorflow/tensorflow/issues/17048#issuecomment-368082470
-        with Pool(1) as p:
-            self.__run_state = True
-            p.apply(exec, args=(file_path, self.__cnn_batch_size, self.__vad_model_path))
-            self.__run_state = False
+        # Worker is spawned rather than forked: handler process runs threads (AMQP, downloads, pipeline stages)
+        # whose locks would be copied in a locked state by fork
+        context = multiprocessing.get_context('spawn')
+        parent_connection, child_connection = context.Pipe()
+        process = context.Process(target=self.__worker_target,
+                                  args=(child_connection, self.__cnn_batch_size, self.__vad_model_path,
+                                        self.__chunk_seconds, self.__max_batch_delay, self.__n_worker_threads,
+                                        self.__result_cache_dir, self.__result_cache_max_bytes),
+                                  daemon=True)
+        process.start()
+        child_connection.close()
+
+        _, status, (model_sample_rate, frame_seconds), cold_start_seconds = parent_connection.recv()
+        assert status == 'ready'
+        self.__model_sample_rate = model_sample_rate
+        self.__frame_seconds = frame_seconds
+        self.__process = process
+        self.__connection = parent_connection
+        self.__connection_lost = False
+        self.__stats['cold_start_seconds'] = cold_start_seconds
+        self.logger.info(f'VAD worker (pid={process.pid}) is ready. Cold start takes {cold_start_seconds:.3f}s')
+
+        threading.Thread(target=self.__receive, args=(parent_connection,), name='vad-receiver', daemon=True).start()
+
+    def __receive(self, connection):
+        while True:
+            try:
+                job_id, status, result, job_seconds = connection.recv()
+            except (EOFError, OSError):
+                break
+            with self.__lock:
+                future, _ = self.__pending_jobs.pop(job_id, (None, None))
+            if future is not None:
+                future.set_result((status, result, job_seconds))
+
+        # Worker is gone, fail all jobs which were sent to it
+        with self.__lock:
+            if self.__connection is connection:
+                self.__connection_lost = True
+            lost_jobs = [job_id for job_id, (_, job_connection) in self.__pending_jobs.items()
+                         if job_connection is connection]
+            futures = [self.__pending_jobs.pop(job_id)[0] for job_id in lost_jobs]
+        for future in futures:
+            future.set_exception(ConnectionError('Lost connection to VAD worker'))
+
+    def __stop_worker(self):
+        if self.__connection is not None:
+            self.__connection.close()
+        if self.__process is not None:
+            self.__process.join(timeout=5)
+            if self.__process.is_alive():
+                self.__process.terminate()
+                self.__process.join()
+        self.__process = None
+        self.__connection = None
+
+    def __ensure_worker(self):
+        if self.__process is not None and (self.__connection_lost or not self.__process.is_alive()):
+            self.logger.warning(f'VAD worker died with exit code {self.__process.exitcode}. Restart it')
+            self.__stats['restarts'] += 1
+            self.__stop_worker()
+        if self.__process is None:
+            self.__start_worker()
+
+    def __run_job(self, kind, payload):
+        for attempt in range(2):
+            future = Future()
+            with self.__lock:
+                self.__ensure_worker()
+                job_id = next(self.__job_ids)
+                self.__pending_jobs[job_id] = (future, self.__connection)
+                try:
+                    self.__connection.send((job_id, kind, payload))
+                except (BrokenPipeError, ConnectionResetError):
+                    self.__pending_jobs.pop(job_id)
+                    self.__connection_lost = True
+                    self.logger.warning(f'Lost connection to VAD worker on attempt {attempt + 1}')
+                    continue
+            try:
+                status, result, job_seconds = future.result()
+                break
+            except ConnectionError:
+                # Worker died in the middle of the job. It is restarted with the next job, repeat this one once
+                self.logger.warning(f'Lost connection to VAD worker on attempt {attempt + 1}')
+        else:
+            raise RuntimeError('VAD worker died twice while processing the job')
+
+        if status == 'expired':
+            self.logger.warning(f'VAD job is cancelled after {job_seconds:.3f}s: {result}')
+            raise DeadlineExceeded(result)
+        if status == 'error':
+            self.logger.error(f'VAD worker failed on job after {job_seconds:.3f}s: {result}')
+            raise RuntimeError(result)
+        return result, job_seconds
+
+    def __run_vad_job(self, kind, payload):
+        (labels_descriptor, probabilities_descriptor), job_seconds = self.__run_job(kind, payload)
+        labels = self.__take_shared_result(labels_descriptor)
+        probabilities = self.__take_shared_result(probabilities_descriptor)
+        with self.__lock:
+            self.__stats['jobs'] += 1
+            self.__stats['last_job_seconds'] = job_seconds
+            self.__stats['total_job_seconds'] += job_seconds
+        self.logger.info(f'VAD job takes {job_seconds:.3f}s')
+        return labels, probabilities
 
-        assert os.path.isfile('vad_response.pickle')
-        with open('vad_response.pickle', 'rb') as res_file_handle:
-            res = pickle.load(res_file_handle)
+    @staticmethod
+    def __take_shared_result(descriptor):
+        shared = SharedArray.attach(descriptor)
+        res = np.array(shared.array)
+        shared.unlink()
+        return res
 
+    def get_stats(self):
+        """
+        Returns executor counters together with metrics of the running worker:
+        batch fill ratio, queueing delay and result cache hits and misses
+        """
+        with self.__lock:
+            res = dict(self.__stats)
+            is_running = self.__process is not None and not self.__connection_lost
+        if is_running:
+            metrics, _ = self.__run_job('metrics', None)
+            res.update(metrics)
         return res
 
+    def get_model_sample_rate(self):
+        """
+        Sample rate of the model input. Audio at this rate is passed to the model without conversion
+        """
+        with self.__lock:
+            self.__ensure_worker()
+            return self.__model_sample_rate
+
+    def get_frame_seconds(self):
+        """
+        Duration of audio labeled by a single label
+        """
+        with self.__lock:
+            self.__ensure_worker()
+            return self.__frame_seconds
+
+    def extract_voice(self, file_path, with_probabilities=False, start_seconds=0, end_seconds=None,
+                      deadline: Deadline=None):
+        """
+        Runs VAD on the file, or on its part from start_seconds to end_seconds if they are set.
+        Raises DeadlineExceeded if the deadline passes before the file is labeled
+        """
+        deadline_timestamp = deadline.timestamp if deadline is not None else None
+        labels, probabilities = self.__run_vad_job('file', (file_path, start_seconds, end_seconds,
+                                                            deadline_timestamp))
+        return (labels, probabilities) if with_probabilities else labels
+
+    def extract_voice_from_shared(self, sound: SharedArray, sample_rate, with_probabilities=False,
+                                  deadline: Deadline=None):
+        """
+        Runs VAD on float32 or int16 audio which is already placed in shared memory. Audio is not copied.
+        Raises DeadlineExceeded if the deadline passes before the audio is labeled
+        """
+        deadline_timestamp = deadline.timestamp if deadline is not None else None
+        labels, probabilities = self.__run_vad_job('array', (sound.descriptor, sample_rate, deadline_timestamp))
+        return (labels, probabilities) if with_probabilities else labels
+
+    def extract_voice_from_array(self, sound, sample_rate, with_probabilities=False, deadline: Deadline=None):
+        shared_sound = SharedArray.from_array(sound)
+        try:
+            return self.extract_voice_from_shared(shared_sound, sample_rate, with_probabilities, deadline)
+        finally:
+            shared_sound.unlink()
+
+    def extract_voice_from_stream(self, chunks, sample_rate, with_probabilities=False, on_labels=None,
+                                  deadline: Deadline=None):
+        """
+        Runs VAD on float32 or int16 audio which comes chunk by chunk, e.g. decoded while it is still downloaded.
+        Worker returns labels of complete frames after every chunk, they are passed to on_labels as soon as they come.
+        Raises DeadlineExceeded if the deadline passes before the last chunk
+        """
+        stream_id, _ = self.__run_job('stream_open', sample_rate)
+        labels = []
+        probabilities = []
+
+        def add_result(result):
+            labels.append(result[0])
+            probabilities.append(result[1])
+            if on_labels is not None and result[0].shape[0] > 0:
+                on_labels(result[0])
+
+        try:
+            for chunk in chunks:
+                if deadline is not None:
+                    deadline.check('VAD of the next chunk')
+                shared_chunk = SharedArray.from_array(chunk)
+                try:
+                    add_result(self.__run_vad_job('stream_chunk', (stream_id, shared_chunk.descriptor)))
+                finally:
+                    shared_chunk.unlink()
+        except BaseException:
+            # Release the stream in the worker, result of the rest is not needed any more
+            try:
+                self.__run_vad_job('stream_close', stream_id)
+            except Exception as e:
+                self.logger.warning(f'Failed to close VAD stream: {e}')
+            raise
+        add_result(self.__run_vad_job('stream_close', stream_id))
+
+        labels = np.concatenate(labels)
+        probabilities = np.concatenate(probabilities)
+        return (labels, probabilities) if with_probabilities else labels
+
+    def close(self):
+        with self.__lock:
+            if self.__connection is not None:
+                try:
+                    self.__connection.send(None)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            self.__stop_worker()
+
 
 class CNNNetVAD:
-    def __init__(self, batch_size, model_path=''):
+    def __init__(self, batch_size, model_path='', max_batch_delay=0, result_cache: ResultCache=None):
         self.__supported_extensions = ['wav']
         self.logger = logging.getLogger()
         self.batch_size = batch_size
+        self.__max_batch_delay = max_batch_delay
+        self.__result_cache = result_cache
+        self.__model_identity = None
+        self.__voice_index = None
+        self.__graph = None
+        self.__session = None
+        self.__batcher = None
 
         if len(model_path) == 0:
             model_path = '/app/models/vad'
 
+        # Frozen inference graph (see train/code/freeze.py) is preferred over the training checkpoint
+        self.__frozen_graph_path = self.__get_frozen_graph_path(model_path)
+        if self.__frozen_graph_path is not None:
+            self.__checkpoint_path = None
+            self.logger.info(f'Model path is:  {self.__frozen_graph_path}')
+            with open(os.path.join(os.path.dirname(self.__frozen_graph_path), 'vocab.json'), 'r') as fp:
+                self.__vocab = json.load(fp)
+            return
+
+        checkpoint_path = model_path
         if os.path.isdir(model_path):
             candidates = glob.glob(os.path.join(model_path, 'model.ckpt-*.meta'))
             if candidates:
                 candidates.sort()
                 checkpoint_path, _ = os.path.splitext(candidates[-1])
-        else:
-            checkpoint_path = model_path
 
         self.__checkpoint_path = checkpoint_path
         self.logger.info(f'Model path is:  {checkpoint_path}')
@@ -94,30 +462,36 @@ class CNNNetVAD:
         with open(vocabulary_path, 'r') as fp:
             self.__vocab = json.load(fp)
 
+    @property
+    def sample_rate(self):
+        return self.__vocab['sample_rate']
+
+    @property
+    def frame_seconds(self):
+        self.load()
+        return self.__n_frame / self.__vocab['sample_rate']
+
     @staticmethod
-    def __convert_file(input_file_path, output_file_path):
-        subprocess.call(['sox',
-                         input_file_path,
-                         output_file_path])
-        assert os.path.isfile(output_file_path)
+    def __get_frozen_graph_path(model_path):
+        if os.path.isfile(model_path) and model_path.endswith('.pb'):
+            return model_path
+        vocabulary_path = os.path.join(model_path, 'vocab.json')
+        if not os.path.isdir(model_path) or not os.path.exists(vocabulary_path):
+            return None
+        with open(vocabulary_path, 'r') as fp:
+            vocab = json.load(fp)
+        if 'frozen_graph' not in vocab:
+            return None
+        frozen_graph_path = os.path.join(model_path, vocab['frozen_graph'])
+        return frozen_graph_path if os.path.isfile(frozen_graph_path) else None
 
-    def __audio_from_file(self, path, sr=None):
+    def __audio_from_file(self, path, sr, start_seconds=0, duration_seconds=None, deadline: Deadline=None):
         self.logger.debug(f'Try extract data from file: path={path}')
-        if '.wav' not in path:
-            in_file_name = os.path.basename(path).replace('.pckl', '')
-            in_file_dir = path.replace(in_file_name, '')
-            spl_name = in_file_name.split('.')
-            ext = spl_name[len(spl_name)-1]
-            out_file_name = in_file_name.replace(f'.{ext}', '.wav')
-            out_file_path = os.path.join(in_file_dir, out_file_name)
-            self.logger.debug(f'Convert "{path}" to {out_file_path}')
-            self.__convert_file(path, out_file_path)
-            os.remove(path)
-            path = out_file_path
-        return lr.load(path, sr=sr, mono=True, offset=0.0, duration=None, dtype=np.float32, res_type='kaiser_best')
-
-    def __audio_to_file(self, path, x, sr):
-        lr.output.write_wav(path, x.reshape(-1), sr, norm=False)
+        with AudioDecoder(path, start_seconds=start_seconds, duration_seconds=duration_seconds) as decoder:
+            sound = decoder.read_all(deadline)
+            if deadline is not None:
+                deadline.check('resampling')
+            return resample(sound, decoder.sample_rate, sr), sr
 
     def __audio_to_frames(self, x, n_frame, n_step=None):
         if n_step is None:
@@ -135,66 +509,243 @@ class CNNNetVAD:
 
         return np.lib.stride_tricks.as_strided(x[0:n_keep,:], (n_frames,n_frame), strides)
 
-    def process(self, file):
-        if not os.path.isfile(file):
-            self.logger.error(f'Skip: [{file}] not found]')
-            raise FileNotFoundError
+    def load(self):
+        """
+        Loads frozen inference graph or imports graph and restores weights from checkpoint.
+        Session is kept open until close() is called
+        """
+        if self.__session is not None:
+            return
+
+        import tensorflow as tf
+        tf.logging.set_verbosity(tf.logging.INFO)
 
-        n_batch = self.batch_size
-        checkpoint_path = self.__checkpoint_path
         vocab = self.__vocab
 
         graph = tf.Graph()
-
-        labels = None
-
         with graph.as_default():
+            if self.__frozen_graph_path is not None:
+                graph_def = tf.GraphDef()
+                with tf.gfile.GFile(self.__frozen_graph_path, 'rb') as fp:
+                    graph_def.ParseFromString(fp.read())
+                tf.import_graph_def(graph_def, name='')
+
+                self.__frames = graph.get_tensor_by_name(vocab['frozen_x'])
+                self.__logits = graph.get_tensor_by_name(vocab['frozen_logits'])
+                session = tf.Session(graph=graph)
+            else:
+                saver = tf.train.import_meta_graph(self.__checkpoint_path + '.meta')
+
+                # Network of the training graph reads frames from the dataset iterator.
+                # Feed the iterator output directly, so dataset initializer, shuffle and repeat are never run
+                self.__frames = graph.get_tensor_by_name(vocab.get('next', 'ds/next:0'))
+                self.__logits = graph.get_tensor_by_name(vocab['logits'])
+                session = tf.Session(graph=graph)
+                saver.restore(session, self.__checkpoint_path)
+
+            self.__n_frame = int(self.__frames.shape[1])
+            # Probability of this target is returned, it is the last one if the model has no voice target
+            targets = vocab['targets']
+            self.__voice_index = targets.index('voice') if 'voice' in targets else len(targets) - 1
+
+        if self.__max_batch_delay > 0:
+            self.__batcher = DynamicBatcher(self.predict, self.batch_size, self.__max_batch_delay)
+
+        self.__graph = graph
+        self.__session = session
+
+    def close(self):
+        if self.__batcher is not None:
+            self.__batcher.close()
+        self.__batcher = None
+        if self.__session is not None:
+            self.__session.close()
+        self.__session = None
+        self.__graph = None
+
+    def predict(self, frames):
+        """
+        Runs a single batch of frames through the network
+        """
+        return self.__session.run(self.__logits, feed_dict = { self.__frames : frames })
+
+    def get_metrics(self):
+        return {
+            'batching': self.__batcher.get_metrics() if self.__batcher is not None else {},
+            'result_cache': self.__result_cache.get_stats() if self.__result_cache is not None else None
+        }
+
+    def __infer_frames(self, input):
+        """
+        Returns argmax labels and float16 probabilities of the voice target per frame
+        """
+        if self.__batcher is not None:
+            # Frames are batched together with frames of concurrent requests
+            output = self.__batcher.predict(input)
+            return np.argmax(output, axis=1).astype(np.int32), output[:, self.__voice_index].astype(np.float16)
+
+        labels = np.zeros((input.shape[0],), dtype=np.int32)
+        probabilities = np.zeros((input.shape[0],), dtype=np.float16)
+        n_total = input.shape[0]
+        for count in range(0, n_total, self.batch_size):
+            output = self.predict(input[count:count+self.batch_size])
+            probabilities[count:count+output.shape[0]] = output[:, self.__voice_index]
+            labels[count:count+output.shape[0]] = np.argmax(output, axis=1)
+        return labels, probabilities
+
+    def __infer(self, sound, deadline: Deadline=None):
+        self.load()
+        input = self.__audio_to_frames(sound, self.__n_frame)
+        if deadline is None:
+            labels, probabilities = self.__infer_frames(input)
+        else:
+            # Frames are labeled independently, so blocks of them give the same labels as all frames at once
+            labels = []
+            probabilities = []
+            n_block = self.batch_size * DEADLINE_CHECK_BATCHES
+            for start in range(0, input.shape[0], n_block):
+                deadline.check('inference of the next block of frames')
+                block_labels, block_probabilities = self.__infer_frames(input[start:start + n_block])
+                labels.append(block_labels)
+                probabilities.append(block_probabilities)
+            labels = np.concatenate(labels) if labels else np.zeros((0,), dtype=np.int32)
+            probabilities = np.concatenate(probabilities) if probabilities else np.zeros((0,), dtype=np.float16)
+
+        self.logger.info(f'VAD labels: {get_labels_summary(labels, self.frame_seconds)}')
+        return labels, probabilities
+
+    def __get_model_identity(self):
+        """
+        Hash of everything the result depends on besides audio: vocabulary (sample rate, targets, tensor names),
+        model files and parameters of resampling to the model sample rate
+        """
+        if self.__model_identity is None:
+            if self.__frozen_graph_path is not None:
+                model_files = [self.__frozen_graph_path]
+            else:
+                model_files = [self.__checkpoint_path + x for x in ['.data-00000-of-00001', '.index', '.meta']]
+            identity = [json.dumps(self.__vocab, sort_keys=True),
+                        str((resampler.ZERO_CROSSINGS, resampler.ROLLOFF, resampler.KAISER_BETA)),
+                        f'result_format:{ResultCache.FORMAT_VERSION}']
+            for path in model_files:
+                stat = os.stat(path)
+                identity.append(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime}')
+            self.__model_identity = hashlib.sha256('\n'.join(identity).encode('utf-8')).hexdigest()
+        return self.__model_identity
+
+    def __get_cache_key(self, kind, digest):
+        return hashlib.sha256(f'{self.__get_model_identity()}:{kind}:{digest}'.encode('utf-8')).hexdigest()
+
+    def __infer_cached(self, sound, deadline: Deadline=None):
+        """
+        Returns labels, probabilities and result cache key of the model input sound
+        """
+        if self.__result_cache is None:
+            return self.__infer(sound, deadline) + (None,)
+        audio_key = self.__get_cache_key('audio', get_array_digest(sound))
+        res = self.__result_cache.get(audio_key)
+        if res is not None:
+            self.logger.info('VAD result is taken from cache')
+            return res + (audio_key,)
+        labels, probabilities = self.__infer(sound, deadline)
+        self.__result_cache.put(audio_key, labels, probabilities)
+        return labels, probabilities, audio_key
+
+    def process(self, file, chunk_seconds=0, start_seconds=0, end_seconds=None, deadline: Deadline=None):
+        """
+        Runs VAD on the file. The file is decoded by ffmpeg at its own sample rate and converted to the model
+        sample rate by resample() in one step. By default the whole file is decoded at once.
+        If chunk_seconds is set the file is decoded and inferred chunk by chunk, so peak memory depends
+        on the chunk size only. Chunked labels and probabilities are the same as those of the whole file,
+        see VadStream, so are results of arrays and streams decoded in the same way by RequestAudio.
+        If start_seconds or end_seconds is set only this part of the file is decoded and labeled.
+        DeadlineExceeded is raised between blocks of decoding or inference, or between chunks,
+        if the deadline has passed
+        """
+        if deadline is None:
+            deadline = Deadline()
+        if not os.path.isfile(file):
+            self.logger.error(f'Skip: [{file}] not found]')
+            raise FileNotFoundError
 
-            saver = tf.train.import_meta_graph(checkpoint_path + '.meta')
-
-            x = graph.get_tensor_by_name(vocab['x'])
-            y = graph.get_tensor_by_name(vocab['y'])
-            init = graph.get_operation_by_name(vocab['init'])
-            logits = graph.get_tensor_by_name(vocab['logits'])
-            ph_n_shuffle = graph.get_tensor_by_name(vocab['n_shuffle'])
-            ph_n_repeat = graph.get_tensor_by_name(vocab['n_repeat'])
-            ph_n_batch = graph.get_tensor_by_name(vocab['n_batch'])
-            sr = vocab['sample_rate']
-
-            with tf.Session() as sess:
-                saver.restore(sess, checkpoint_path)
-                self.logger.debug('Start processing {}'.format(file))
-
-                sound, _ = self.__audio_from_file(file, sr=sr)
-                input = self.__audio_to_frames(sound, x.shape[1])
-                labels = np.zeros((input.shape[0],), dtype=np.int32)
-                sess.run(init, feed_dict = { x : input, y : labels, ph_n_shuffle : 1, ph_n_repeat : 1, ph_n_batch : n_batch })
-                count = 0
-                n_total = input.shape[0]
-                while True:
-                    try:
-                        output = sess.run(logits)
-                        labels[count:count+output.shape[0]] = np.argmax(output, axis=1)
-                        count += output.shape[0]
-                        print('{:.2f}%\r'.format(100 * (count/n_total)), end='', flush=True)
-                    except tf.errors.OutOfRangeError:
-                        break
-
-                # voiced_labels = [x for x in labels if x == 1]
-                self.logger.info(f'VAD labels are:')
-                self.logger.info(labels)
-                # self.logger.debug(f'Total labels len is: {len(labels)}')
-                # self.logger.debug(f'Voiced samples is: {len(voiced_labels)}')
-                # self.logger.debug(f'Other samples is: {len([x for x in labels if x == 0])}')
-
-                # noise = input[np.argwhere(labels==0),:].reshape(-1,1)
-                # speech = input[np.argwhere(labels==1),:].reshape(-1,1)
-                # self.__audio_to_file('/home/gpn/vadnet/res/out.speech.wav', speech, sr)
-                # self.__audio_to_file('/home/gpn/vadnet/res/out.noise.wav', noise, sr)
-
-                sess.close()
-
-        # Save inference result to pickle file.
-        # Don't return results directly, because this is executed in subprocess
-        with open('vad_response.pickle', 'wb') as res_file_handle:
-            pickle.dump(labels, res_file_handle)
\ No newline at end of file
+        self.logger.debug('Start processing {}'.format(file))
+        whole_file = start_seconds == 0 and end_seconds is None
+        # Bytes of the file are hashed much faster than the file is decoded, so the cache is checked by them first.
+        # Parts of files are not cached
+        file_key = None
+        if self.__result_cache is not None and whole_file:
+            file_key = self.__get_cache_key('file', get_file_digest(file))
+            res = self.__result_cache.get(file_key)
+            if res is not None:
+                self.logger.info(f'VAD result of {file} is taken from cache')
+                return res
+
+        sr = self.__vocab['sample_rate']
+        if not chunk_seconds and whole_file:
+            sound, _ = self.__audio_from_file(file, sr=sr, deadline=deadline)
+            if file_key is None:
+                return self.__infer(sound, deadline)
+            labels, probabilities, audio_key = self.__infer_cached(sound, deadline)
+            self.__result_cache.put_alias(file_key, audio_key)
+            return labels, probabilities
+
+        # Decoding starts a bit before the position: decoder state after seeking (e.g. MP3 bit reservoir) and
+        # resampling filter need some preceding samples, they are dropped after conversion to the model sample rate
+        margin_seconds = min(start_seconds, SEEK_MARGIN_SECONDS)
+        n_skip = int(round(margin_seconds * sr))
+        decode_start_seconds = start_seconds - margin_seconds
+        decode_duration_seconds = end_seconds - decode_start_seconds if end_seconds is not None else None
+
+        if not chunk_seconds:
+            # Part of the file, it is never cached
+            sound, _ = self.__audio_from_file(file, sr=sr, start_seconds=decode_start_seconds,
+                                              duration_seconds=decode_duration_seconds, deadline=deadline)
+            return self.__infer(sound[n_skip:], deadline)
+
+        self.load()
+        self.logger.debug(f'Try stream data from file: path={file}, chunk={chunk_seconds}s')
+        labels = []
+        probabilities = []
+        with AudioDecoder(file, start_seconds=decode_start_seconds, duration_seconds=decode_duration_seconds) as decoder:
+            stream = self.open_stream(decoder.sample_rate, n_skip)
+            for chunk in decoder.chunks(max(self.__n_frame, int(chunk_seconds * sr))):
+                deadline.check('inference of the next chunk')
+                chunk_labels, chunk_probabilities = stream.process(chunk)
+                labels.append(chunk_labels)
+                probabilities.append(chunk_probabilities)
+        chunk_labels, chunk_probabilities = stream.flush()
+        labels = np.concatenate(labels + [chunk_labels])
+        probabilities = np.concatenate(probabilities + [chunk_probabilities])
+        if file_key is not None:
+            # Audio is hashed while it is streamed, so the result can only be stored here
+            audio_key = self.__get_cache_key('audio', stream.digest)
+            self.__result_cache.put(audio_key, labels, probabilities)
+            self.__result_cache.put_alias(file_key, audio_key)
+
+        self.logger.info(f'VAD labels: {get_labels_summary(labels, self.frame_seconds)}')
+        return labels, probabilities
+
+    def open_stream(self, sample_rate, n_skip=0):
+        """
+        Returns VadStream which labels audio of sample_rate coming chunk by chunk.
+        First n_skip samples at the model sample rate are dropped
+        """
+        self.load()
+        return VadStream(ResampleStream(sample_rate, self.__vocab['sample_rate']), self.__n_frame, self.batch_size,
+                         self.__infer_frames, self.__audio_to_frames, n_skip)
+
+    def process_array(self, sound, sample_rate, deadline: Deadline=None):
+        """
+        Runs VAD on float32 or int16 audio. DeadlineExceeded is raised before resampling or between blocks
+        of inference if the deadline has passed
+        """
+        if deadline is None:
+            deadline = Deadline()
+        sr = self.__vocab['sample_rate']
+        deadline.check('resampling')
+        if sound.dtype == np.int16:
+            sound = sound.astype(np.float32) / 32768
+        sound = np.asarray(sound, dtype=np.float32).reshape(-1)
+        sound = resample(sound, sample_rate, sr)
+        labels, probabilities, _ = self.__infer_cached(sound, deadline)
+        return labels, probabilities
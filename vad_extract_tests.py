@@ -0,0 +1,191 @@
+import io
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from audio_decoder import AudioDecoder
+from deadline import Deadline, DeadlineExceeded
+from resampler import ResampleStream, resample
+from vad_extract import CNNNetVadExecutor, run_jobs
+from vad_stream import VadStream
+
+
+MODEL_SAMPLE_RATE = 48000
+N_FRAME = 480
+BATCH_SIZE = 4
+# Sample rates of array jobs which make the fake worker fail
+DIE_ONCE_SAMPLE_RATE = 1
+DIE_SAMPLE_RATE = 2
+ERROR_SAMPLE_RATE = 3
+
+
+def audio_to_frames(x, n_frame):
+    n_frames = x.shape[0] // n_frame
+    return x[0:n_frames * n_frame].reshape(n_frames, n_frame)
+
+
+def infer_frames(frames):
+    labels = []
+    probabilities = []
+    for start in range(0, frames.shape[0], BATCH_SIZE):
+        batch = frames[start:start + BATCH_SIZE]
+        output = batch.mean(axis=1) + batch.mean() / 16
+        labels.append((output > 0).astype(np.int32))
+        probabilities.append(output.astype(np.float16))
+    if not labels:
+        return np.zeros((0,), dtype=np.int32), np.zeros((0,), dtype=np.float16)
+    return np.concatenate(labels), np.concatenate(probabilities)
+
+
+class FakeVadNet:
+    """CNNNetVAD with the network replaced by infer_frames(), it runs in the worker process"""
+
+    sample_rate = MODEL_SAMPLE_RATE
+    frame_seconds = N_FRAME / MODEL_SAMPLE_RATE
+
+    def __init__(self, state_dir):
+        self.__state_dir = state_dir
+
+    def get_metrics(self):
+        return {'worker_pid': os.getpid()}
+
+    def open_stream(self, sample_rate):
+        return VadStream(ResampleStream(sample_rate, MODEL_SAMPLE_RATE), N_FRAME, BATCH_SIZE, infer_frames,
+                         audio_to_frames)
+
+    def process_array(self, sound, sample_rate, deadline: Deadline):
+        if sample_rate == DIE_ONCE_SAMPLE_RATE:
+            marker_path = os.path.join(self.__state_dir, 'died')
+            if not os.path.exists(marker_path):
+                open(marker_path, 'w').close()
+                os._exit(1)
+            sample_rate = MODEL_SAMPLE_RATE
+        if sample_rate == DIE_SAMPLE_RATE:
+            os._exit(1)
+        if sample_rate == ERROR_SAMPLE_RATE:
+            raise ValueError('broken audio')
+        deadline.check('inference')
+        if sound.dtype == np.int16:
+            sound = sound.astype(np.float32) / 32768
+        sound = resample(np.asarray(sound, dtype=np.float32).reshape(-1), sample_rate, MODEL_SAMPLE_RATE)
+        return infer_frames(audio_to_frames(sound, N_FRAME))
+
+    def close(self):
+        pass
+
+
+def serve_fake(connection, cnn_batch_size, vad_model_path, chunk_seconds=0, max_batch_delay=0, n_threads=1,
+               result_cache_dir=None, result_cache_max_bytes=0):
+    run_jobs(connection, FakeVadNet(vad_model_path), chunk_seconds, n_threads)
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    # GPU is checked before the worker starts, there is no GPU here
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    nvidia_smi = bin_dir / 'nvidia-smi'
+    nvidia_smi.write_text('#!/bin/sh\n')
+    nvidia_smi.chmod(0o755)
+    monkeypatch.setenv('PATH', f'{bin_dir}{os.pathsep}{os.environ["PATH"]}')
+
+    res = CNNNetVadExecutor(BATCH_SIZE, str(tmp_path), n_worker_threads=2, worker_target=serve_fake)
+    yield res
+    res.close()
+
+
+def get_worker_pid(executor):
+    # Worker is started on first use
+    executor.get_model_sample_rate()
+    return executor.get_stats()['worker_pid']
+
+
+def get_audio(n_samples, seed=0):
+    return np.random.RandomState(seed).uniform(-1, 1, n_samples).astype(np.float32)
+
+
+def test_worker_is_started_once_and_reports_model_parameters(executor):
+    assert executor.get_model_sample_rate() == MODEL_SAMPLE_RATE
+    assert executor.get_frame_seconds() == N_FRAME / MODEL_SAMPLE_RATE
+    x = get_audio(10 * N_FRAME)
+    labels, probabilities = executor.extract_voice_from_array(x, MODEL_SAMPLE_RATE, with_probabilities=True)
+    expected_labels, expected_probabilities = infer_frames(audio_to_frames(x, N_FRAME))
+    assert np.array_equal(labels, expected_labels)
+    assert np.array_equal(probabilities, expected_probabilities)
+
+    pid = get_worker_pid(executor)
+    executor.extract_voice_from_array(x, MODEL_SAMPLE_RATE)
+    stats = executor.get_stats()
+    assert stats['worker_pid'] == pid
+    assert stats['jobs'] == 2
+    assert stats['restarts'] == 0
+    assert stats['cold_start_seconds'] is not None
+
+
+def test_job_is_repeated_once_in_a_restarted_worker(executor):
+    pid = get_worker_pid(executor)
+    x = get_audio(4 * N_FRAME)
+    labels = executor.extract_voice_from_array(x, DIE_ONCE_SAMPLE_RATE)
+    assert np.array_equal(labels, infer_frames(audio_to_frames(x, N_FRAME))[0])
+    stats = executor.get_stats()
+    assert stats['restarts'] == 1
+    assert stats['worker_pid'] != pid
+
+
+def test_job_which_kills_the_worker_twice_fails(executor):
+    with pytest.raises(RuntimeError):
+        executor.extract_voice_from_array(get_audio(N_FRAME), DIE_SAMPLE_RATE)
+    # Next job gets a new worker
+    assert executor.extract_voice_from_array(get_audio(N_FRAME), MODEL_SAMPLE_RATE).shape[0] == 1
+
+
+def test_error_and_expiration_of_a_job_keep_the_worker(executor):
+    pid = get_worker_pid(executor)
+    with pytest.raises(RuntimeError, match='broken audio'):
+        executor.extract_voice_from_array(get_audio(N_FRAME), ERROR_SAMPLE_RATE)
+    with pytest.raises(DeadlineExceeded):
+        executor.extract_voice_from_array(get_audio(N_FRAME), MODEL_SAMPLE_RATE, deadline=Deadline(1))
+    stats = executor.get_stats()
+    assert stats['worker_pid'] == pid
+    assert stats['restarts'] == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 4410, 44100, 100000])
+def test_streamed_labels_are_equal_to_labels_of_the_whole_array(executor, chunk_size):
+    x = get_audio(3 * 44100 + 17)
+    labels, probabilities = executor.extract_voice_from_array(x, 44100, with_probabilities=True)
+    streamed = []
+    chunks = (x[i:i + chunk_size] for i in range(0, x.shape[0], chunk_size))
+    stream_labels, stream_probabilities = executor.extract_voice_from_stream(chunks, 44100, with_probabilities=True,
+                                                                             on_labels=streamed.append)
+    assert np.array_equal(stream_labels, labels)
+    assert np.array_equal(stream_probabilities, probabilities)
+    assert np.array_equal(np.concatenate(streamed), labels)
+
+
+def test_decoded_download_is_labeled_while_it_comes(executor):
+    x = (get_audio(2 * 22050) * 32767).astype(np.int16)
+    body = io.BytesIO()
+    with wave.open(body, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes(x.tobytes())
+    data = body.getvalue()
+    body_chunks = (data[i:i + 4096] for i in range(0, len(data), 4096))
+    with AudioDecoder(body_chunks) as decoder:
+        labels = executor.extract_voice_from_stream(decoder.chunks(5000), decoder.sample_rate)
+    with AudioDecoder(data) as decoder:
+        expected = executor.extract_voice_from_array(decoder.read_all(), decoder.sample_rate)
+    assert labels.shape[0] > 0
+    assert np.array_equal(labels, expected)
+
+
+def test_stream_stops_when_deadline_passes(executor):
+    deadline = Deadline(1)
+    with pytest.raises(DeadlineExceeded):
+        executor.extract_voice_from_stream(iter([get_audio(N_FRAME)]), MODEL_SAMPLE_RATE, deadline=deadline)
+    # Stream is released and the worker keeps working
+    assert executor.extract_voice_from_array(get_audio(N_FRAME), MODEL_SAMPLE_RATE).shape[0] == 1
@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+
+
+# Windows of transactions are searched in these margins around their timestamps, see windows_extractor
+DEFAULT_LEFT_MARGIN_SECONDS = 300
+DEFAULT_RIGHT_MARGIN_SECONDS = 100
+
+
+def get_regions(req_obj):
+    """
+    Returns [(start_seconds, end_seconds), ...] to label from the request, None if the whole file is labeled.
+    Regions are given directly by 'Regions': [{'StartSeconds', 'EndSeconds'}, ...] or are built around
+    'TransactionTimestamps' with 'TransactionLeftMarginSeconds' and 'TransactionRightMarginSeconds'
+    """
+    if req_obj.get('Regions') is not None:
+        return [(float(x['StartSeconds']), float(x['EndSeconds'])) for x in req_obj['Regions']]
+    if req_obj.get('TransactionTimestamps') is not None:
+        left_margin = req_obj.get('TransactionLeftMarginSeconds', DEFAULT_LEFT_MARGIN_SECONDS)
+        right_margin = req_obj.get('TransactionRightMarginSeconds', DEFAULT_RIGHT_MARGIN_SECONDS)
+        return [(float(x) - left_margin, float(x) + right_margin) for x in req_obj['TransactionTimestamps']]
+    return None
+
+
+def merge_regions(regions, frame_seconds=1):
+    """
+    Aligns regions to the frame grid and merges overlapping and adjacent ones.
+    Returns sorted [(start_frame, end_frame), ...], ends are exclusive
+    """
+    res = []
+    for start, end in sorted(regions):
+        # Region is extended to whole frames, so every requested second is labeled
+        start_frame = max(int(math.floor(start / frame_seconds)), 0)
+        end_frame = int(math.ceil(end / frame_seconds))
+        if end_frame <= start_frame:
+            continue
+        if res and start_frame <= res[-1][1]:
+            res[-1] = (res[-1][0], max(res[-1][1], end_frame))
+        else:
+            res.append((start_frame, end_frame))
+    return res
+
+
+def label_regions(regions, label_region, frame_seconds=1):
+    """
+    Labels only the frames of merged regions with label_region(start_seconds, end_seconds) -> (labels, probabilities).
+    Returns (labels, probabilities) of the whole timeline up to the end of the last labeled frame,
+    frames outside the regions are unvoiced with zero probability. Region is shorter than requested
+    if the audio ends inside it
+    """
+    labeled = []
+    n_labels = 0
+    for start_frame, end_frame in regions:
+        labels, probabilities = label_region(start_frame * frame_seconds, end_frame * frame_seconds)
+        n = min(labels.shape[0], end_frame - start_frame)
+        if n == 0:
+            # Audio ends before the region
+            break
+        labeled.append((start_frame, labels[:n], probabilities[:n]))
+        n_labels = start_frame + n
+
+    res_labels = np.zeros((n_labels,), dtype=np.int32)
+    res_probabilities = np.zeros((n_labels,), dtype=np.float16)
+    for start_frame, labels, probabilities in labeled:
+        res_labels[start_frame:start_frame + labels.shape[0]] = labels
+        res_probabilities[start_frame:start_frame + probabilities.shape[0]] = probabilities
+    return res_labels, res_probabilities
+
+
+if __name__ == '__main__':
+    # Day of audio with 5 transactions, only the margins around them are labeled
+    regions = merge_regions(get_regions({'TransactionTimestamps': [3600, 3700, 20000, 40000, 80000]}))
+    n_labeled = sum(end - start for start, end in regions)
+    print(f'{n_labeled}s of 86400s are labeled in {len(regions)} regions')
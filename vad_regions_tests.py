@@ -0,0 +1,39 @@
+import numpy as np
+
+from vad_regions import get_regions, label_regions, merge_regions
+
+
+def test_regions_of_request():
+    assert get_regions({}) is None
+    assert get_regions({'Regions': [{'StartSeconds': 1, 'EndSeconds': 2.5}]}) == [(1, 2.5)]
+    assert get_regions({'TransactionTimestamps': [1000], 'TransactionRightMarginSeconds': 50}) == [(700, 1050)]
+
+
+def test_regions_are_aligned_to_frames_and_merged():
+    assert merge_regions([(10, 20), (-5, 3.5), (19.2, 25), (25, 30), (40, 40)]) == [(0, 4), (10, 30)]
+    assert merge_regions([(1, 2.5)], frame_seconds=2) == [(0, 2)]
+
+
+def get_audio_labeler(audio, calls):
+    def label_audio(start, end):
+        calls.append((start, end))
+        return audio[start:end], audio[start:end].astype(np.float16)
+    return label_audio
+
+
+def test_only_regions_are_labeled():
+    audio = np.random.RandomState(0).randint(0, 2, 100).astype(np.int32)
+    calls = []
+    labels, probabilities = label_regions(merge_regions([(10, 20), (15, 30), (90, 120), (200, 300)]),
+                                          get_audio_labeler(audio, calls))
+    assert calls == [(10, 30), (90, 120), (200, 300)]
+    # Audio ends inside the second region
+    assert labels.shape[0] == 100
+    assert np.array_equal(labels[10:30], audio[10:30]) and np.array_equal(labels[90:], audio[90:])
+    assert not labels[:10].any() and not labels[30:90].any()
+    assert np.array_equal(probabilities, labels.astype(np.float16))
+
+
+def test_no_regions():
+    labels, probabilities = label_regions([], get_audio_labeler(np.ones((10,), dtype=np.int32), []))
+    assert labels.shape[0] == 0 and probabilities.shape[0] == 0
@@ -0,0 +1,57 @@
+import hashlib
+
+import numpy as np
+
+from resampler import ResampleStream
+
+
+class VadStream:
+    """
+    Labels audio which comes chunk by chunk. Samples of the last incomplete batch of frames are carried over
+    to the next chunk, so frames are inferred in the same batches as frames of the whole audio at once and
+    labels and probabilities don't depend on chunking, see ResampleStream.
+    infer_frames(frames) returns labels and probabilities of frames, audio_to_frames(x, n_frame) splits
+    samples into frames
+    """
+    def __init__(self, resampler: ResampleStream, n_frame, batch_size, infer_frames, audio_to_frames, n_skip=0):
+        self.__resampler = resampler
+        self.__n_frame = n_frame
+        self.__n_batch = n_frame * batch_size
+        self.__n_skip = n_skip
+        self.__infer_frames = infer_frames
+        self.__audio_to_frames = audio_to_frames
+        self.__carry = np.zeros((0,), dtype=np.float32)
+        self.__hash = hashlib.sha256()
+
+    def process(self, chunk):
+        """
+        Returns labels and probabilities of the batches of frames completed by the chunk
+        """
+        if chunk.dtype == np.int16:
+            chunk = chunk.astype(np.float32) / 32768
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        return self.__infer(self.__resampler.process(chunk), self.__n_batch)
+
+    def flush(self):
+        """
+        Returns labels and probabilities of the rest. Tail shorter than a frame is dropped
+        """
+        return self.__infer(self.__resampler.flush(), self.__n_frame)
+
+    @property
+    def digest(self):
+        """Hash of the model input passed through the stream so far"""
+        return self.__hash.hexdigest()
+
+    def __infer(self, chunk, n_unit):
+        if self.__n_skip > 0:
+            n_skip = min(self.__n_skip, chunk.shape[0])
+            chunk = chunk[n_skip:]
+            self.__n_skip -= n_skip
+        self.__hash.update(np.ascontiguousarray(chunk).data)
+        sound = np.concatenate([self.__carry, chunk])
+        n_keep = sound.shape[0] // n_unit * n_unit
+        self.__carry = sound[n_keep:]
+        if n_keep == 0:
+            return np.zeros((0,), dtype=np.int32), np.zeros((0,), dtype=np.float16)
+        return self.__infer_frames(self.__audio_to_frames(sound[0:n_keep], self.__n_frame))
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from resampler import ResampleStream, resample
+from result_cache import get_array_digest
+from vad_stream import VadStream
+
+
+N_FRAME = 480
+BATCH_SIZE = 4
+
+
+def audio_to_frames(x, n_frame):
+    n_frames = x.shape[0] // n_frame
+    return x[0:n_frames * n_frame].reshape(n_frames, n_frame)
+
+
+def infer_frames(frames):
+    """Output of a frame depends on the other frames of its batch, as it may with a real network"""
+    labels = []
+    probabilities = []
+    for start in range(0, frames.shape[0], BATCH_SIZE):
+        batch = frames[start:start + BATCH_SIZE]
+        output = batch.mean(axis=1) + batch.mean() / 16
+        labels.append((output > 0).astype(np.int32))
+        probabilities.append(output.astype(np.float16))
+    return np.concatenate(labels), np.concatenate(probabilities)
+
+
+def get_whole(x, src_rate, dst_rate, n_skip=0):
+    sound = resample(x, src_rate, dst_rate)[n_skip:]
+    return infer_frames(audio_to_frames(sound, N_FRAME)), get_array_digest(sound)
+
+
+def get_streamed(x, src_rate, dst_rate, chunk_sizes, n_skip=0):
+    stream = VadStream(ResampleStream(src_rate, dst_rate), N_FRAME, BATCH_SIZE, infer_frames, audio_to_frames, n_skip)
+    results = []
+    start = 0
+    for size in chunk_sizes:
+        results.append(stream.process(x[start:start + size]))
+        start += size
+    results.append(stream.process(x[start:]))
+    results.append(stream.flush())
+    labels = np.concatenate([x for x, _ in results])
+    probabilities = np.concatenate([x for _, x in results])
+    return (labels, probabilities), stream.digest
+
+
+@pytest.mark.parametrize('src_rate', [44100, 48000, 8000])
+@pytest.mark.parametrize('chunk_size', [1, 479, 480, 1000, 1921, 65536, 100000])
+def test_chunked_labels_are_equal_to_whole_audio_ones(src_rate, chunk_size):
+    x = np.random.RandomState(0).uniform(-1, 1, 3 * src_rate + 123).astype(np.float32)
+    if chunk_size == 1:
+        chunk_sizes = [1] * 5000
+    else:
+        chunk_sizes = [chunk_size] * (x.shape[0] // chunk_size)
+    (whole_labels, whole_probabilities), whole_digest = get_whole(x, src_rate, 48000)
+    (labels, probabilities), digest = get_streamed(x, src_rate, 48000, chunk_sizes)
+    assert np.array_equal(labels, whole_labels)
+    assert np.array_equal(probabilities, whole_probabilities)
+    assert digest == whole_digest
+
+
+def test_random_chunks_and_skipped_samples():
+    random = np.random.RandomState(1)
+    x = random.uniform(-1, 1, 200000).astype(np.float32)
+    (whole_labels, whole_probabilities), whole_digest = get_whole(x, 44100, 48000, n_skip=1000)
+    for _ in range(5):
+        chunk_sizes = random.randint(0, 30000, 10)
+        (labels, probabilities), digest = get_streamed(x, 44100, 48000, chunk_sizes, n_skip=1000)
+        assert np.array_equal(labels, whole_labels)
+        assert np.array_equal(probabilities, whole_probabilities)
+        assert digest == whole_digest
+
+
+def test_only_complete_batches_are_inferred_before_flush():
+    stream = VadStream(ResampleStream(48000, 48000), N_FRAME, BATCH_SIZE, infer_frames, audio_to_frames)
+    labels, _ = stream.process(np.zeros((N_FRAME * BATCH_SIZE - 1,), dtype=np.float32))
+    assert labels.shape[0] == 0
+    labels, _ = stream.process(np.zeros((N_FRAME + 1,), dtype=np.float32))
+    assert labels.shape[0] == BATCH_SIZE
+    labels, _ = stream.flush()
+    # Tail shorter than a frame is dropped
+    assert labels.shape[0] == 1
+
+
+def test_int16_chunks_are_scaled():
+    x = (np.random.RandomState(2).uniform(-1, 1, 10000) * 32767).astype(np.int16)
+    (labels, probabilities), _ = get_streamed(x, 48000, 48000, [3333, 3333])
+    (whole_labels, whole_probabilities), _ = get_whole(x.astype(np.float32) / 32768, 48000, 48000)
+    assert np.array_equal(labels, whole_labels)
+    assert np.array_equal(probabilities, whole_probabilities)
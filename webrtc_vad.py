@@ -1,19 +1,9 @@
 import collections
-import contextlib
-import wave
 import os
 
-from pydub import AudioSegment
 import webrtcvad
 
-
-class Frame(object):
-    """Represents a "frame" of audio data."""
-
-    def __init__(self, bytes, timestamp, duration):
-        self.bytes = bytes
-        self.timestamp = timestamp
-        self.duration = duration
+from request_audio import RequestAudio
 
 
 class WebrtcvadWrapper:
@@ -28,139 +18,105 @@ class WebrtcvadWrapper:
     def __get_vad_available_sample_rates():
         return [8000, 16000, 32000, 48000]
 
-    def read_wave(self, path):
-        """Reads a .wav file.
-        Takes the path, and returns (PCM audio data, sample rate).
+    def get_vad_sample_rate(self, sample_rate):
+        """
+        Source sample rate is kept if webrtcvad supports it, otherwise audio is converted to the maximal supported rate
         """
-        with contextlib.closing(wave.open(path, 'rb')) as wf:
-            num_channels = wf.getnchannels()
-            assert num_channels == 1
-            sample_width = wf.getsampwidth()
-            assert sample_width == 2
-            sample_rate = wf.getframerate()
-            assert sample_rate in self.__get_vad_available_sample_rates()
-            pcm_data = wf.readframes(wf.getnframes())
-            return pcm_data, sample_rate
+        if sample_rate in self.__get_vad_available_sample_rates():
+            return sample_rate
+        # Set maximal available sample rate to avoid lost of quality
+        # In most cases in audio will be in 44100
+        return self.__get_vad_available_sample_rates()[-1]
+
+    def __get_frame_bytes(self, sample_rate):
+        # Frame is 16 bit mono PCM
+        return int(sample_rate * (self.__frame_duration_ms / 1000.0) * 2)
 
     def frame_generator(self, audio, sample_rate):
         """Generates audio frames from PCM audio data.
-        Takes the desired frame duration in milliseconds, the PCM data, and
-        the sample rate.
-        Yields Frames of the requested duration.
+        Takes the PCM data as bytes or int16 array and the sample rate.
+        Yields memoryview slices of the frame duration, audio is not copied.
+        Incomplete frame at the end and a frame which ends exactly at the end of audio are dropped.
         """
-        n = int(sample_rate * (self.__frame_duration_ms / 1000.0) * 2)
+        audio = memoryview(audio).cast('B')
+        n = self.__get_frame_bytes(sample_rate)
         offset = 0
-        timestamp = 0.0
-        duration = (float(n) / sample_rate) / 2.0
         while offset + n < len(audio):
-            yield Frame(audio[offset:offset + n], timestamp, duration)
-            timestamp += duration
+            yield audio[offset:offset + n]
             offset += n
 
-    def vad_collector(self, sample_rate, vad, frames):
+    def vad_collector(self, sample_rate, vad, audio):
         """Filters out non-voiced audio frames.
-        Given a webrtcvad.Vad and a source of audio frames, yields only
-        the voiced audio.
+        Given a webrtcvad.Vad and PCM audio data, yields [start, end] seconds of voiced parts.
         Uses a padded, sliding window algorithm over the audio frames.
         When more than 90% of the frames in the window are voiced (as
-        reported by the VAD), the collector triggers and begins yielding
-        audio frames. Then the collector waits until 90% of the frames in
-        the window are unvoiced to detrigger.
-        The window is padded at the front and back to provide a small
-        amount of silence or the beginnings/endings of speech around the
-        voiced frames.
+        reported by the VAD), the collector triggers and a segment starts
+        at the first frame of the window. Then the collector waits until 90% of the frames in
+        the window are unvoiced to detrigger, segment ends at the end of the current frame.
+        Only voice flags of the window are kept, counts of voiced frames are updated as the window slides,
+        so time and memory per frame don't depend on the window size.
+        Timestamps are frame index multiplied by frame duration.
         Arguments:
         sample_rate - The audio sample rate, in Hz.
-        frame_duration_ms - The frame duration in milliseconds.
-        padding_duration_ms - The amount to pad the window, in milliseconds.
         vad - An instance of webrtcvad.Vad.
-        frames - a source of audio frames (sequence or generator).
-        Returns: A generator that yields PCM audio data.
+        audio - PCM audio data, bytes or int16 array.
+        Returns: A generator that yields [start, end] seconds.
         """
         num_padding_frames = int(self.__padding_duration_ms / self.__frame_duration_ms)
-        # We use a deque for our sliding window/ring buffer.
+        threshold = self.__share_voiced_samples_in_ring_buffer * num_padding_frames
+        frame_duration = (float(self.__get_frame_bytes(sample_rate)) / sample_rate) / 2.0
+        # Voice flags of the sliding window and count of voiced ones among them
         ring_buffer = collections.deque(maxlen=num_padding_frames)
+        num_voiced = 0
         # We have two states: TRIGGERED and NOTTRIGGERED. We start in the
         # NOTTRIGGERED state.
         triggered = False
+        start_index = 0
 
-        voiced_frames = []
-        for frame in frames:
-            is_speech = vad.is_speech(frame.bytes, sample_rate)
+        i = -1
+        for i, frame in enumerate(self.frame_generator(audio, sample_rate)):
+            is_speech = vad.is_speech(frame, sample_rate)
+            if num_padding_frames > 0:
+                if len(ring_buffer) == num_padding_frames:
+                    num_voiced -= ring_buffer[0]
+                ring_buffer.append(is_speech)
+                num_voiced += is_speech
 
-            # sys.stdout.write('1' if is_speech else '0')
             if not triggered:
-                ring_buffer.append((frame, is_speech))
-                num_voiced = len([f for f, speech in ring_buffer if speech])
                 # If we're NOTTRIGGERED and more than 90% of the frames in
                 # the ring buffer are voiced frames, then enter the
-                # TRIGGERED state.
-                if num_voiced > self.__share_voiced_samples_in_ring_buffer * ring_buffer.maxlen:
+                # TRIGGERED state. Segment starts with the frames of the window
+                if num_voiced > threshold:
                     triggered = True
-                    # sys.stdout.write('%s' % round(float(ring_buffer[0][0].timestamp, ), 2))
-                    # We want to yield all the audio we see from now until
-                    # we are NOTTRIGGERED, but we have to start with the
-                    # audio that's already in the ring buffer.
-                    for f, s in ring_buffer:
-                        voiced_frames.append(f)
+                    start_index = i - len(ring_buffer) + 1
                     ring_buffer.clear()
+                    num_voiced = 0
             else:
-                # We're in the TRIGGERED state, so collect the audio data
-                # and add it to the ring buffer.
-                voiced_frames.append(frame)
-                ring_buffer.append((frame, is_speech))
-                num_unvoiced = len([f for f, speech in ring_buffer if not speech])
                 # If more than 90% of the frames in the ring buffer are
-                # unvoiced, then enter NOTTRIGGERED and yield whatever
-                # audio we've collected.
-                if num_unvoiced > self.__share_voiced_samples_in_ring_buffer * ring_buffer.maxlen:
+                # unvoiced, then enter NOTTRIGGERED and yield the segment
+                # up to the end of the current frame.
+                if len(ring_buffer) - num_voiced > threshold:
                     triggered = False
-                    pure_stamps = [f.timestamp for f in voiced_frames]
-                    yield [pure_stamps[0], pure_stamps[-1] + frame.duration]
-
+                    yield [start_index * frame_duration, i * frame_duration + frame_duration]
                     ring_buffer.clear()
-                    voiced_frames = []
+                    num_voiced = 0
         # If we have any leftover voiced audio when we run out of input,
         # yield it.
-        if voiced_frames:
-            pure_stamps = [f.timestamp for f in voiced_frames]
-            yield [pure_stamps[0], pure_stamps[-1] + frame.duration]
+        if triggered:
+            yield [start_index * frame_duration, i * frame_duration + frame_duration]
 
-    def prepare_audio(self, audio_file_path: str):
-        """
-        Create new file (if not wav), delete .mp3 and setting format, frame rate, channels parameters, sample width
-        """
-        in_file_name = audio_file_path.replace('\\', '/').split('/')[-1]
-        in_file_ext = in_file_name.split('.')[-1]
-        target_audio_path = audio_file_path
-        audio_obj = AudioSegment.from_file(audio_file_path)
-        need_export = False
-
-        if in_file_ext != 'wav':
-            need_export = True
-        if audio_obj.frame_rate not in self.__get_vad_available_sample_rates():
-            # Set maximal available sample rate to avoid lost of quality
-            # In most cases in audio will be in 44100
-            audio_obj = audio_obj.set_frame_rate(self.__get_vad_available_sample_rates()[-1])
-            need_export = True
-
-        if need_export:
-            target_audio_path = audio_file_path.replace(in_file_name, in_file_name.replace(in_file_ext, 'wav'))
-            audio_obj.export(target_audio_path, format='wav')
-            audio_file_path = target_audio_path
-
-        return target_audio_path
+    def get_vad_segments_from_pcm(self, audio, sample_rate):
+        vad = webrtcvad.Vad(self.__aggressiveness)
+        return list(self.vad_collector(sample_rate, vad, audio))
+
+    def get_vad_segments_from_audio(self, audio: RequestAudio):
+        sample_rate = self.get_vad_sample_rate(audio.sample_rate)
+        return self.get_vad_segments_from_pcm(audio.get_pcm_data(sample_rate), sample_rate)
 
     def get_vad_segments(self, audio_file_path: str):
         assert os.path.isfile(audio_file_path)
-        prepared_file_path = self.prepare_audio(audio_file_path)
-        audio, sample_rate = self.read_wave(prepared_file_path)
-
-        vad = webrtcvad.Vad(self.__aggressiveness)
-        frames = self.frame_generator(audio, sample_rate)
-        frames = list(frames)
-        segments = self.vad_collector(sample_rate, vad, frames)
-        return list(segments)
+        with RequestAudio(audio_file_path) as audio:
+            return self.get_vad_segments_from_audio(audio)
 
 
 class VadSegmentsAdjuster:
@@ -0,0 +1,46 @@
+import pytest
+
+from webrtc_vad import WebrtcvadWrapper
+
+
+SAMPLE_RATE = 8000
+# 30ms of 16 bit audio at 8kHz
+FRAME_BYTES = 480
+
+
+class _FakeVad:
+    """Frame is voiced if its first byte is 1"""
+
+    def is_speech(self, frame, sample_rate):
+        assert len(frame) == FRAME_BYTES
+        return frame[0] == 1
+
+
+def get_audio(flags, n_extra_bytes=0):
+    return b''.join(bytes([x]) * FRAME_BYTES for x in flags) + b'\0' * n_extra_bytes
+
+
+def get_segments(audio):
+    # Window is 3 frames, more than 1.5 voiced frames trigger a segment, more than 1.5 unvoiced ones end it
+    wrapper = WebrtcvadWrapper(share_voiced_samples_in_ring_buffer=0.5, frame_duration_ms=30,
+                               padding_duration_ms=90, aggressiveness=3)
+    return list(wrapper.vad_collector(SAMPLE_RATE, _FakeVad(), audio))
+
+
+def test_segment_starts_with_window_and_ends_with_current_frame():
+    segments = get_segments(get_audio([0, 1, 1, 1, 0, 0, 0, 0], n_extra_bytes=1))
+    assert segments == [pytest.approx([0, 0.18])]
+
+
+def test_frame_which_ends_exactly_at_the_end_of_audio_is_dropped():
+    flags = [0, 1, 1, 1, 0, 0, 0, 1, 1]
+    # Last frame completes the second trigger only if it is followed by at least one more byte
+    assert get_segments(get_audio(flags)) == [pytest.approx([0, 0.18])]
+    assert get_segments(get_audio(flags, n_extra_bytes=1)) == [pytest.approx([0, 0.18]), pytest.approx([0.18, 0.27])]
+
+
+def test_isolated_voiced_frames_are_ignored():
+    # Voiced frames 0 and 3 are never 2 of 3 in the window, frames 3 and 5 are
+    assert get_segments(get_audio([1, 0, 0, 1, 0, 1, 0, 0], n_extra_bytes=1)) == [pytest.approx([0.09, 0.24])]
+    assert get_segments(get_audio([1, 0, 0, 1, 0, 0, 1, 0], n_extra_bytes=1)) == []
+    assert get_segments(b'') == []